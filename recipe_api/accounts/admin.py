@@ -1,4 +1,82 @@
-from django.contrib import admin
-from.models import CustomUser
+from django.contrib import admin, messages
+from django.contrib.auth.admin import UserAdmin
 
-admin.site.register(CustomUser)
+from recipe_api.admin import EfficientChangeListMixin
+
+from .models import AccountDeletionJob, CustomUser
+
+
+@admin.register(CustomUser)
+class CustomUserAdmin(EfficientChangeListMixin, UserAdmin):
+    list_display = ('username', 'email', 'is_active', 'is_staff', 'date_joined')
+    list_filter = ('is_staff', 'is_superuser', 'is_active')
+    # username and email are unique, hence indexed
+    search_fields = ('^username', '=email')
+    ordering = ('-pk',)
+    fieldsets = UserAdmin.fieldsets + (
+        ('Profile', {'fields': ('profile_picture', 'followers', 'following')}),
+    )
+    add_fieldsets = (
+        (None, {'classes': ('wide',), 'fields': ('username', 'email', 'usable_password', 'password1', 'password2')}),
+    )
+    # Searchable widgets instead of multi-selects listing every user
+    autocomplete_fields = ('followers', 'following')
+    filter_horizontal = ('groups', 'user_permissions')
+    actions = ['activate_users', 'deactivate_users', 'delete_accounts']
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        # JWTs carry these flags as claims: deny the ones issued before the change
+        if change and {'is_active', 'is_staff', 'is_superuser'} & set(form.changed_data):
+            from .tokens import revoke_user_tokens
+
+            revoke_user_tokens(obj.pk)
+
+    def delete_model(self, request, obj):
+        self.delete_queryset(request, CustomUser.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        from .deletion import schedule_account_deletion
+
+        for user in queryset.exclude(pk=request.user.pk).only('pk', 'username', 'is_active'):
+            schedule_account_deletion(user)
+
+    @admin.action(permissions=['change'], description='Activate selected users')
+    def activate_users(self, request, queryset):
+        # Accounts whose deletion is under way stay disabled: their data is being removed
+        being_deleted = queryset.filter(
+            pk__in=AccountDeletionJob.objects.exclude(status=AccountDeletionJob.DONE).values('user_id'))
+        skipped = list(being_deleted.values_list('username', flat=True))
+        updated = queryset.exclude(pk__in=being_deleted.values('pk')).update(is_active=True)
+        self.message_user(request, f'Activated {updated} user(s).', messages.SUCCESS)
+        if skipped:
+            self.message_user(request, f'Skipped {len(skipped)} account(s) being deleted: {", ".join(skipped)}.',
+                              messages.WARNING)
+
+    @admin.action(permissions=['change'], description='Deactivate selected users')
+    def deactivate_users(self, request, queryset):
+        from .tokens import revoke_user_tokens
+
+        user_ids = list(queryset.exclude(pk=request.user.pk).values_list('pk', flat=True))
+        updated = CustomUser.objects.filter(pk__in=user_ids).update(is_active=False)
+        for user_id in user_ids:
+            revoke_user_tokens(user_id)
+        self.message_user(request, f'Deactivated {updated} user(s).', messages.SUCCESS)
+
+    @admin.action(permissions=['delete'], description='Delete selected accounts in the background')
+    def delete_accounts(self, request, queryset):
+        # Imported here: admin modules load at startup, account deletion is rarely needed
+        from .deletion import schedule_account_deletion
+
+        users = list(queryset.exclude(pk=request.user.pk).only('pk', 'username', 'is_active'))
+        for user in users:
+            schedule_account_deletion(user)
+        self.message_user(request, f'Scheduled the deletion of {len(users)} account(s).', messages.SUCCESS)
+
+
+@admin.register(AccountDeletionJob)
+class AccountDeletionJobAdmin(admin.ModelAdmin):
+    list_display = ('username', 'user_id', 'status', 'step', 'deleted_rows', 'updated_at')
+    list_filter = ('status',)
+    search_fields = ('^username',)
+    readonly_fields = [field.name for field in AccountDeletionJob._meta.fields]
@@ -0,0 +1,74 @@
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .tokens import is_revoked, stateless_enabled
+
+
+class StatelessJWTAuthentication(BaseAuthentication):
+    """
+    Authenticate 'Authorization: Bearer <access token>' requests without
+    touching the database.
+
+    The token signature and expiry are verified locally and checked against the
+    revocation deny set in the cache, which must be shared by all workers
+    (tokens are refused otherwise, see stateless_enabled()). request.user is built from the token
+    claims; any other user field is loaded lazily the first time it is read.
+    It runs side by side with TokenAuthentication, which handles 'Token <key>'.
+    """
+    keyword = 'Bearer'
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) != 2:
+            raise AuthenticationFailed('Invalid token header.')
+        if not stateless_enabled():
+            raise AuthenticationFailed('Bearer tokens are not accepted by this server.')
+
+        try:
+            token = AccessToken(auth[1].decode())
+        except (TokenError, UnicodeError):
+            raise AuthenticationFailed('Token is invalid or expired.')
+
+        if is_revoked(token):
+            raise AuthenticationFailed('Token has been revoked.')
+        if not token.get('is_active', True):
+            raise AuthenticationFailed('User inactive or deleted.')
+
+        return self.get_user(token), token
+
+    def get_user(self, token):
+        """Build the user from the token claims, leaving every other field deferred."""
+        user_model = get_user_model()
+        claims = {
+            user_model._meta.pk.attname: token[api_settings.USER_ID_CLAIM],
+            'is_staff': token.get('is_staff', False),
+            'is_superuser': token.get('is_superuser', False),
+            # Deactivating an account revokes its tokens (revoke_user_tokens), and
+            # refreshing reads the flags from the database again, so the claims of a
+            # valid token are at most ACCESS_TOKEN_LIFETIME old
+            'is_active': token.get('is_active', True),
+        }
+        # from_db expects the values in the model's field order
+        names = [field.attname for field in user_model._meta.concrete_fields if field.attname in claims]
+        return user_model.from_db(DEFAULT_DB_ALIAS, names, [claims[name] for name in names])
+
+    def authenticate_header(self, request):
+        return f'{self.keyword} realm="api"'
+
+
+def load_deferred_fields(user):
+    """
+    Load the fields a JWT authenticated user was built without, in one query,
+    for views that read the whole user.
+    """
+    deferred = user.get_deferred_fields()
+    if deferred:
+        user.refresh_from_db(fields=list(deferred))
+    return user
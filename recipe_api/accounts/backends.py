@@ -0,0 +1,30 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+from . import hashing
+
+
+class OffloadedHashingBackend(ModelBackend):
+    """
+    ModelBackend that verifies passwords in the hashing pool (see accounts/hashing.py)
+    instead of on the request worker, and rehashes outdated hashes on login.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        user_model = get_user_model()
+        if username is None:
+            username = kwargs.get(user_model.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+
+        try:
+            user = user_model._default_manager.get_by_natural_key(username)
+        except user_model.DoesNotExist:
+            # Run the hasher once anyway to keep the timing of unknown usernames
+            # close to the one of wrong passwords, like ModelBackend does.
+            hashing.make_password(password)
+            return None
+
+        if hashing.verify_password(user, password) and self.user_can_authenticate(user):
+            return user
+        return None
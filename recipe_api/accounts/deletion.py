@@ -0,0 +1,172 @@
+"""
+Background, batched deletion of user accounts.
+
+Deleting a user through the ORM makes Django's collector load every related
+row (recipes, reviews, favorites, notifications, follows, tokens) into memory
+inside the request. Instead the account is disabled right away and an
+AccountDeletionJob removes its data table by table, in bounded batches of raw
+DELETE statements. The job records the step it is on and the rows deleted so
+far; every step simply deletes whatever is left, so an interrupted job resumes
+where it stopped.
+"""
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.admin.models import LogEntry
+from django.contrib.auth import get_user_model
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from notifications.models import ArchivedNotification, Notification
+from recipes.deletion import delete_recipes
+from recipes.media import schedule_media_cleanup
+from recipes.ratings import delete_reviews
+from recipes.models import Favorite, RateAndReview, Recipe
+
+from .models import AccountDeletionJob
+from .tokens import revoke_user_tokens
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'BATCH_SIZE': 500,
+    'RUN_IN_BACKGROUND': True,
+    'STALE_AFTER': timedelta(minutes=10),
+}
+
+
+def get_setting(name):
+    return getattr(settings, 'ACCOUNT_DELETION', {}).get(name, DEFAULTS[name])
+
+
+def _deletion_steps():
+    """
+    The querysets emptied by the job, in an order that never leaves a row
+    pointing at one that is already gone, each with the function deleting a
+    batch of it when a plain DELETE is not enough (None otherwise). Reviews
+    also leave the rating histograms, and recipes are removed together with
+    their reviews and favorites by recipes.deletion.
+    """
+    user_model = get_user_model()
+    following = user_model.following.through
+    followers = user_model.followers.through
+    groups = user_model.groups.through
+    permissions = user_model.user_permissions.through
+    return [
+        ('notifications received', lambda user_id: Notification.objects.filter(recipient_id=user_id), None),
+        ('archived notifications', lambda user_id: ArchivedNotification.objects.filter(recipient_id=user_id), None),
+        ('notifications sent', lambda user_id: Notification.objects.filter(actor_id=user_id), None),
+        ('reviews', lambda user_id: RateAndReview.objects.filter(user_id=user_id), delete_reviews),
+        ('favorites', lambda user_id: Favorite.objects.filter(user_id=user_id), None),
+        ('recipes', lambda user_id: Recipe.objects.filter(creator_id=user_id), delete_recipes),
+        ('following', lambda user_id: following.objects.filter(
+            Q(from_customuser_id=user_id) | Q(to_customuser_id=user_id)), None),
+        ('followers', lambda user_id: followers.objects.filter(
+            Q(from_customuser_id=user_id) | Q(to_customuser_id=user_id)), None),
+        ('tokens', lambda user_id: Token.objects.filter(user_id=user_id), None),
+        ('admin log entries', lambda user_id: LogEntry.objects.filter(user_id=user_id), None),
+        ('groups', lambda user_id: groups.objects.filter(customuser_id=user_id), None),
+        ('permissions', lambda user_id: permissions.objects.filter(customuser_id=user_id), None),
+    ]
+
+
+def schedule_account_deletion(user):
+    """
+    Disable the account immediately and queue the removal of its data.
+
+    Returns the AccountDeletionJob, which is started in a background thread once
+    the surrounding transaction commits (unless ACCOUNT_DELETION['RUN_IN_BACKGROUND']
+    is off, in which case the process_account_deletions command picks it up).
+    """
+    with transaction.atomic():
+        user.is_active = False
+        user.save(update_fields=['is_active'])
+        Token.objects.filter(user=user).delete()
+        job, _ = AccountDeletionJob.objects.get_or_create(user_id=user.pk, defaults={'username': user.username})
+
+    # Deny any JWT still held for the account
+    revoke_user_tokens(user.pk)
+
+    if get_setting('RUN_IN_BACKGROUND'):
+        transaction.on_commit(lambda: start_in_background(job.pk))
+    return job
+
+
+def start_in_background(job_id):
+    thread = threading.Thread(target=_run_and_close, args=(job_id,), name=f'account-deletion-{job_id}', daemon=True)
+    thread.start()
+    return thread
+
+
+def _run_and_close(job_id):
+    try:
+        run_job(job_id)
+    except Exception:
+        # Already logged and recorded on the job, process_account_deletions retries it
+        pass
+    finally:
+        connections.close_all()
+
+
+def claim_job(job_id):
+    """
+    Mark the job as running unless another runner holds it. Jobs left running
+    for longer than STALE_AFTER are considered abandoned and can be claimed.
+    """
+    stale = timezone.now() - get_setting('STALE_AFTER')
+    claimable = Q(status__in=[AccountDeletionJob.PENDING, AccountDeletionJob.FAILED]) | Q(
+        status=AccountDeletionJob.RUNNING, updated_at__lt=stale)
+    return AccountDeletionJob.objects.filter(claimable, pk=job_id).update(
+        status=AccountDeletionJob.RUNNING, updated_at=timezone.now()) == 1
+
+
+def run_job(job_id, progress=None):
+    """
+    Run (or resume) a deletion job to completion.
+
+    progress, if given, is called with the job after every batch.
+    Returns False when the job could not be claimed.
+    """
+    if not claim_job(job_id):
+        return False
+
+    job = AccountDeletionJob.objects.get(pk=job_id)
+    steps = _deletion_steps()
+    batch_size = get_setting('BATCH_SIZE')
+    try:
+        while job.step < len(steps):
+            label, queryset_for, delete = steps[job.step]
+            queryset = queryset_for(job.user_id)
+            ids = list(queryset.values_list('pk', flat=True)[:batch_size])
+            if ids:
+                batch = queryset.model._base_manager.filter(pk__in=ids)
+                if delete is not None:
+                    job.deleted_rows += delete(batch)
+                else:
+                    # Single DELETE ... WHERE id IN (...) without loading the rows
+                    job.deleted_rows += batch._raw_delete(batch.db)
+            if len(ids) < batch_size:
+                job.step += 1
+            job.save(update_fields=['step', 'deleted_rows', 'updated_at'])
+            if progress is not None:
+                progress(job, label)
+
+        # The steps removed every row referring to the user, so this is a
+        # single DELETE that skips the collector
+        users = get_user_model()._base_manager.filter(pk=job.user_id)
+        with transaction.atomic():
+            schedule_media_cleanup(list(users.values_list('profile_picture', flat=True)))
+            users._raw_delete(users.db)
+        job.status = AccountDeletionJob.DONE
+        job.save(update_fields=['status', 'updated_at'])
+    except Exception as e:
+        logger.exception('Account deletion job %s failed at step %s', job.pk, job.step)
+        job.status = AccountDeletionJob.FAILED
+        job.error = str(e)
+        job.save(update_fields=['status', 'error', 'updated_at'])
+        raise
+    return True
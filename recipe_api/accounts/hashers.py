@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.contrib.auth.hashers import ScryptPasswordHasher
+
+_scrypt = getattr(settings, 'PASSWORD_HASHING', {}).get('SCRYPT', {})
+
+
+class TunedScryptPasswordHasher(ScryptPasswordHasher):
+    """
+    Scrypt hasher with the cost parameters from PASSWORD_HASHING['SCRYPT'].
+
+    It keeps the 'scrypt' algorithm name, so hashes made with other parameters
+    are still verified and get rehashed with the configured ones on login.
+    """
+    work_factor = _scrypt.get('WORK_FACTOR', ScryptPasswordHasher.work_factor)
+    block_size = _scrypt.get('BLOCK_SIZE', ScryptPasswordHasher.block_size)
+    parallelism = _scrypt.get('PARALLELISM', ScryptPasswordHasher.parallelism)
+    maxmem = _scrypt.get('MAXMEM', ScryptPasswordHasher.maxmem)
@@ -0,0 +1,136 @@
+"""
+Password hashing and verification offloaded to a bounded process pool.
+
+Hashing a password costs hundreds of milliseconds of CPU. Running it in a
+separate pool keeps request workers free for other endpoints during bursts of
+logins or registrations, and a semaphore bounds how many hashing jobs can be
+queued: once it is full, callers wait up to QUEUE_TIMEOUT seconds and then get
+HashingBusy (503 with Retry-After) instead of piling up.
+
+The pool processes are started by a fork server rather than forked from the
+request worker: a worker runs many threads, and a process forked while
+another thread holds a lock (logging, database driver, cache client) could
+deadlock on it.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import hashers
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+DEFAULTS = {
+    'WORKERS': 2,
+    'MAX_QUEUE': 16,
+    'QUEUE_TIMEOUT': 2.0,
+}
+
+
+def get_setting(name):
+    return getattr(settings, 'PASSWORD_HASHING', {}).get(name, DEFAULTS[name])
+
+
+class HashingBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Too many password checks in progress, please retry later.'
+    default_code = 'hashing_busy'
+    wait = 1
+
+
+_lock = threading.Lock()
+_executor = None
+_slots = None
+
+
+def _init_worker(settings_module):
+    """Set up Django in a pool process so the configured hashers are available."""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    django.setup()
+
+
+def _check(password, encoded):
+    return hashers.check_password(password, encoded)
+
+
+def _make(password):
+    return hashers.make_password(password)
+
+
+def _get_pool():
+    """Create the process pool and queue slots on first use, i.e. after the server forked its workers."""
+    global _executor, _slots
+    with _lock:
+        if _slots is None:
+            workers = get_setting('WORKERS')
+            if workers:
+                _executor = ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context('forkserver'),
+                    initializer=_init_worker,
+                    initargs=(settings.SETTINGS_MODULE,),
+                )
+            _slots = threading.BoundedSemaphore(workers + get_setting('MAX_QUEUE'))
+    return _executor, _slots
+
+
+def shutdown_pool():
+    """Stop the pool processes; the next hashing job starts a new pool with the current settings."""
+    global _executor, _slots
+    with _lock:
+        if _executor is not None:
+            _executor.shutdown()
+        _executor = _slots = None
+
+
+def _run(function, *args):
+    executor, slots = _get_pool()
+    if not slots.acquire(timeout=get_setting('QUEUE_TIMEOUT')):
+        raise HashingBusy()
+    try:
+        if executor is None:
+            return function(*args)
+        return executor.submit(function, *args).result()
+    finally:
+        slots.release()
+
+
+def check_password(password, encoded):
+    """Return whether the password matches the encoded hash, computed in the pool."""
+    return _run(_check, password, encoded)
+
+
+def make_password(password):
+    """Hash the password with the preferred hasher, computed in the pool."""
+    return _run(_make, password)
+
+
+acheck_password = sync_to_async(check_password, thread_sensitive=False)
+amake_password = sync_to_async(make_password, thread_sensitive=False)
+
+
+def must_update(encoded):
+    """Return whether the hash should be upgraded to the preferred hasher or its current parameters."""
+    preferred = hashers.get_hasher('default')
+    try:
+        current = hashers.identify_hasher(encoded)
+    except ValueError:
+        return False
+    return current.algorithm != preferred.algorithm or preferred.must_update(encoded)
+
+
+def verify_password(user, password):
+    """
+    Check the user's password and, when it matches but was hashed with an
+    outdated hasher or parameters, rehash and store it (rehash-on-login).
+    """
+    if not check_password(password, user.password):
+        return False
+    if must_update(user.password):
+        user.password = make_password(password)
+        user.save(update_fields=['password'])
+    return True
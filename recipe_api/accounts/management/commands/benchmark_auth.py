@@ -0,0 +1,55 @@
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from accounts.authentication import StatelessJWTAuthentication
+from accounts.tokens import issue_tokens
+
+
+class Command(BaseCommand):
+    """
+    Compare the per-request overhead of the DB backed token authentication
+    with the stateless JWT authentication: time and queries per authenticate().
+    """
+    help = 'Benchmark authentication overhead per request for token and JWT auth.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', help='User to authenticate as (defaults to the first user).')
+        parser.add_argument('--requests', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        user_model = get_user_model()
+        if options['username']:
+            user = user_model.objects.filter(username=options['username']).first()
+        else:
+            user = user_model.objects.order_by('pk').first()
+        if user is None:
+            raise CommandError('No user to authenticate as.')
+
+        token, _ = Token.objects.get_or_create(user=user)
+        access = issue_tokens(user)['access']
+        factory = RequestFactory()
+
+        for label, authenticator, header in [
+            ('token', TokenAuthentication(), f'Token {token.key}'),
+            ('jwt', StatelessJWTAuthentication(), f'Bearer {access}'),
+        ]:
+            request = factory.get('/', HTTP_AUTHORIZATION=header)
+            timings = []
+            with CaptureQueriesContext(connection) as queries:
+                for _ in range(options['requests']):
+                    start = time.perf_counter()
+                    authenticator.authenticate(request)
+                    timings.append((time.perf_counter() - start) * 1_000_000)
+            self.stdout.write(
+                f'{label:<6} mean {statistics.mean(timings):8.1f} us  '
+                f'p99 {statistics.quantiles(timings, n=100)[98]:8.1f} us  '
+                f'queries/request {len(queries) / options["requests"]:.2f}'
+            )
@@ -0,0 +1,87 @@
+import statistics
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client, override_settings
+
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    """
+    Measure the latency of a cheap endpoint (recipe retrieve) alone and during
+    a storm of concurrent logins, to check that password hashing does not
+    starve the other endpoints. Throttling is disabled for the run.
+    """
+    help = 'Benchmark other endpoints latency during a login storm.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('password')
+        parser.add_argument('--login-threads', type=int, default=8)
+        parser.add_argument('--duration', type=float, default=5.0, help='Seconds per phase.')
+        parser.add_argument('--inline', action='store_true', help='Hash on the request threads instead of the pool.')
+
+    def handle(self, *args, **options):
+        recipe = Recipe.objects.order_by('pk').first()
+        if recipe is None:
+            raise CommandError('The benchmark needs at least one recipe.')
+
+        hashing = dict(getattr(settings, 'PASSWORD_HASHING', {}))
+        if options['inline']:
+            hashing['WORKERS'] = 0
+        admission = dict(getattr(settings, 'ADMISSION_CONTROL', {}), ENABLED=False)
+
+        with override_settings(PASSWORD_HASHING=hashing, ADMISSION_CONTROL=admission):
+            baseline, _ = self.run_phase(options, f'/api/recipes/{recipe.pk}/', 0)
+            storm, logins = self.run_phase(options, f'/api/recipes/{recipe.pk}/', options['login_threads'])
+
+        self.report('baseline', baseline)
+        self.report('login storm', storm)
+        self.stdout.write('login responses: ' + ', '.join(f'{code}: {count}' for code, count in sorted(logins.items())))
+
+    def run_phase(self, options, probe_path, login_threads):
+        stop = threading.Event()
+        timings = []
+        logins = Counter()
+        lock = threading.Lock()
+
+        def probe():
+            client = Client()
+            while not stop.is_set():
+                start = time.perf_counter()
+                client.get(probe_path, secure=True)
+                with lock:
+                    timings.append((time.perf_counter() - start) * 1000)
+            connections.close_all()
+
+        def login():
+            client = Client()
+            data = {'username': options['username'], 'password': options['password']}
+            while not stop.is_set():
+                response = client.post('/accounts/login/', data, secure=True)
+                with lock:
+                    logins[response.status_code] += 1
+            connections.close_all()
+
+        threads = [threading.Thread(target=probe)] + [threading.Thread(target=login) for _ in range(login_threads)]
+        for thread in threads:
+            thread.start()
+        time.sleep(options['duration'])
+        stop.set()
+        for thread in threads:
+            thread.join()
+        return timings, logins
+
+    def report(self, label, timings):
+        if len(timings) < 2:
+            self.stdout.write(f'{label}: not enough samples')
+            return
+        percentiles = statistics.quantiles(timings, n=100)
+        self.stdout.write(
+            f'{label}: {len(timings)} probe requests, p50 {percentiles[49]:.2f} ms, p99 {percentiles[98]:.2f} ms'
+        )
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from accounts.deletion import run_job
+from accounts.models import AccountDeletionJob
+
+
+class Command(BaseCommand):
+    """
+    Run or resume every unfinished account deletion job, e.g. after a restart
+    interrupted the background threads.
+    """
+    help = 'Run pending, failed and abandoned account deletion jobs.'
+
+    def handle(self, *args, **options):
+        jobs = AccountDeletionJob.objects.exclude(status=AccountDeletionJob.DONE).order_by('created_at')
+        for job_id in jobs.values_list('pk', flat=True):
+            def progress(job, label):
+                self.stdout.write(f'  {job.username}: {label}, {job.deleted_rows} rows deleted so far')
+
+            if run_job(job_id, progress=progress):
+                self.stdout.write(self.style.SUCCESS(f'Account deletion job {job_id} done'))
+            else:
+                self.stdout.write(f'Account deletion job {job_id} is being run elsewhere, skipped')
@@ -46,3 +46,31 @@ class CustomUser(AbstractUser):
     REQUIRED_FIELDS = ['email']
 
     objects = CustomUserManager()
+
+class AccountDeletionJob(models.Model):
+    """
+        Tracks the background removal of a deleted account's data, so the deletion
+        can report its progress and resume from the current step if interrupted.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    user_id = models.BigIntegerField(unique=True)# Plain id, the user row is deleted by the job itself
+    username = models.CharField(max_length=50)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    step = models.PositiveSmallIntegerField(default=0)
+    deleted_rows = models.PositiveBigIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Deletion of {self.username} ({self.status}, step {self.step}, {self.deleted_rows} rows)"
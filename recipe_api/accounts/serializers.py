@@ -1,8 +1,15 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
+from django.conf import settings
 from rest_framework.authtoken.models import Token
 from rest_framework.authentication import authenticate
 from rest_framework.exceptions import ValidationError
+from recipe_api.instrumentation import TimedListSerializer
+from recipe_api.fast_serializers import FastSerializer
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from .tokens import RecipeRefreshToken, issue_tokens, is_revoked, stateless_enabled
+from . import hashing
 
 get_user_model()
 
@@ -34,21 +41,27 @@ class RegisterSerializer(serializers.ModelSerializer):
         #Remove password2 during the creation of the user
         validated_data.pop('password2') 
 
+        # Hash the password in the hashing pool and save the user in a single insert
         user = get_user_model().objects.create(username = validated_data['username'],
                                                email = validated_data['email'],
-                                               profile_picture = validated_data.get('profile_picture', None)
+                                               profile_picture = validated_data.get('profile_picture', None),
+                                               password = hashing.make_password(validated_data['password'])
                                                )
-        user.set_password(validated_data['password'])
-        user.save()
         return user
     
 class LoginSerializer(serializers.Serializer):
     """
     Serializer for authenticating a user and generating an authentication token.
+
+    token_type selects a DB backed 'token' or a 'jwt' access/refresh pair and
+    defaults to the LOGIN_TOKEN_TYPE setting. JWTs are only issued when the
+    revocation cache is shared by all workers; otherwise asking for one is an
+    error and the default falls back to 'token'.
     """
 
     username = serializers.CharField()
     password = serializers.CharField(write_only=True)
+    token_type = serializers.ChoiceField(choices=['token', 'jwt'], required=False, write_only=True)
 
     def validate(self, data):
         """
@@ -63,6 +76,9 @@ class LoginSerializer(serializers.Serializer):
         Raises:
         ValidationError: If the username or password is invalid.
         """
+        if data.get('token_type') == 'jwt' and not stateless_enabled():
+            raise ValidationError({'token_type': ['JWTs are not issued by this server.']})
+
         username = data.get('username')
         password = data.get('password')
 
@@ -86,6 +102,13 @@ class LoginSerializer(serializers.Serializer):
         # Get the authenticated user from the validated data
         user = instance['user']
 
+        # Stateless mode: signed tokens, nothing stored in the database
+        if instance.get('token_type', settings.LOGIN_TOKEN_TYPE) == 'jwt' and stateless_enabled():
+            return {
+                'message': 'Login successful',
+                **issue_tokens(user)
+            }
+
         # Get or create a token for the authenticated user
         token, _ = Token.objects.get_or_create(user=user)
 
@@ -95,7 +118,42 @@ class LoginSerializer(serializers.Serializer):
             'Token': token.key
         }
 
-       
+
+class TokenRefreshSerializer(serializers.Serializer):
+    """
+    Serializer for exchanging a JWT refresh token for a new access and refresh token pair.
+    """
+
+    refresh = serializers.CharField(write_only=True)
+
+    def validate(self, data):
+        """
+        Validates the refresh token's signature, expiry and revocation, and
+        loads the flags of its user, who must still be active.
+
+        Raises:
+        ValidationError: If the refresh token is invalid, expired or revoked, or its user inactive or deleted.
+        """
+        if not stateless_enabled():
+            raise ValidationError({'message': 'JWTs are not issued by this server'})
+        try:
+            token = RecipeRefreshToken(data['refresh'])
+        except TokenError:
+            raise ValidationError({'message': 'Refresh token is invalid or expired'})
+
+        if is_revoked(token):
+            raise ValidationError({'message': 'Refresh token has been revoked'})
+
+        user_model = get_user_model()
+        user = (user_model.objects.only('is_active', 'is_staff', 'is_superuser')
+                .filter(pk=token[jwt_settings.USER_ID_CLAIM]).first())
+        if user is None or not user.is_active:
+            raise ValidationError({'message': 'User inactive or deleted'})
+
+        data['token'] = token
+        data['user'] = user
+        return data
+
 class ProfileSerializer(serializers.ModelSerializer):
     """
         Serializer for retrieving and modifying the user data.
@@ -134,6 +192,7 @@ class FollowingSerializer(serializers.ModelSerializer):
     class Meta:
         model = get_user_model()
         fields = ['username', 'profile_picture']
+        list_serializer_class = TimedListSerializer
 
 class FollowersSerializer(serializers.ModelSerializer):
     """
@@ -146,7 +205,16 @@ class FollowersSerializer(serializers.ModelSerializer):
     class Meta:
         model = get_user_model()
         fields = ['username', 'profile_picture']
+        list_serializer_class = TimedListSerializer
 
+class FastFollowingSerializer(FastSerializer):
+    """
+        Read-only counterpart of FollowingSerializer used for list responses.
+    """
+    serializer_class = FollowingSerializer
 
-    
-
+class FastFollowersSerializer(FastSerializer):
+    """
+        Read-only counterpart of FollowersSerializer used for list responses.
+    """
+    serializer_class = FollowersSerializer
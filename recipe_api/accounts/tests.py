@@ -1,3 +1,214 @@
-from django.test import TestCase
+import os
+import tempfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group
+from django.core.cache import caches
+from django.test import Client, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from recipes.models import Recipe
+
+from . import hashing
+from .deletion import run_job, schedule_account_deletion
+from .models import AccountDeletionJob, CustomUser
+from .tokens import RecipeRefreshToken, is_revoked, revoke_user_tokens
+from .views import FollowersAPIView, FollowingAPIView
+
+
+@override_settings(ADMISSION_CONTROL={'ENABLED': False}, SECURE_SSL_REDIRECT=False)
+class FastListTests(TestCase):
+    """The follow lists return the same bytes through the fast path as through DRF's serializers."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(username='cook', email='cook@example.com', password='x')
+        for index, name in enumerate(['zoë', 'anna', 'bob']):
+            other = CustomUser.objects.create_user(username=name, email=f'{index}@example.com', password='x')
+            if index:
+                other.profile_picture = f'profile_pictures/{name} 1.png'
+                other.save()
+            cls.user.following.add(other)
+            cls.user.followers.add(other)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, url):
+        response = self.client.get(url, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response.content
+
+    def test_follow_lists(self):
+        for url, view_class in [('/accounts/following/', FollowingAPIView), ('/accounts/followers/', FollowersAPIView)]:
+            fast = self.get(url)
+            with mock.patch.object(view_class, 'fast_serializer_class', None), \
+                    mock.patch.object(view_class, 'renderer_classes', [JSONRenderer]):
+                original = self.get(url)
+            self.assertEqual(fast, original)
+
+
+@override_settings(
+    ADMISSION_CONTROL={'ENABLED': False}, SECURE_SSL_REDIRECT=False,
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                        'LOCATION': os.path.join(tempfile.gettempdir(), 'recipe_api-tests-cache')}},
+)
+class StatelessTokenTests(TestCase):
+    """JWT refresh reads the user from the database, and JWTs need a shared revocation cache."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(username='cook', email='cook@example.com', password='x')
+
+    def setUp(self):
+        caches['default'].clear()
+        self.client = APIClient()
+
+    def refresh(self, token):
+        return self.client.post('/accounts/token/refresh/', {'refresh': str(token)}, format='json')
+
+    def test_refresh_reloads_flags_and_keeps_expiry(self):
+        token = RecipeRefreshToken.for_user(self.user)
+        CustomUser.objects.filter(pk=self.user.pk).update(is_staff=True)
+        response = self.refresh(token)
+        self.assertEqual(response.status_code, 200)
+        rotated = RecipeRefreshToken(response.data['refresh'])
+        self.assertTrue(rotated['is_staff'])
+        self.assertTrue(AccessToken(response.data['access'])['is_staff'])
+        self.assertEqual(rotated['exp'], token['exp'])
+        self.assertNotEqual(rotated['jti'], token['jti'])
+        # The old refresh token was revoked by the rotation
+        self.assertEqual(self.refresh(token).status_code, 401)
+
+    def test_refresh_rejects_inactive_user(self):
+        token = RecipeRefreshToken.for_user(self.user)
+        CustomUser.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.refresh(token).status_code, 401)
+
+    def test_bearer_tokens_need_a_shared_cache(self):
+        access = RecipeRefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        self.assertEqual(self.client.get('/accounts/following/').status_code, 200)
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            self.assertEqual(self.client.get('/accounts/following/').status_code, 401)
+            self.assertEqual(self.refresh(RecipeRefreshToken.for_user(self.user)).status_code, 401)
+
+    def test_revocation_within_a_second(self):
+        now = timezone.now().replace(microsecond=500000)
+        before, after = RecipeRefreshToken.for_user(self.user), RecipeRefreshToken.for_user(self.user)
+        before.set_iat(at_time=now - timedelta(milliseconds=1))
+        after.set_iat(at_time=now + timedelta(milliseconds=1))
+        with mock.patch('accounts.tokens.time.time', return_value=now.timestamp()):
+            revoke_user_tokens(self.user.pk)
+
+        self.assertTrue(is_revoked(before))
+        self.assertFalse(is_revoked(after))
+        for token, status_code in [(before, 401), (after, 200)]:
+            self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token.access_token}')
+            self.assertEqual(self.client.get('/accounts/following/').status_code, status_code)
+        self.assertEqual(self.refresh(before).status_code, 401)
+        self.assertEqual(self.refresh(after).status_code, 200)
+
+    def test_admin_deactivation_revokes_tokens(self):
+        admin = CustomUser.objects.create_superuser(username='admin', email='admin@example.com', password='x')
+        client = Client()
+        client.force_login(admin)
+        access = RecipeRefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        self.assertEqual(self.client.get('/accounts/following/').status_code, 200)
+
+        response = client.post('/admin/accounts/customuser/', {
+            'action': 'deactivate_users', '_selected_action': [self.user.pk, admin.pk]})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.client.get('/accounts/following/').status_code, 401)
+        admin.refresh_from_db()
+        self.assertTrue(admin.is_active)
+
+
+@override_settings(ACCOUNT_DELETION={'RUN_IN_BACKGROUND': False, 'BATCH_SIZE': 2})
+class AccountDeletionTests(TestCase):
+
+    def test_job_removes_the_user_and_what_refers_to_it(self):
+        user = CustomUser.objects.create_user(username='cook', email='cook@example.com', password='x')
+        other = CustomUser.objects.create_user(username='other', email='other@example.com', password='x')
+        user.following.add(other)
+        other.followers.add(user)
+        user.groups.add(Group.objects.create(name='editors'))
+        for title in ['Pancakes', 'Soup', 'Bread']:
+            Recipe.objects.create(creator=user, title=title, ingredients=['flour'], instructions='Mix.',
+                                  category='bread', preparation_time=5, servings=2)
+
+        job = schedule_account_deletion(user)
+        self.assertTrue(run_job(job.pk))
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, AccountDeletionJob.DONE)
+        self.assertFalse(CustomUser.objects.filter(pk=user.pk).exists())
+        self.assertFalse(Recipe.objects.exists())
+        self.assertFalse(other.following.exists())
+        self.assertFalse(other.followers.exists())
+        self.assertFalse(CustomUser.groups.through.objects.exists())
+
+    def test_admin_does_not_reactivate_accounts_being_deleted(self):
+        admin = CustomUser.objects.create_superuser(username='admin', email='admin@example.com', password='x')
+        deleted = CustomUser.objects.create_user(username='cook', email='cook@example.com')
+        disabled = CustomUser.objects.create_user(username='other', email='other@example.com', is_active=False)
+        schedule_account_deletion(deleted)
+        client = Client()
+        client.force_login(admin)
+
+        response = client.post('/admin/accounts/customuser/', {
+            'action': 'activate_users', '_selected_action': [deleted.pk, disabled.pk]}, follow=True)
+        self.assertEqual([str(message) for message in response.context['messages']], [
+            'Activated 1 user(s).', 'Skipped 1 account(s) being deleted: cook.'])
+        self.assertFalse(CustomUser.objects.get(pk=deleted.pk).is_active)
+        self.assertTrue(CustomUser.objects.get(pk=disabled.pk).is_active)
+
+
+@override_settings(ADMISSION_CONTROL={'ENABLED': False}, SECURE_SSL_REDIRECT=False)
+class PasswordHashingTests(TestCase):
+    """Passwords are hashed and checked in the pool, and a full queue answers 503."""
+
+    def setUp(self):
+        hashing.shutdown_pool()
+        self.addCleanup(hashing.shutdown_pool)
+
+    def test_pool(self):
+        with self.settings(PASSWORD_HASHING={'WORKERS': 1, 'MAX_QUEUE': 1}):
+            encoded = hashing.make_password('secret')
+            self.assertTrue(encoded.startswith('scrypt$32768$'))
+            self.assertTrue(hashing.check_password('secret', encoded))
+            self.assertFalse(hashing.check_password('wrong', encoded))
+            self.assertIsNotNone(hashing._executor)
+
+    def test_outdated_hash_is_upgraded_on_login(self):
+        user = CustomUser.objects.create_user(username='cook', email='cook@example.com')
+        CustomUser.objects.filter(pk=user.pk).update(password=make_password('secret', hasher='pbkdf2_sha256'))
+        with self.settings(PASSWORD_HASHING={'WORKERS': 0, 'MAX_QUEUE': 1}):
+            response = APIClient().post('/accounts/login/', {'username': 'cook', 'password': 'secret'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        user.refresh_from_db()
+        algorithm, work_factor, _, block_size, parallelism, _ = user.password.split('$')
+        self.assertEqual((algorithm, work_factor, block_size, parallelism), ('scrypt', '32768', '8', '2'))
+
+    def test_busy_pool(self):
+        CustomUser.objects.create_user(username='cook', email='cook@example.com')
+        with self.settings(PASSWORD_HASHING={'WORKERS': 0, 'MAX_QUEUE': 1, 'QUEUE_TIMEOUT': 0.01}):
+            _, slots = hashing._get_pool()
+            slots.acquire()
+            try:
+                with self.assertRaises(hashing.HashingBusy):
+                    hashing.make_password('secret')
+                response = APIClient().post('/accounts/login/', {'username': 'cook', 'password': 'x'}, format='json')
+            finally:
+                slots.release()
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response['Retry-After'], '1')
+            # Inline hashing once a slot is free
+            self.assertTrue(hashing.check_password('secret', hashing.make_password('secret')))
@@ -0,0 +1,100 @@
+"""
+JSON Web Tokens for the stateless authentication mode, and the cache-backed
+deny set used to revoke them before they expire.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from recipe_api.caching import is_process_local
+
+
+class RecipeRefreshToken(RefreshToken):
+    """
+    Refresh token carrying the user flags that permission checks read, so
+    access tokens derived from it can be verified without loading the user.
+    """
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token['is_active'] = user.is_active
+        token['is_staff'] = user.is_staff
+        token['is_superuser'] = user.is_superuser
+        return token
+
+    def set_iat(self, claim='iat', at_time=None):
+        # Keep the fraction of a second (RFC 7519 NumericDates may have one), so
+        # that revoke_user_tokens() tells tokens issued just before a revocation
+        # from those issued just after it. Access tokens copy this claim.
+        self.payload[claim] = (at_time or self.current_time).timestamp()
+
+
+def get_revocation_cache():
+    return caches[getattr(settings, 'JWT_REVOCATION_CACHE', 'default')]
+
+
+def stateless_enabled():
+    """
+    Whether JWTs may be issued and accepted: only with a revocation cache
+    shared by all workers, as a token revoked in one worker's private cache
+    would stay valid in every other worker.
+    """
+    return not is_process_local(getattr(settings, 'JWT_REVOCATION_CACHE', 'default'))
+
+
+def _deny_key(token):
+    return f'jwt:deny:{token[api_settings.JTI_CLAIM]}'
+
+
+def _revoked_before_key(user_id):
+    return f'jwt:revoked_before:{user_id}'
+
+
+def revoke_token(token):
+    """Deny a single token until it would have expired anyway."""
+    remaining = int(token['exp'] - time.time()) + 1
+    if remaining > 0:
+        get_revocation_cache().set(_deny_key(token), True, remaining)
+
+
+def revoke_user_tokens(user_id):
+    """
+    Deny every token issued to the user up to now, e.g. when the account is
+    deleted. Tokens issued later in the same second stay valid, see
+    RecipeRefreshToken.set_iat().
+    """
+    lifetime = int(api_settings.REFRESH_TOKEN_LIFETIME.total_seconds()) + 1
+    get_revocation_cache().set(_revoked_before_key(user_id), time.time(), lifetime)
+
+
+def is_revoked(token):
+    """Check a token against the deny set with a single cache round-trip."""
+    deny_key = _deny_key(token)
+    user_key = _revoked_before_key(token[api_settings.USER_ID_CLAIM])
+    found = get_revocation_cache().get_many([deny_key, user_key])
+    if found.get(deny_key):
+        return True
+    revoked_before = found.get(user_key)
+    return revoked_before is not None and token.get('iat', 0) <= revoked_before
+
+
+def rotate_refresh_token(refresh, user):
+    """
+    Revoke the refresh token and return a new one for the user, freshly loaded
+    from the database so its flags are current. The new token keeps the
+    expiry of the old one: rotating never extends a login.
+    """
+    revoke_token(refresh)
+    rotated = RecipeRefreshToken.for_user(user)
+    rotated['exp'] = refresh['exp']
+    return rotated
+
+
+def issue_tokens(user):
+    """Return a new access and refresh token pair for the user."""
+    refresh = RecipeRefreshToken.for_user(user)
+    return {'access': str(refresh.access_token), 'refresh': str(refresh)}
@@ -1,9 +1,11 @@
 from django.urls import path
-from .views import register, login, LogoutAPIView, ProfileAPIView, AccountDestroyAPIView, FollowAPIView, UnfollowAPIView, FollowingAPIView, FollowersAPIView, MarkNotificationAsReadView
+from notifications.views import NotificationListView
+from .views import register, login, refresh_token, LogoutAPIView, ProfileAPIView, AccountDestroyAPIView, FollowAPIView, UnfollowAPIView, FollowingAPIView, FollowersAPIView, MarkNotificationAsReadView
 
 urlpatterns = [
     path('register/', register, name='register'),
     path('login/', login, name='login'),
+    path('token/refresh/', refresh_token, name='token_refresh'),
     path('profile/', ProfileAPIView.as_view(), name='profile'),
     path('delete_account/', AccountDestroyAPIView.as_view(), name='detete_account'),
     path('follow/', FollowAPIView.as_view(), name='follow_users'),
@@ -12,5 +14,6 @@ urlpatterns = [
     path('following/', FollowingAPIView.as_view(), name='following'),
     path('followers/', FollowersAPIView.as_view(), name='followers'),
     path('logout/', LogoutAPIView.as_view(), name='logout'),
+    path('notifications/', NotificationListView.as_view(), name='notifications'),
     path('notifications/<int:pk>/read/', MarkNotificationAsReadView.as_view(), name='mark_notification_as_read'),
 ]
@@ -2,7 +2,15 @@ from django.shortcuts import render, get_object_or_404
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework import status, permissions, generics
-from .serializers import RegisterSerializer, LoginSerializer, ProfileSerializer, AccountDestroySerializer, FollowingSerializer, FollowersSerializer
+from .serializers import RegisterSerializer, LoginSerializer, TokenRefreshSerializer, ProfileSerializer, AccountDestroySerializer, FollowingSerializer, FollowersSerializer, FastFollowingSerializer, FastFollowersSerializer
+from recipe_api.fast_serializers import FastListMixin
+from .authentication import load_deferred_fields
+from .hashing import HashingBusy
+from .tokens import RecipeRefreshToken, revoke_token, rotate_refresh_token
+from .deletion import schedule_account_deletion
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken
 from .models import CustomUser
 from .paginations import UsersPagination, FollowingAndFollowersPagination
 from rest_framework.authtoken.models import Token
@@ -24,6 +32,9 @@ def register(request):
         else:
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         
+    except HashingBusy as e:
+        return Response({'error': str(e.detail)}, status=e.status_code, headers={'Retry-After': str(e.wait)})
+
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
@@ -37,10 +48,33 @@ def login(request):
     else: 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+@api_view(['POST'])
+def refresh_token(request):
+    serializer = TokenRefreshSerializer(data = request.data)
+
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_401_UNAUTHORIZED)
+
+    # Rotate the refresh token so the old one cannot be used again
+    refresh = rotate_refresh_token(serializer.validated_data['token'], serializer.validated_data['user'])
+
+    return Response({'access': str(refresh.access_token), 'refresh': str(refresh)}, status=status.HTTP_200_OK)
+
 class LogoutAPIView(generics.GenericAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request):
+        if isinstance(request.auth, AccessToken):
+            # Stateless mode: deny the access token, and the refresh token if one is sent
+            revoke_token(request.auth)
+            try:
+                refresh = RecipeRefreshToken(request.data.get('refresh', ''))
+                if refresh[jwt_settings.USER_ID_CLAIM] == request.auth[jwt_settings.USER_ID_CLAIM]:
+                    revoke_token(refresh)
+            except TokenError:
+                pass
+            return Response({'message': 'You have successfully logged out'}, status=status.HTTP_200_OK)
+
         try:
             # Deletes the user's auth token
             request.user.auth_token.delete()
@@ -57,7 +91,7 @@ class ProfileAPIView(generics.RetrieveUpdateAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_object(self):
-        return self.request.user
+        return load_deferred_fields(self.request.user)
     
     def perform_update(self, serializer):
 
@@ -69,16 +103,17 @@ class AccountDestroyAPIView(generics.RetrieveDestroyAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_object(self):
-        return self.request.user
+        return load_deferred_fields(self.request.user)
     
     def destroy(self, request):  
 
-        """ This method handles the deletion of the user(account) to add a custom deletion message"""
+        """ This method handles the deletion of the user(account) to add a custom deletion message.
+        The account is disabled right away and its data is removed by a background job."""
 
         instance = self.get_object()
-        self.perform_destroy(instance)
+        schedule_account_deletion(instance)
 
-        return Response({'message': 'Account deleted successfully'}, status=status.HTTP_200_OK)
+        return Response({'message': 'Account deleted successfully'}, status=status.HTTP_202_ACCEPTED)
 
 from django.db.models import Count  
 
@@ -122,18 +157,20 @@ class FollowAPIView(generics.GenericAPIView):
 
         return Response({'message': f'You are now following {user_to_follow.username}'}, status=status.HTTP_200_OK)
 
-class FollowingAPIView(generics.ListAPIView):
+class FollowingAPIView(FastListMixin, generics.ListAPIView):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = FollowingSerializer
+    fast_serializer_class = FastFollowingSerializer
     pagination_class = FollowingAndFollowersPagination
 
     def get_queryset(self):
         user = self.request.user
         return user.following.all()
     
-class FollowersAPIView(generics.ListAPIView):
+class FollowersAPIView(FastListMixin, generics.ListAPIView):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = FollowersSerializer
+    fast_serializer_class = FastFollowersSerializer
     pagination_class = FollowingAndFollowersPagination
 
     def get_queryset(self):
@@ -0,0 +1,44 @@
+"""
+Gunicorn settings, read automatically when gunicorn is started from this
+directory:
+
+    gunicorn recipe_api.wsgi
+
+The application is imported once in the master (preload_app) and warmed up
+there (see recipe_api/warmup.py) before the workers are forked, so workers
+start serving at once and share the imported code and preloaded data
+copy-on-write.
+"""
+import gc
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+# Threaded workers, so admission control (recipe_api/throttling.py) can keep some
+# threads free for cheap requests; settings.py sizes its limits from GUNICORN_THREADS
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 16))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+preload_app = True
+
+
+def on_starting(server):
+    """Drop the metrics files of the previous run before the workers start writing theirs."""
+    from recipe_api.instrumentation import clear_multiprocess_dir
+
+    clear_multiprocess_dir()
+
+
+def when_ready(server):
+    """Warm the master up once the application is loaded, before any worker is forked."""
+    from recipe_api.warmup import warm_up
+
+    timings = warm_up()
+    server.log.info('Warm-up done (ms): %s', timings)
+    if server.cfg.threads <= 1:
+        server.log.warning('Workers run one request at a time, admission control will never shed load')
+    # Move everything allocated so far out of the collector's reach: a
+    # collection in a worker would otherwise write to (and so copy) the
+    # shared pages of every object it visits
+    gc.freeze()
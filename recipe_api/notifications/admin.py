@@ -1,3 +1,36 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 
-# Register your models here.
+from recipe_api.admin import EfficientChangeListMixin
+
+from .models import Notification
+
+
+@admin.register(Notification)
+class NotificationAdmin(EfficientChangeListMixin, admin.ModelAdmin):
+    # Notification.__str__ (used by the row checkboxes) resolves the generic
+    # target; get_queryset resolves the targets with one query per target model
+    list_display = ('id', 'recipient', 'actor', 'verb', 'content_type', 'object_id', 'timestamp', 'read')
+    list_select_related = ('recipient', 'actor', 'content_type')
+    list_filter = ('read',)
+    search_fields = ('^recipient__username', '^actor__username')
+    autocomplete_fields = ('recipient', 'actor')
+    ordering = ('-pk',)
+    actions = ['mark_read', 'mark_unread', 'delete_selected_notifications']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_targets()
+
+    @admin.action(permissions=['change'], description='Mark selected notifications as read')
+    def mark_read(self, request, queryset):
+        updated = queryset.update(read=True)
+        self.message_user(request, f'Marked {updated} notification(s) as read.', messages.SUCCESS)
+
+    @admin.action(permissions=['change'], description='Mark selected notifications as unread')
+    def mark_unread(self, request, queryset):
+        updated = queryset.update(read=False)
+        self.message_user(request, f'Marked {updated} notification(s) as unread.', messages.SUCCESS)
+
+    @admin.action(permissions=['delete'], description='Delete selected notifications')
+    def delete_selected_notifications(self, request, queryset):
+        deleted = queryset._raw_delete(queryset.db)
+        self.message_user(request, f'Deleted {deleted} notification(s).', messages.SUCCESS)
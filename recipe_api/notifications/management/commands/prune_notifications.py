@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from notifications.retention import apply_retention
+
+
+class Command(BaseCommand):
+    """
+    Apply the notification retention policy (NOTIFICATION_RETENTION in
+    settings.py): delete notifications past the TTL of their verb and archive
+    old read ones. Meant to run periodically, e.g. hourly from cron.
+    """
+    help = 'Expire old notifications and archive old read ones, in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Rows per statement, NOTIFICATION_RETENTION["BATCH_SIZE"] by default.')
+
+    def handle(self, *args, **options):
+        def progress(action, count):
+            if options['verbosity'] > 1:
+                self.stdout.write(f'  {action} {count} so far')
+
+        deleted, archived = apply_retention(batch_size=options['batch_size'], progress=progress)
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {deleted} expired notification(s), archived {archived} read notification(s).'))
@@ -1,10 +1,33 @@
 from django.db import models
-from django.db import models
 from django.conf import settings
 from django.utils import timezone
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 
+
+class TargetForeignKey(GenericForeignKey):
+    """
+    Generic foreign key whose prefetch_related() lookup also joins the foreign
+    keys of the targets, which their __str__ often follows. Like any generic
+    foreign key it costs one query per target model, and targets that no
+    longer exist resolve to None.
+    """
+
+    def get_prefetch_querysets(self, instances, querysets=None):
+        if querysets is None:
+            ct_attname = self.model._meta.get_field(self.ct_field).attname
+            content_type_ids = {getattr(instance, ct_attname) for instance in instances} - {None}
+            target_models = {ContentType.objects.get_for_id(content_type_id).model_class() for content_type_id in content_type_ids}
+            querysets = [model._base_manager.select_related() for model in target_models if model is not None]
+        return super().get_prefetch_querysets(instances, querysets)
+
+
+class NotificationQuerySet(models.QuerySet):
+    def with_targets(self):
+        """Fetch the targets of the notifications in batch, see TargetForeignKey."""
+        return self.prefetch_related('target')
+
+
 class Notification(models.Model):
     recipient = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='notifications_receiver')
     actor = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='notifications_sender')
@@ -12,10 +35,45 @@ class Notification(models.Model):
 
     content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
     object_id = models.PositiveIntegerField()
-    target = GenericForeignKey('content_type', 'object_id')
+    target = TargetForeignKey('content_type', 'object_id')
     timestamp = models.DateTimeField(default=timezone.now)
     read = models.BooleanField(default=False)
 
+    objects = NotificationQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Finding the notifications about an object, e.g. when it is deleted
+            models.Index(fields=['content_type', 'object_id'], name='notification_target_idx'),
+            # A user's inbox, newest first
+            models.Index(fields=['recipient', '-timestamp'], name='notification_inbox_idx'),
+            # Retention, see notifications/retention.py
+            models.Index(fields=['timestamp'], name='notification_timestamp_idx'),
+        ]
+
     def __str__(self):
         return f"{self.actor} {self.verb}, {self.target}"
 
+
+class ArchivedNotification(models.Model):
+    """
+        Read notifications moved out of the Notification table once they are old
+        enough (see notifications/retention.py), keeping that table small. Only
+        the columns needed to show or audit them are kept.
+    """
+
+    recipient = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+', db_index=False)
+    actor_id = models.BigIntegerField()# Plain id, the actor may be deleted independently
+    verb = models.CharField(max_length=50)
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE, related_name='+')
+    object_id = models.PositiveIntegerField()
+    timestamp = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['recipient', '-timestamp'], name='archive_inbox_idx'),
+            models.Index(fields=['timestamp'], name='archive_timestamp_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.actor_id} {self.verb} ({self.timestamp:%Y-%m-%d})"
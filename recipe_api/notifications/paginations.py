@@ -0,0 +1,5 @@
+from rest_framework.pagination import PageNumberPagination
+
+class NotificationPagination(PageNumberPagination):
+    """Paginate the notifications of the inbox to a limit of 50 per page."""
+    page_size = 50
@@ -0,0 +1,96 @@
+"""
+Notification retention.
+
+The Notification table only keeps what inboxes need. Read notifications
+older than NOTIFICATION_RETENTION['ARCHIVE_READ_AFTER'] are moved to the
+ArchivedNotification table, and notifications of any state older than the
+TTL of their verb (TTL, or DEFAULT_TTL for verbs not listed; None keeps them
+forever) are deleted from both tables.
+
+Rows are moved and deleted in batches of BATCH_SIZE ids, each in its own
+short transaction, so the job never holds long locks and can be interrupted
+and rerun at any time. Both tables are indexed on timestamp, which every
+batch selects on.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ArchivedNotification, Notification
+
+DEFAULTS = {
+    'ARCHIVE_READ_AFTER': timedelta(days=30),
+    'TTL': {},
+    'DEFAULT_TTL': timedelta(days=365),
+    'BATCH_SIZE': 1000,
+}
+
+ARCHIVED_FIELDS = ['recipient_id', 'actor_id', 'verb', 'content_type_id', 'object_id', 'timestamp']
+
+
+def get_setting(name):
+    return getattr(settings, 'NOTIFICATION_RETENTION', {}).get(name, DEFAULTS[name])
+
+
+def _batches(queryset, batch_size):
+    """Yield lists of at most batch_size ids of the queryset until it is empty."""
+    while True:
+        ids = list(queryset.order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if ids:
+            yield ids
+        if len(ids) < batch_size:
+            return
+
+
+def archive_read(now=None, batch_size=None, progress=None):
+    """Move read notifications older than ARCHIVE_READ_AFTER to the archive. Returns the number moved."""
+    now = now or timezone.now()
+    batch_size = batch_size or get_setting('BATCH_SIZE')
+    queryset = Notification.objects.filter(read=True, timestamp__lt=now - get_setting('ARCHIVE_READ_AFTER'))
+    moved = 0
+    for ids in _batches(queryset, batch_size):
+        with transaction.atomic():
+            batch = Notification.objects.filter(pk__in=ids)
+            ArchivedNotification.objects.bulk_create(
+                [ArchivedNotification(**row) for row in batch.values(*ARCHIVED_FIELDS)])
+            moved += batch._raw_delete(batch.db)
+        if progress is not None:
+            progress('archived', moved)
+    return moved
+
+
+def expiry_filters(now):
+    """Yield the (filter kwargs, exclude kwargs) selecting the expired rows of every verb."""
+    ttl = get_setting('TTL')
+    for verb, lifetime in ttl.items():
+        if lifetime is not None:
+            yield {'verb': verb, 'timestamp__lt': now - lifetime}, {}
+    default = get_setting('DEFAULT_TTL')
+    if default is not None:
+        yield {'timestamp__lt': now - default}, {'verb__in': list(ttl)}
+
+
+def expire(now=None, batch_size=None, progress=None):
+    """Delete the notifications and archived notifications past their TTL. Returns the number deleted."""
+    now = now or timezone.now()
+    batch_size = batch_size or get_setting('BATCH_SIZE')
+    deleted = 0
+    for model in (Notification, ArchivedNotification):
+        for filters, excludes in expiry_filters(now):
+            queryset = model.objects.filter(**filters).exclude(**excludes)
+            for ids in _batches(queryset, batch_size):
+                batch = model.objects.filter(pk__in=ids)
+                deleted += batch._raw_delete(batch.db)
+                if progress is not None:
+                    progress('expired', deleted)
+    return deleted
+
+
+def apply_retention(now=None, batch_size=None, progress=None):
+    """Expire, then archive. Returns the numbers of (deleted, archived) rows."""
+    now = now or timezone.now()
+    deleted = expire(now, batch_size, progress)
+    archived = archive_read(now, batch_size, progress)
+    return deleted, archived
@@ -0,0 +1,27 @@
+from django.contrib.contenttypes.models import ContentType
+from rest_framework import serializers
+
+from .models import Notification
+
+
+class NotificationSerializer(serializers.ModelSerializer):
+    """
+    Serializer of a notification in the user's inbox. Expects the actor to be
+    selected and the targets resolved with Notification.objects.with_targets().
+    """
+    actor = serializers.CharField(source='actor.username', read_only=True)
+    target_type = serializers.SerializerMethodField()
+    target = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Notification
+        fields = ['id', 'actor', 'verb', 'target_type', 'object_id', 'target', 'timestamp', 'read']
+        read_only_fields = fields
+
+    def get_target_type(self, obj):
+        # get_for_id is cached, unlike obj.content_type
+        return ContentType.objects.get_for_id(obj.content_type_id).model
+
+    def get_target(self, obj):
+        target = obj.target
+        return None if target is None else str(target)
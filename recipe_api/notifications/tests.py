@@ -1,3 +1,167 @@
-from django.test import TestCase
+from datetime import timedelta
+from io import StringIO
 
-# Create your tests here.
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from accounts.models import CustomUser
+from recipes.models import RateAndReview, Recipe
+
+from .models import ArchivedNotification, Notification
+from .retention import apply_retention, archive_read, expire
+
+
+def notify(recipient, actor, verb, target, **fields):
+    return Notification.objects.create(
+        recipient=recipient, actor=actor, verb=verb,
+        content_type=ContentType.objects.get_for_model(target), object_id=target.pk, **fields
+    )
+
+
+@override_settings(ADMISSION_CONTROL={'ENABLED': False}, SECURE_SSL_REDIRECT=False)
+class InboxTests(TestCase):
+    """An inbox page costs the same number of queries whatever its targets."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(username='cook', email='cook@example.com')
+        cls.fans = [
+            CustomUser.objects.create_user(username=f'fan{i}', email=f'fan{i}@example.com') for i in range(4)
+        ]
+        cls.recipe = Recipe.objects.create(
+            creator=cls.user, title='Pancakes', ingredients=['2 eggs'], instructions='Mix and fry.',
+            category='breakfast', preparation_time=10, cooking_time=15, servings=4,
+        )
+        for fan in cls.fans:
+            review = RateAndReview.objects.create(user=fan, recipe=cls.recipe, rating=5)
+            notify(cls.user, fan, 'started following you', cls.user)
+            notify(cls.user, fan, 'favorited your recipe', cls.recipe)
+            notify(cls.user, fan, 'reviewed your recipe', review)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        # Warm the content type cache, as in a running server
+        ContentType.objects.get_for_models(CustomUser, Recipe, RateAndReview)
+
+    def get_inbox(self):
+        response = self.client.get('/accounts/notifications/')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_page_of_mixed_targets(self):
+        # Count, page with the actors, then one query per target model
+        with self.assertNumQueries(5):
+            results = self.get_inbox()
+        self.assertEqual(len(results), 12)
+        targets = {(item['target_type'], item['target']) for item in results}
+        self.assertIn(('customuser', str(self.user)), targets)
+        self.assertIn(('recipe', 'Pancakes'), targets)
+        self.assertIn(('rateandreview', 'fan0 reviewed Pancakes - Rating: 5'), targets)
+
+        # More notifications of the same target models cost no more queries
+        fan = CustomUser.objects.create_user(username='fan9', email='fan9@example.com')
+        notify(self.user, fan, 'reviewed your recipe', RateAndReview.objects.create(user=fan, recipe=self.recipe, rating=3))
+        with self.assertNumQueries(5):
+            self.assertEqual(len(self.get_inbox()), 13)
+
+    def test_deleted_target(self):
+        review = RateAndReview.objects.get(user=self.fans[0])
+        RateAndReview.objects.filter(pk=review.pk).delete()
+        results = self.get_inbox()
+        self.assertIn(
+            (review.pk, None),
+            [(item['object_id'], item['target']) for item in results if item['target_type'] == 'rateandreview'],
+        )
+
+
+@override_settings(NOTIFICATION_RETENTION={
+    'ARCHIVE_READ_AFTER': timedelta(days=30),
+    'TTL': {'started following you': timedelta(days=180), 'liked your comment': None},
+    'DEFAULT_TTL': timedelta(days=365),
+    'BATCH_SIZE': 1000,
+})
+class RetentionTests(TestCase):
+    """Old read notifications are archived and notifications past their TTL deleted, in batches."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(username='cook', email='cook@example.com')
+        cls.fan = CustomUser.objects.create_user(username='fan', email='fan@example.com')
+        cls.now = timezone.now()
+
+    def notify(self, verb, age, read=False):
+        return notify(self.user, self.fan, verb, self.user, timestamp=self.now - age, read=read)
+
+    def remaining(self, model=Notification):
+        return sorted(model.objects.values_list('verb', 'timestamp'))
+
+    def test_archive_read(self):
+        old_read = self.notify('favorited your recipe', timedelta(days=31), read=True)
+        self.notify('favorited your recipe', timedelta(days=31))
+        self.notify('favorited your recipe', timedelta(days=29), read=True)
+        self.notify('favorited your recipe', timedelta(days=30), read=True)
+
+        self.assertEqual(archive_read(self.now), 1)
+        archived = ArchivedNotification.objects.get()
+        self.assertEqual(
+            (archived.recipient_id, archived.actor_id, archived.verb, archived.content_type_id, archived.object_id, archived.timestamp),
+            (self.user.pk, self.fan.pk, old_read.verb, old_read.content_type_id, old_read.object_id, old_read.timestamp),
+        )
+        self.assertFalse(Notification.objects.filter(pk=old_read.pk).exists())
+        self.assertEqual(Notification.objects.count(), 3)
+
+    def test_expiry_cutoffs(self):
+        self.notify('started following you', timedelta(days=181))
+        kept_follow = self.notify('started following you', timedelta(days=180))
+        self.notify('reviewed your recipe', timedelta(days=366))
+        kept_review = self.notify('reviewed your recipe', timedelta(days=364))
+        # Verbs with a TTL of None are kept forever
+        kept_like = self.notify('liked your comment', timedelta(days=1000))
+        ArchivedNotification.objects.bulk_create([
+            ArchivedNotification(recipient=self.user, actor_id=self.fan.pk, verb=verb, content_type_id=kept_follow.content_type_id,
+                                 object_id=self.user.pk, timestamp=self.now - timedelta(days=days))
+            for verb, days in [('started following you', 200), ('started following you', 100), ('reviewed your recipe', 400)]
+        ])
+
+        self.assertEqual(expire(self.now), 4)
+        self.assertEqual(self.remaining(), sorted(
+            (notification.verb, notification.timestamp) for notification in [kept_follow, kept_review, kept_like]))
+        self.assertEqual(self.remaining(ArchivedNotification), [('started following you', self.now - timedelta(days=100))])
+
+    def test_expired_before_archived(self):
+        self.notify('started following you', timedelta(days=200), read=True)
+        self.notify('reviewed your recipe', timedelta(days=200), read=True)
+        self.assertEqual(apply_retention(self.now), (1, 1))
+        self.assertEqual(self.remaining(ArchivedNotification), [('reviewed your recipe', self.now - timedelta(days=200))])
+        self.assertFalse(Notification.objects.exists())
+
+    def test_batch_boundaries(self):
+        for size, expected in [(4, [2, 4]), (5, [2, 4, 5])]:
+            with self.subTest(size=size):
+                for day in range(size):
+                    self.notify('favorited your recipe', timedelta(days=40 + day), read=True)
+                progress = []
+                # Per batch: the ids, a savepoint, the rows, the insert, the delete and the release;
+                # a last full batch is followed by one more (empty) select of ids
+                with self.assertNumQueries(len(expected) * 6 + (size % 2 == 0)):
+                    moved = archive_read(self.now, batch_size=2, progress=lambda action, count: progress.append(count))
+                self.assertEqual((moved, progress), (size, expected))
+                self.assertFalse(Notification.objects.exists())
+                ArchivedNotification.objects.all().delete()
+
+    def test_prune_notifications_command(self):
+        self.notify('reviewed your recipe', timedelta(days=400))
+        for day in range(3):
+            self.notify('favorited your recipe', timedelta(days=40 + day), read=True)
+        out = StringIO()
+        call_command('prune_notifications', '--batch-size', '2', verbosity=2, stdout=out)
+        self.assertEqual(out.getvalue().splitlines(), [
+            '  expired 1 so far',
+            '  archived 2 so far',
+            '  archived 3 so far',
+            'Deleted 1 expired notification(s), archived 3 read notification(s).',
+        ])
@@ -1,3 +1,23 @@
-from django.shortcuts import render
+from rest_framework import generics, permissions
 
-# Create your views here.
+from .models import Notification
+from .paginations import NotificationPagination
+from .serializers import NotificationSerializer
+
+
+class NotificationListView(generics.ListAPIView):
+    """
+    The current user's notifications, newest first; ?unread=true keeps the
+    unread ones. A page costs a fixed number of queries whatever its targets:
+    the actors are joined and the targets fetched with one query per target model.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    serializer_class = NotificationSerializer
+    pagination_class = NotificationPagination
+
+    def get_queryset(self):
+        queryset = (Notification.objects.filter(recipient=self.request.user)
+                    .select_related('actor').with_targets().order_by('-timestamp', '-id'))
+        if self.request.query_params.get('unread') in ('true', '1'):
+            queryset = queryset.filter(read=False)
+        return queryset
@@ -0,0 +1,18 @@
+from recipe_api.paginators import EstimatedCountPaginator
+
+
+class EfficientChangeListMixin:
+    """
+    Changelist settings shared by the admins of large tables: estimated total
+    counts and no second COUNT(*) for the "show all" link. The default delete
+    action, which loads every related object for its confirmation page, is
+    removed; admins offer their own single statement delete action instead.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        actions.pop('delete_selected', None)
+        return actions
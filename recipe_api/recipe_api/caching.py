@@ -0,0 +1,12 @@
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+
+def is_process_local(alias):
+    """
+    Whether the cache with the given alias is private to the process (local
+    memory, or the dummy cache that keeps nothing), so values set by one
+    worker are never seen by the others.
+    """
+    return isinstance(caches[alias], (LocMemCache, DummyCache))
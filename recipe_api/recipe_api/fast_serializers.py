@@ -0,0 +1,159 @@
+"""
+Read-only fast path for list responses.
+
+A FastSerializer mirrors the output of an existing ModelSerializer but builds
+each row straight from a ``values_list()`` tuple, skipping model instance
+creation and the per-field ``get_attribute``/``to_representation`` machinery
+of DRF. The accessors are compiled once per class from the ModelSerializer's
+own fields, so both serializers stay in sync and produce identical payloads.
+"""
+from django.core.exceptions import ImproperlyConfigured
+from django.db import models
+from rest_framework import serializers
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from .instrumentation import measure
+
+# Serializer fields whose representation of a database value is the value itself.
+IDENTITY_FIELDS = (
+    serializers.BooleanField,
+    serializers.CharField,
+    serializers.ChoiceField,
+    serializers.IntegerField,
+    serializers.JSONField,
+    serializers.PrimaryKeyRelatedField,
+)
+
+
+class FastSerializer:
+    """
+    Base class for read-only list serializers built from ``values_list()`` rows.
+
+    Subclasses set ``serializer_class`` to the ModelSerializer they mirror.
+    """
+
+    serializer_class = None
+
+    _compiled = None
+
+    def __init__(self, rows, context=None, fields=None, extra=()):
+        self.rows = rows
+        self.context = context or {}
+        self.fields = fields
+        # Names of annotations selected after the serializer's columns, output as they are
+        self.extra = tuple(extra)
+
+    @classmethod
+    def compile(cls):
+        """
+        Return the (field name, column, converter) accessors for this class,
+        building them from the mirrored serializer on first use.
+        """
+        if cls.__dict__.get('_compiled') is None:
+            serializer = cls.serializer_class()
+            model = cls.serializer_class.Meta.model
+            accessors = []
+            for name, field in serializer.fields.items():
+                if field.write_only:
+                    continue
+                if isinstance(field, serializers.FileField):
+                    converter = ('file', model._meta.get_field(field.source).storage)
+                elif isinstance(field, IDENTITY_FIELDS):
+                    converter = None
+                elif isinstance(field, (serializers.DateField, serializers.DateTimeField)):
+                    converter = field.to_representation
+                else:
+                    raise ImproperlyConfigured(
+                        f'{cls.__name__} cannot build {name!r} ({type(field).__name__}) from database values.'
+                    )
+                if field.source == '*' or '.' in field.source:
+                    raise ImproperlyConfigured(f'{cls.__name__} cannot read source {field.source!r} of {name!r}.')
+                accessors.append((name, field.source, converter))
+            cls._compiled = tuple(accessors)
+        return cls._compiled
+
+    @classmethod
+    def accessors(cls, fields=None):
+        """Return the compiled accessors, limited to the given field names if any."""
+        if fields is None:
+            return cls.compile()
+        return tuple(accessor for accessor in cls.compile() if accessor[0] in fields)
+
+    @classmethod
+    def columns(cls, fields=None):
+        return [column for _, column, _ in cls.accessors(fields)]
+
+    @classmethod
+    def get_rows(cls, queryset, fields=None, extra=()):
+        """
+        Turn a queryset into the row tuples this serializer reads, selecting only
+        the needed columns followed by the extra annotations.
+        """
+        return queryset.values_list(*cls.columns(fields), *extra)
+
+    def file_url(self, storage):
+        """Mirror serializers.FileField.to_representation for a stored file name."""
+        request = self.context.get('request', None)
+
+        def convert(name):
+            if not name:
+                return None
+            if not api_settings.UPLOADED_FILES_USE_URL:
+                return name
+            url = storage.url(name)
+            if request is not None:
+                return request.build_absolute_uri(url)
+            return url
+        return convert
+
+    @property
+    def data(self):
+        accessors = []
+        for index, (name, _, converter) in enumerate(self.accessors(self.fields)):
+            if isinstance(converter, tuple):
+                converter = self.file_url(converter[1])
+            accessors.append((name, index, converter))
+        for name in self.extra:
+            accessors.append((name, len(accessors), None))
+
+        with measure('serialize'):
+            data = []
+            for row in self.rows:
+                item = {}
+                for name, index, converter in accessors:
+                    value = row[index]
+                    if converter is not None and value is not None:
+                        value = converter(value)
+                    item[name] = value
+                data.append(item)
+        return data
+
+
+class FastListMixin:
+    """
+    View mixin that serves the ``list`` action through ``fast_serializer_class``
+    while every other action keeps using the regular serializer.
+    """
+
+    fast_serializer_class = None
+
+    def get_fast_rows(self, queryset, **kwargs):
+        return self.fast_serializer_class.get_rows(queryset, **kwargs)
+
+    def get_fast_serializer(self, rows, **kwargs):
+        return self.fast_serializer_class(rows, context=self.get_serializer_context(), **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        if self.fast_serializer_class is None:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        if isinstance(queryset, models.Manager):
+            queryset = queryset.all()
+        rows = self.get_fast_rows(queryset)
+
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(self.get_fast_serializer(page).data)
+        return Response(self.get_fast_serializer(rows).data)
@@ -0,0 +1,248 @@
+"""
+Per-request instrumentation shared by the instrumentation middleware, the
+metrics endpoint and the serializers.
+
+The middleware opens a RequestMetrics for every request and stores it in a
+context variable, so any code running inside the request (database wrappers,
+serializers) can add timings to it without having the request passed around.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from rest_framework import serializers
+
+DEFAULTS = {
+    'ENABLED': False,
+    'SERVER_TIMING': True,
+    'PROFILE_SAMPLE_RATE': 0.0,
+    'PROFILE_TOP_N': 25,
+    'PROFILE_DIR': None,
+    'METRICS_TOKEN': None,
+    'MULTIPROCESS_DIR': None,
+    'DURATION_BUCKETS': (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+    'QUERY_BUCKETS': (1, 2, 5, 10, 20, 50, 100, 200),
+    'SIZE_BUCKETS': (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304),
+}
+
+
+def get_setting(name):
+    """Return an instrumentation setting, falling back to the defaults above."""
+    return getattr(settings, 'INSTRUMENTATION', {}).get(name, DEFAULTS[name])
+
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """Timings collected while a single request is being handled."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_time = 0.0
+        self.query_count = 0
+        self.timings = {}
+
+    def add(self, name, duration):
+        self.timings[name] = self.timings.get(name, 0.0) + duration
+
+    def record_query(self, execute, sql, params, many, context):
+        """Database execute wrapper that times every query run by the request."""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.query_count += 1
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+
+def clear_multiprocess_dir():
+    """Remove the histogram files of previous server runs from MULTIPROCESS_DIR."""
+    directory = get_setting('MULTIPROCESS_DIR')
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    for entry in os.scandir(directory):
+        if entry.name.endswith(('.json', '.tmp')):
+            os.remove(entry.path)
+
+
+def start_request():
+    """Open a RequestMetrics for the current context and return it with its reset token."""
+    metrics = RequestMetrics()
+    return metrics, _current.set(metrics)
+
+
+def finish_request(token):
+    _current.reset(token)
+
+
+def current_metrics():
+    """Return the RequestMetrics of the running request, or None outside of one."""
+    return _current.get()
+
+
+@contextmanager
+def measure(name):
+    """Add the time spent in the block to the running request under the given name."""
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add(name, time.perf_counter() - start)
+
+
+class Histogram:
+    """A Prometheus style cumulative histogram."""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+        self.total += 1
+        self.sum += value
+
+
+class MetricsRegistry:
+    """
+    Process wide store of the request histograms, keyed by metric and route name.
+
+    Every worker process has its own registry. With MULTIPROCESS_DIR set,
+    each process also writes its histograms to <MULTIPROCESS_DIR>/<pid>.json
+    after every request, and render() sums the files of all processes, so
+    a scrape reaching any worker sees the totals of the whole server. The
+    files of exited workers keep counting; clear the directory when the
+    server starts (gunicorn.conf.py does). Without MULTIPROCESS_DIR,
+    /metrics/ only reports the worker that served the scrape.
+    """
+
+    METRICS = {
+        'http_request_duration_seconds': ('Wall time spent handling the request.', 'DURATION_BUCKETS'),
+        'http_request_db_duration_seconds': ('Time spent waiting on the database.', 'DURATION_BUCKETS'),
+        'http_request_serialize_duration_seconds': ('Time spent serializing response data.', 'DURATION_BUCKETS'),
+        'http_request_queries': ('Number of database queries run by the request.', 'QUERY_BUCKETS'),
+        'http_response_size_bytes': ('Size of the response body in bytes.', 'SIZE_BUCKETS'),
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+
+    def observe(self, route, metrics, response_size):
+        values = {
+            'http_request_duration_seconds': metrics.elapsed,
+            'http_request_db_duration_seconds': metrics.db_time,
+            'http_request_serialize_duration_seconds': metrics.timings.get('serialize', 0.0),
+            'http_request_queries': metrics.query_count,
+            'http_response_size_bytes': response_size,
+        }
+        with self._lock:
+            for name, value in values.items():
+                key = (name, route)
+                histogram = self._histograms.get(key)
+                if histogram is None:
+                    histogram = self._histograms[key] = Histogram(get_setting(self.METRICS[name][1]))
+                histogram.observe(value)
+            if get_setting('MULTIPROCESS_DIR'):
+                self.dump(self.snapshot())
+
+    def snapshot(self):
+        return [
+            [name, route, list(histogram.buckets), histogram.counts[:], histogram.total, histogram.sum]
+            for (name, route), histogram in self._histograms.items()
+        ]
+
+    def dump(self, snapshot):
+        # Called with the lock held, so snapshots are written in order
+        directory = get_setting('MULTIPROCESS_DIR')
+        path = os.path.join(directory, f'{os.getpid()}.json')
+        temporary = f'{path}.tmp'
+        with open(temporary, 'w') as file:
+            json.dump(snapshot, file)
+        os.replace(temporary, path)
+
+    def collect(self):
+        """Return the histograms to report: this process' own, or the sum over all processes."""
+        directory = get_setting('MULTIPROCESS_DIR')
+        if not directory:
+            with self._lock:
+                snapshots = [self.snapshot()]
+        else:
+            snapshots = []
+            for entry in os.scandir(directory):
+                if not entry.name.endswith('.json'):
+                    continue
+                try:
+                    with open(entry.path) as file:
+                        snapshots.append(json.load(file))
+                except (OSError, ValueError):
+                    continue
+
+        histograms = {}
+        for snapshot in snapshots:
+            for name, route, buckets, counts, total, value_sum in snapshot:
+                histogram = histograms.get((name, route))
+                if histogram is None:
+                    histogram = histograms[(name, route)] = Histogram(buckets)
+                if histogram.buckets != tuple(buckets):
+                    continue
+                histogram.counts = [a + b for a, b in zip(histogram.counts, counts)]
+                histogram.total += total
+                histogram.sum += value_sum
+        return histograms
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def render(self):
+        """Return every histogram in the Prometheus text exposition format."""
+        lines = []
+        histograms = self.collect()
+        for name, (help_text, _) in self.METRICS.items():
+            routes = sorted(route for metric, route in histograms if metric == name)
+            if not routes:
+                continue
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} histogram')
+            for route in routes:
+                histogram = histograms[(name, route)]
+                label = route.replace('\\', '\\\\').replace('"', '\\"')
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    lines.append(f'{name}_bucket{{route="{label}",le="{bound}"}} {count}')
+                lines.append(f'{name}_bucket{{route="{label}",le="+Inf"}} {histogram.total}')
+                lines.append(f'{name}_sum{{route="{label}"}} {histogram.sum}')
+                lines.append(f'{name}_count{{route="{label}"}} {histogram.total}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+class TimedListSerializer(serializers.ListSerializer):
+    """
+    List serializer that reports the time spent building list payloads as the
+    'serialize' timing of the running request.
+    """
+
+    def to_representation(self, data):
+        with measure('serialize'):
+            return super().to_representation(data)
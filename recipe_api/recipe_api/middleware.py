@@ -0,0 +1,215 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+import random
+import secrets
+import time
+from contextlib import ExitStack
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import JsonResponse
+from django.middleware.gzip import GZipMiddleware, re_accepts_gzip
+from django.utils.cache import patch_vary_headers
+
+from . import instrumentation, throttling
+from .instrumentation import get_setting
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+
+class InstrumentationMiddleware:
+    """
+    Opt-in middleware recording wall time, database time, query count,
+    serializer time and response size for every request.
+
+    The timings are added to the response as a Server-Timing header and fed
+    into the histograms served by the metrics endpoint. A configurable
+    fraction of requests is run under cProfile and its top stacks are logged.
+    Enable it with INSTRUMENTATION['ENABLED'] in the settings.
+    """
+
+    def __init__(self, get_response):
+        if not get_setting('ENABLED'):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics, token = instrumentation.start_request()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(metrics.record_query))
+                response = self._handle(request)
+        finally:
+            instrumentation.finish_request(token)
+
+        size = 0 if response.streaming else len(response.content)
+        match = getattr(request, 'resolver_match', None)
+        route = match.view_name if match is not None else 'unresolved'
+        instrumentation.registry.observe(route, metrics, size)
+
+        if get_setting('SERVER_TIMING'):
+            response['Server-Timing'] = self._server_timing(metrics)
+        return response
+
+    def process_template_response(self, request, response):
+        """Time the rendering of DRF responses, which happens after the view returns."""
+        metrics = instrumentation.current_metrics()
+        if metrics is not None:
+            started = time.perf_counter()
+            response.add_post_render_callback(
+                lambda rendered: metrics.add('render', time.perf_counter() - started)
+            )
+        return response
+
+    def _handle(self, request):
+        rate = get_setting('PROFILE_SAMPLE_RATE')
+        if not rate or random.random() >= rate:
+            return self.get_response(request)
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            return self.get_response(request)
+        finally:
+            profiler.disable()
+            self._dump_profile(request, profiler)
+
+    def _dump_profile(self, request, profiler):
+        stream = io.StringIO()
+        stats = pstats.Stats(profiler, stream=stream).sort_stats('cumulative')
+        stats.print_stats(get_setting('PROFILE_TOP_N'))
+        logger.info('Profile for %s %s\n%s', request.method, request.path, stream.getvalue())
+
+        profile_dir = get_setting('PROFILE_DIR')
+        if profile_dir:
+            os.makedirs(profile_dir, exist_ok=True)
+            filename = f'{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}-{random.randrange(1 << 32):08x}.prof'
+            stats.dump_stats(os.path.join(profile_dir, filename))
+
+    @staticmethod
+    def _server_timing(metrics):
+        entries = [f'db;desc="{metrics.query_count} queries";dur={metrics.db_time * 1000:.2f}']
+        for name, duration in metrics.timings.items():
+            entries.append(f'{name};dur={duration * 1000:.2f}')
+        entries.append(f'total;dur={metrics.elapsed * 1000:.2f}')
+        return ', '.join(entries)
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    Negotiated response compression for the API.
+
+    Responses smaller than RESPONSE_COMPRESSION['MIN_SIZE'] bytes and already
+    compressed media types are sent as they are. Otherwise brotli is used when
+    the client accepts it and the brotli package is installed, and gzip (through
+    Django's GZipMiddleware) when it is not.
+
+    Both encodings randomize the response length against BREACH-style attacks
+    (guessing secrets in a response from its compressed size): gzip through
+    Django's random bytes in the gzip header, brotli, whose format has no such
+    field, through a header of max_random_bytes random length.
+    """
+
+    # Media types that are already compressed and would only cost CPU
+    skip_content_types = ('image/', 'video/', 'audio/', 'font/woff', 'application/zip', 'application/gzip')
+
+    def process_response(self, request, response):
+        options = getattr(settings, 'RESPONSE_COMPRESSION', {})
+        if response.has_header('Content-Encoding'):
+            return response
+        if not response.streaming and len(response.content) < options.get('MIN_SIZE', 1024):
+            return response
+        content_type = response.get('Content-Type', '')
+        if content_type.startswith(self.skip_content_types) and not content_type.startswith('image/svg'):
+            return response
+
+        accepted = self.accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if brotli is not None and accepted.get('br', 0) > 0 and not response.streaming:
+            patch_vary_headers(response, ('Accept-Encoding',))
+            compressed_content = brotli.compress(response.content, quality=options.get('BROTLI_QUALITY', 5))
+            if len(compressed_content) >= len(response.content):
+                return response
+            response.content = compressed_content
+            response.headers['Content-Length'] = str(len(response.content))
+            etag = response.get('ETag')
+            if etag and etag.startswith('"'):
+                response.headers['ETag'] = 'W/' + etag
+            response.headers['Content-Encoding'] = 'br'
+            length = secrets.randbelow(self.max_random_bytes) + 1
+            response.headers['X-Compression-Padding'] = secrets.token_urlsafe(self.max_random_bytes)[:length]
+            return response
+
+        if accepted.get('gzip', 0) <= 0:
+            patch_vary_headers(response, ('Accept-Encoding',))
+            return response
+        if not re_accepts_gzip.search(request.META.get('HTTP_ACCEPT_ENCODING', '')):
+            # Accepted through '*' or in upper case, which GZipMiddleware's
+            # search for a literal 'gzip' misses
+            request = SimpleNamespace(META={'HTTP_ACCEPT_ENCODING': 'gzip'})
+        return super().process_response(request, response)
+
+    @staticmethod
+    def accepted_encodings(header):
+        """Parse an Accept-Encoding header into a {coding: q-value} dict."""
+        accepted = {}
+        for item in header.split(','):
+            coding, _, params = item.strip().partition(';')
+            if not coding:
+                continue
+            quality = 1.0
+            params = params.strip()
+            if params.startswith('q='):
+                try:
+                    quality = float(params[2:])
+                except ValueError:
+                    quality = 0.0
+            accepted[coding.strip().lower()] = quality
+        if '*' in accepted:
+            for coding in ('br', 'gzip'):
+                accepted.setdefault(coding, accepted['*'])
+        return accepted
+
+
+class AdmissionControlMiddleware:
+    """
+    Shed load before it reaches the views when the worker is saturated.
+
+    Requests are refused with a 503 and a Retry-After header once the worker has
+    ADMISSION_CONTROL['MAX_IN_FLIGHT'] requests in progress. Expensive requests
+    (cost weight of at least EXPENSIVE_COST, e.g. searches) get a much smaller
+    share, MAX_EXPENSIVE_IN_FLIGHT, so a flood of searches cannot take the
+    capacity cheap routes need.
+    """
+
+    def __init__(self, get_response):
+        if not throttling.get_setting('ENABLED'):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            return self.get_response(request)
+        finally:
+            expensive = getattr(request, '_admitted_expensive', None)
+            if expensive is not None:
+                throttling.in_flight.leave(expensive)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        expensive = throttling.request_cost(request) >= throttling.get_setting('EXPENSIVE_COST')
+        if not throttling.in_flight.try_enter(expensive):
+            response = JsonResponse({'detail': 'The server is busy, please retry later.'}, status=503)
+            response['Retry-After'] = str(throttling.get_setting('RETRY_AFTER'))
+            return response
+        request._admitted_expensive = expensive
+        return None
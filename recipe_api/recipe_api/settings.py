@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
 import os
+from datetime import timedelta
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -45,7 +46,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'recipe_api.middleware.InstrumentationMiddleware',
+    'recipe_api.middleware.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'recipe_api.middleware.AdmissionControlMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -90,6 +95,28 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Token buckets, revoked JWTs, facet generations and cached recipes are shared between
+# the worker processes through the default cache, so production needs redis (REDIS_URL).
+# Without it every process keeps its own local memory cache, and the features relying on
+# a shared cache fall back to the database or are disabled (see their settings below).
+
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -109,6 +136,35 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Password hashing runs in a bounded process pool (see accounts/hashing.py).
+# Users are moved to the first hasher below, with these scrypt parameters, on their next login.
+PASSWORD_HASHERS = [
+    'accounts.hashers.TunedScryptPasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+]
+
+PASSWORD_HASHING = {
+    'WORKERS': 2,  # Hashing processes per server worker, 0 hashes on the request thread
+    'MAX_QUEUE': 16,  # Hashing jobs allowed to wait for a free process
+    'QUEUE_TIMEOUT': 2.0,  # Seconds to wait for a queue slot before answering 503
+    # Twice the memory of Django's defaults (N=2**14, r=8, p=5) for about the same CPU
+    # time: 128 * r * N = 32 MiB per hash, which needs a larger maxmem than OpenSSL's 32 MiB
+    'SCRYPT': {
+        'WORK_FACTOR': 2 ** 15,
+        'BLOCK_SIZE': 8,
+        'PARALLELISM': 2,
+        'MAXMEM': 64 * 1024 * 1024,
+    },
+}
+
+AUTHENTICATION_BACKENDS = [
+    'accounts.backends.OffloadedHashingBackend',
+]
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.1/topics/i18n/
 
@@ -129,13 +185,172 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
+# Uploaded recipe pictures and profile pictures
+MEDIA_URL = '/media/'
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+MEDIA_CACHE_MAX_AGE = 31536000  # One year, uploads are stored under content-hashed names
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'recipe_api.storage.HashedFileSystemStorage',
+    },
+    # Hashed static files with gzip (and brotli, when installed) versions built by collectstatic
+    'staticfiles': {
+        'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage',
+    },
+}
+
+# Keep serving static files that are missing from the manifest until collectstatic is rerun
+WHITENOISE_MANIFEST_STRICT = False
+
+# Negotiated brotli/gzip compression of API responses (see recipe_api/middleware.py)
+RESPONSE_COMPRESSION = {
+    'MIN_SIZE': 1024,  # Responses smaller than this many bytes are sent uncompressed
+    'BROTLI_QUALITY': 5,
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.TokenAuthentication',
+        'accounts.authentication.StatelessJWTAuthentication',
     ],
+    'DEFAULT_THROTTLE_CLASSES': [
+        'recipe_api.throttling.TokenBucketThrottle',
+    ],
+    # orjson backed JSON renderer, falls back to the stdlib encoder when orjson is not installed
+    'DEFAULT_RENDERER_CLASSES': [
+        'recipe_api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    # Number of reverse proxies in front of the server. Anonymous requests are
+    # throttled per client IP, taken from X-Forwarded-For behind that many proxies
+    # and from the connection (ignoring X-Forwarded-For, which clients can forge) at 0
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', 0)),
+}
+
+# Stateless JWT authentication, accepted side by side with the DB backed tokens.
+# LOGIN_TOKEN_TYPE picks what /accounts/login/ issues when the client does not
+# ask for a token_type: 'token' (DB backed) or 'jwt' (access/refresh pair).
+LOGIN_TOKEN_TYPE = 'token'
+
+SIMPLE_JWT = {
+    'ACCESS_TOKEN_LIFETIME': timedelta(minutes=5),
+    'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
+    'AUTH_HEADER_TYPES': ('Bearer',),
+    'UPDATE_LAST_LOGIN': False,
+}
+
+# Cache holding revoked JWTs. It must be shared by all workers: with a process-local
+# cache (local memory, e.g. without REDIS_URL) JWT login and refresh are refused and
+# Bearer tokens are not accepted, since a revocation would only reach one worker
+JWT_REVOCATION_CACHE = 'default'
+
+# Every recipe update is kept as a revision (see recipes/history.py)
+RECIPE_HISTORY = {
+    'SNAPSHOT_EVERY': 10,  # Store a full copy of every 10th version of a recipe, diffs in between
+}
+
+# Recipe facet counts are kept in memory by every worker (see recipes/facets.py) and
+# invalidated through a counter in this cache when it is shared between workers; with
+# a local memory cache the workers check the recipe table every CHECK_INTERVAL seconds
+FACETS = {
+    'CACHE': 'default',
+    'CHECK_INTERVAL': 5,
+}
+
+# New recipes whose estimated similarity (0 to 1) of ingredients and instructions with
+# an existing recipe reaches THRESHOLD are reported as possible duplicates (see recipes/dedup.py)
+RECIPE_DEDUP = {
+    'THRESHOLD': 0.7,
+}
+
+# Shopping lists merged from several recipes (see recipes/shopping.py) are cached
+# for TIMEOUT seconds per user and set of recipe versions
+SHOPPING_LIST = {
+    'CACHE': 'default',
+    'TIMEOUT': 600,
+    'MAX_RECIPES': 100,
+}
+
+# Recipe retrieves are cached in every worker for LOCAL_TIMEOUT seconds in front of this
+# cache, which holds them for TIMEOUT seconds and should be shared by all workers
+# (see recipes/cache.py); with a local memory cache every hit also reads the version column
+RECIPE_CACHE = {
+    'ENABLED': True,
+    'CACHE': 'default',
+    'TIMEOUT': 300,
+    'LOCAL_TIMEOUT': 5,
+}
+
+# Read notifications older than ARCHIVE_READ_AFTER are moved to an archive table, and
+# notifications older than the TTL of their verb (DEFAULT_TTL for other verbs, None to
+# keep them) are deleted, by manage.py prune_notifications (see notifications/retention.py)
+NOTIFICATION_RETENTION = {
+    'ARCHIVE_READ_AFTER': timedelta(days=30),
+    'TTL': {
+        'started following you': timedelta(days=180),
+    },
+    'DEFAULT_TTL': timedelta(days=365),
+    'BATCH_SIZE': 1000,
+}
+
+# Account deletion disables the user at once and removes its data in a background job
+# (see accounts/deletion.py). Interrupted jobs are resumed by manage.py process_account_deletions.
+ACCOUNT_DELETION = {
+    'BATCH_SIZE': 500,  # Rows per DELETE statement
+    'RUN_IN_BACKGROUND': True,  # Start the job in a thread of the worker that received the request
+}
+
+# Per-request profiling and query instrumentation (see recipe_api/middleware.py).
+# When enabled, responses carry a Server-Timing header and the histograms are
+# served at /metrics/ in the Prometheus text format.
+INSTRUMENTATION = {
+    'ENABLED': False,
+    'SERVER_TIMING': True,
+    'PROFILE_SAMPLE_RATE': 0.0,  # Fraction of requests to run under cProfile
+    'PROFILE_TOP_N': 25,
+    'PROFILE_DIR': None,  # Directory to dump sampled .prof files into
+    # /metrics/ is served to staff users, and to scrapers sending this token as a Bearer token
+    'METRICS_TOKEN': os.environ.get('METRICS_TOKEN'),
+    # Directory where every worker process writes its histograms, so /metrics/ reports
+    # the sum over all workers; None reports only the worker that answers the scrape
+    'MULTIPROCESS_DIR': os.environ.get('METRICS_MULTIPROCESS_DIR'),
+}
+
+# Request admission control (see recipe_api/throttling.py).
+# Every request takes COSTS[<url name>] tokens (DEFAULT_COST when the route is not
+# listed) from the bucket of its user, or of its IP address when anonymous.
+# Requests with a ?search= parameter are priced under '<url name>:search'.
+# The buckets live in CACHE: shared and atomic with redis, per worker with local memory.
+ADMISSION_CONTROL = {
+    'ENABLED': True,
+    'CACHE': 'default',
+    'RATES': {
+        'user': {'CAPACITY': 120, 'REFILL_RATE': 2.0},  # Burst size and tokens per second
+        'anon': {'CAPACITY': 60, 'REFILL_RATE': 1.0},
+    },
+    'DEFAULT_COST': 1,
+    'COSTS': {
+        'login': 5,
+        'register': 10,
+        'follow_user': 3,
+        'favorites-batch': 3,
+        'shopping-list': 3,
+        'recipe-list': 2,
+        'recipe-list:search': 10,
+    },
+    # Load shedding per worker process: requests costing EXPENSIVE_COST or more
+    # are limited to MAX_EXPENSIVE_IN_FLIGHT concurrent requests, everything to MAX_IN_FLIGHT.
+    # This needs workers handling several requests at once: gunicorn.conf.py runs gthread
+    # workers with GUNICORN_THREADS threads, of which expensive requests may take a quarter
+    # (a sync worker only ever has one request in flight and never sheds anything)
+    'EXPENSIVE_COST': 5,
+    'MAX_IN_FLIGHT': int(os.environ.get('GUNICORN_THREADS', 16)),
+    'MAX_EXPENSIVE_IN_FLIGHT': max(1, int(os.environ.get('GUNICORN_THREADS', 16)) // 4),
+    'RETRY_AFTER': 1,  # Seconds, sent with 503 responses
 }
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
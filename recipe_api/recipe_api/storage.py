@@ -0,0 +1,39 @@
+import hashlib
+import os
+import re
+
+from django.core.files.storage import FileSystemStorage
+
+
+class HashedFileSystemStorage(FileSystemStorage):
+    """
+    File system storage that names uploads after a hash of their content.
+
+    Identical uploads share one file and a stored file never changes under its
+    name, which lets the media view serve them with far-future cache headers.
+    """
+
+    hash_length = 32
+    hashed_name_re = re.compile(rf'[0-9a-f]{{{hash_length}}}(\.[^./]*)?')
+
+    @classmethod
+    def is_hashed_name(cls, name):
+        """Whether name is one this storage gives uploads, as opposed to a file stored before it was used."""
+        return cls.hashed_name_re.fullmatch(os.path.basename(name)) is not None
+
+    def hashed_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        return os.path.join(directory, digest.hexdigest()[:self.hash_length] + extension)
+
+    def _save(self, name, content):
+        name = self.hashed_name(name, content)
+        if self.exists(name):
+            # Same content was uploaded before, reuse the stored file
+            return name
+        return super()._save(name, content)
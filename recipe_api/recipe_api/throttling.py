@@ -0,0 +1,196 @@
+"""
+Request admission control: per-user/per-IP token buckets with per-route cost
+weights, and the in-flight counters used by AdmissionControlMiddleware to shed
+load when a worker gets too busy.
+"""
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.redis import RedisCache
+from rest_framework.throttling import BaseThrottle
+
+DEFAULTS = {
+    'ENABLED': True,
+    'CACHE': 'default',
+    'RATES': {
+        'user': {'CAPACITY': 120, 'REFILL_RATE': 2.0},
+        'anon': {'CAPACITY': 60, 'REFILL_RATE': 1.0},
+    },
+    'DEFAULT_COST': 1,
+    'COSTS': {},
+    'EXPENSIVE_COST': 5,
+    'MAX_IN_FLIGHT': 64,
+    'MAX_EXPENSIVE_IN_FLIGHT': 8,
+    'RETRY_AFTER': 1,
+}
+
+
+def get_setting(name):
+    """Return an admission control setting, falling back to the defaults above."""
+    return getattr(settings, 'ADMISSION_CONTROL', {}).get(name, DEFAULTS[name])
+
+
+def request_cost(request):
+    """
+    Return the cost weight of a request from ADMISSION_CONTROL['COSTS'].
+
+    Costs are keyed by route (URL) name. Requests carrying a ?search= parameter
+    are looked up under '<route name>:search' first, so searches can be priced
+    above plain listing.
+    """
+    costs = get_setting('COSTS')
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return get_setting('DEFAULT_COST')
+    if request.GET.get('search'):
+        cost = costs.get(f'{match.view_name}:search')
+        if cost is not None:
+            return cost
+    return costs.get(match.view_name, get_setting('DEFAULT_COST'))
+
+
+# Refill and take tokens from a bucket kept as a redis hash, in one atomic step.
+# Returns {allowed (0 or 1), tokens left}; the count is returned as a string
+# since redis truncates Lua numbers to integers.
+CONSUME_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local refill_rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local now = tonumber(ARGV[4])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or capacity
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * refill_rate)
+local allowed = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[5]))
+return {allowed, tostring(tokens)}
+"""
+
+
+class TokenBucketStore:
+    """
+    Token buckets kept in a Django cache.
+
+    Every bucket holds a number of tokens and the time it was last updated, and
+    is refilled lazily when it is read. With the redis cache the refill and
+    the spending run as one Lua script on the server, so all workers share each
+    bucket exactly. With other caches the read-modify-write is done under a
+    process-wide lock: exact with the local memory cache, but then every worker
+    has its own buckets and the effective limit is the configured one times the
+    number of workers; with another shared cache (memcached, database) two
+    workers may both spend the same tokens under contention.
+    """
+
+    def __init__(self, cache_alias):
+        self.cache = caches[cache_alias]
+        self.lock = threading.Lock()
+
+    def consume(self, key, cost, capacity, refill_rate, now=None):
+        """
+        Take cost tokens from the bucket.
+
+        Returns a (allowed, retry_after) tuple, retry_after being the number of
+        seconds until enough tokens are available again.
+        """
+        now = time.time() if now is None else now
+        cost = min(cost, capacity)
+        timeout = math.ceil(capacity / refill_rate) + 1
+        if isinstance(self.cache, RedisCache):
+            return self._consume_in_redis(key, cost, capacity, refill_rate, now, timeout)
+        with self.lock:
+            tokens, updated = self.cache.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * refill_rate)
+            if tokens >= cost:
+                self.cache.set(key, (tokens - cost, now), timeout)
+                return True, 0
+            self.cache.set(key, (tokens, now), timeout)
+            return False, (cost - tokens) / refill_rate
+
+    def _consume_in_redis(self, key, cost, capacity, refill_rate, now, timeout):
+        key = self.cache.make_and_validate_key(key)
+        client = self.cache._cache.get_client(key, write=True)
+        allowed, tokens = client.register_script(CONSUME_SCRIPT)(
+            keys=[key], args=[capacity, refill_rate, cost, repr(now), timeout])
+        if allowed:
+            return True, 0
+        return False, (cost - float(tokens)) / refill_rate
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store():
+    alias = get_setting('CACHE')
+    with _stores_lock:
+        if alias not in _stores:
+            _stores[alias] = TokenBucketStore(alias)
+        return _stores[alias]
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Throttle every request against a token bucket of the authenticated user, or
+    of the client IP for anonymous requests. Each request takes as many tokens
+    as its route's cost weight, so an expensive search drains the bucket faster
+    than a retrieve.
+    """
+
+    def allow_request(self, request, view):
+        if not get_setting('ENABLED'):
+            return True
+
+        if request.user and request.user.is_authenticated:
+            scope, ident = 'user', request.user.pk
+        else:
+            scope, ident = 'anon', self.get_ident(request)
+        rate = get_setting('RATES')[scope]
+
+        allowed, self.retry_after = get_store().consume(
+            f'throttle:bucket:{scope}:{ident}',
+            request_cost(request),
+            rate['CAPACITY'],
+            rate['REFILL_RATE'],
+        )
+        return allowed
+
+    def wait(self):
+        return self.retry_after
+
+
+class InFlightCounter:
+    """Process wide count of the requests being handled, split by cost."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.total = 0
+        self.expensive = 0
+
+    def try_enter(self, expensive):
+        """Admit a request unless the worker is at its in-flight limits."""
+        with self.lock:
+            if self.total >= get_setting('MAX_IN_FLIGHT'):
+                return False
+            if expensive and self.expensive >= get_setting('MAX_EXPENSIVE_IN_FLIGHT'):
+                return False
+            self.total += 1
+            if expensive:
+                self.expensive += 1
+            return True
+
+    def leave(self, expensive):
+        with self.lock:
+            self.total -= 1
+            if expensive:
+                self.expensive -= 1
+
+
+in_flight = InFlightCounter()
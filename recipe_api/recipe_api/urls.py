@@ -16,9 +16,13 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
+from django.conf import settings
+from .views import metrics, media
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('accounts/', include('accounts.urls')),
     path('api/', include('recipes.urls')),
+    path('metrics/', metrics, name='metrics'),
+    path(f"{settings.MEDIA_URL.strip('/')}/<path:path>", media, name='media'),
 ]
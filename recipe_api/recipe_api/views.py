@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from django.utils.cache import patch_cache_control
+from django.views.static import serve
+
+from .instrumentation import get_setting, registry
+from .storage import HashedFileSystemStorage
+
+
+def metrics(request):
+    """
+    Serve the request histograms in the Prometheus text format while
+    instrumentation is enabled, to staff users or, when
+    INSTRUMENTATION['METRICS_TOKEN'] is set, to scrapers sending it as
+    Authorization: Bearer <token>.
+    """
+    if not get_setting('ENABLED'):
+        raise Http404()
+    token = get_setting('METRICS_TOKEN')
+    authorization = request.headers.get('Authorization', '')
+    authorized = request.user.is_authenticated and request.user.is_staff
+    if token and authorization.startswith('Bearer '):
+        authorized = authorized or constant_time_compare(authorization[len('Bearer '):], token)
+    if not authorized:
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def media(request, path):
+    """
+    Serve uploaded media. Uploads are stored under content-hashed names, so a
+    file never changes under its URL and can be cached for a year. Files
+    stored under their original names, before hashed names were used, must
+    be revalidated (serve() answers If-Modified-Since with a 304).
+    """
+    response = serve(request, path, document_root=settings.MEDIA_ROOT)
+    if response.status_code in (200, 304):
+        if HashedFileSystemStorage.is_hashed_name(path):
+            patch_cache_control(response, public=True, max_age=settings.MEDIA_CACHE_MAX_AGE, immutable=True)
+        else:
+            patch_cache_control(response, public=True, no_cache=True)
+    return response
@@ -0,0 +1,98 @@
+"""
+Process warm-up before forking workers.
+
+With gunicorn's preload_app (see gunicorn.conf.py) the application is
+imported once in the master process. warm_up() then does the remaining work
+every worker would otherwise repeat on its first requests: importing the
+URLconf with all the views, populating the URL resolvers and the REST
+framework settings, and loading shared read-only data (the content type
+cache, the recipe facet bitmaps). Workers forked afterwards share these pages
+with the master copy-on-write, as long as gc.freeze() keeps the collector
+from touching them.
+
+Database connections and cache clients opened on the way are closed at the
+end, so no worker inherits a socket of the master.
+"""
+import importlib
+import logging
+import time
+
+from django.apps import apps
+from django.core.cache import caches
+from django.db import connections
+from django.urls import get_resolver
+
+logger = logging.getLogger(__name__)
+
+
+def load_urls():
+    resolver = get_resolver()
+    resolver.url_patterns
+    # Building the reverse lookup tables populates every included resolver
+    resolver.reverse_dict
+
+
+def load_rest_framework():
+    from rest_framework.settings import api_settings
+
+    for name in ['DEFAULT_RENDERER_CLASSES', 'DEFAULT_PARSER_CLASSES', 'DEFAULT_AUTHENTICATION_CLASSES',
+                 'DEFAULT_PERMISSION_CLASSES', 'DEFAULT_THROTTLE_CLASSES', 'DEFAULT_CONTENT_NEGOTIATION_CLASS',
+                 'DEFAULT_PAGINATION_CLASS', 'EXCEPTION_HANDLER']:
+        getattr(api_settings, name)
+
+
+def load_content_types():
+    from django.contrib.contenttypes.models import ContentType
+
+    ContentType.objects.get_for_models(*apps.get_models())
+
+
+def load_facets():
+    from recipes.facets import facet_index
+
+    facet_index.ensure_fresh()
+
+
+def load_pillow():
+    # Django imports Pillow lazily on the first image upload; a preloaded
+    # master imports it once for all workers instead
+    try:
+        importlib.import_module('PIL.Image')
+    except ImportError:
+        pass
+
+
+STEPS = [
+    ('urls', load_urls),
+    ('rest_framework', load_rest_framework),
+    ('content_types', load_content_types),
+    ('facets', load_facets),
+    ('pillow', load_pillow),
+]
+
+
+def close_connections():
+    connections.close_all()
+    for cache in caches.all(initialized_only=True):
+        cache.close()
+
+
+def warm_up(steps=None):
+    """
+    Run the warm-up steps (all of STEPS by default, or the given names) and
+    return the milliseconds each took. A failing step is logged and skipped:
+    it only means that work happens on a worker's first request instead.
+    """
+    timings = {}
+    for name, step in STEPS:
+        if steps is not None and name not in steps:
+            continue
+        start = time.perf_counter()
+        try:
+            step()
+        except Exception:
+            logger.exception('Warm-up step %s failed', name)
+            continue
+        timings[name] = round((time.perf_counter() - start) * 1000, 1)
+    close_connections()
+    return timings
@@ -1,4 +1,115 @@
-from django.contrib import admin
-from .models import Recipe
+from django.contrib import admin, messages
 
-admin.site.register(Recipe)
+from recipe_api.admin import EfficientChangeListMixin
+
+from .models import Favorite, RateAndReview, Recipe
+
+
+@admin.register(Recipe)
+class RecipeAdmin(EfficientChangeListMixin, admin.ModelAdmin):
+    list_display = ('title', 'creator', 'category', 'total_time', 'servings', 'version', 'updated_date')
+    list_select_related = ('creator',)
+    list_filter = ('category',)
+    # Prefix searches can use the title index
+    search_fields = ('^title',)
+    autocomplete_fields = ('creator',)
+    ordering = ('-pk',)
+    actions = ['delete_selected_recipes']
+
+    def save_model(self, request, obj, form, change):
+        """
+        Save through the same helpers as the API: an edit is written as the
+        recipe's next version with its revision, and both update the facets,
+        the recipe cache and the duplicate index.
+        """
+        # Imported here: admin modules load at startup, before anything else needs these
+        from . import cache as recipe_cache
+        from .dedup import index_new_recipe, index_recipe
+        from .facets import recipe_saved
+        from .history import record_revision, save_version
+
+        if not change:
+            super().save_model(request, obj, form, change)
+            record_revision(obj, None)
+            recipe_saved(obj)
+            duplicates = index_new_recipe(obj)
+            if duplicates:
+                self.message_user(request, 'Possible duplicates: ' + ', '.join(
+                    f'{title} ({pk})' for pk, title, _ in duplicates), messages.WARNING)
+            return
+
+        # The form already set the new values on obj: apply them to the stored
+        # recipe, locked so that the version read is the one being replaced
+        recipe = Recipe.objects.select_for_update().get(pk=obj.pk)
+        if save_version(recipe, {name: getattr(obj, name) for name in form.changed_data}):
+            recipe_saved(recipe)
+            recipe_cache.recipe_saved(recipe)
+            if {'ingredients', 'instructions'} & set(form.changed_data):
+                index_recipe(recipe)
+        obj.refresh_from_db()
+
+    def delete_model(self, request, obj):
+        self.delete_queryset(request, Recipe.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        from .deletion import delete_recipes
+
+        delete_recipes(queryset)
+
+    @admin.action(permissions=['delete'], description='Delete selected recipes with their reviews and favorites')
+    def delete_selected_recipes(self, request, queryset):
+        from .deletion import delete_recipes
+
+        deleted = delete_recipes(queryset)
+        self.message_user(request, f'Deleted {deleted} row(s) over all tables.', messages.SUCCESS)
+
+
+@admin.register(RateAndReview)
+class RateAndReviewAdmin(EfficientChangeListMixin, admin.ModelAdmin):
+    list_display = ('id', 'recipe', 'user', 'rating', 'created_date')
+    list_select_related = ('recipe', 'user')
+    search_fields = ('^recipe__title', '^user__username')
+    autocomplete_fields = ('recipe', 'user')
+    ordering = ('-pk',)
+    actions = ['delete_selected_reviews']
+
+    def save_model(self, request, obj, form, change):
+        """Keep the rating histograms in step, as the API's review writes do."""
+        from .ratings import rating_changed
+
+        old = RateAndReview.objects.filter(pk=obj.pk).values_list('recipe_id', 'rating').first() if change else None
+        super().save_model(request, obj, form, change)
+        rating_changed(old, (obj.recipe_id, obj.rating))
+
+    def delete_model(self, request, obj):
+        from .ratings import rating_changed
+
+        rating_changed((obj.recipe_id, obj.rating), None)
+        super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        from .ratings import delete_reviews
+
+        delete_reviews(queryset)
+
+    @admin.action(permissions=['delete'], description='Delete selected reviews')
+    def delete_selected_reviews(self, request, queryset):
+        from .ratings import delete_reviews
+
+        deleted = delete_reviews(queryset)
+        self.message_user(request, f'Deleted {deleted} review(s).', messages.SUCCESS)
+
+
+@admin.register(Favorite)
+class FavoriteAdmin(EfficientChangeListMixin, admin.ModelAdmin):
+    list_display = ('id', 'user', 'recipe')
+    list_select_related = ('user', 'recipe')
+    search_fields = ('^user__username', '^recipe__title')
+    autocomplete_fields = ('user', 'recipe')
+    ordering = ('-pk',)
+    actions = ['delete_selected_favorites']
+
+    @admin.action(permissions=['delete'], description='Delete selected favorites')
+    def delete_selected_favorites(self, request, queryset):
+        deleted = queryset._raw_delete(queryset.db)
+        self.message_user(request, f'Deleted {deleted} favorite(s).', messages.SUCCESS)
@@ -0,0 +1,316 @@
+"""
+Two-tier cache of recipes for the retrieve endpoint.
+
+Every worker process keeps a small LRU of recently read entries for at most
+LOCAL_TIMEOUT seconds in front of the RECIPE_CACHE['CACHE'] Django cache,
+which holds the entries for TIMEOUT seconds and should be shared by all
+workers (e.g. redis or memcached). Two kinds of entries are cached: the
+Recipe instance under its id, and its serialized form under a token
+renewed whenever the instance is loaded or written, and the base URL of the
+request (picture URLs are absolute).
+
+A popular recipe must not send every worker to the database at once when its
+entry expires:
+
+- Within a process, concurrent misses of the same key are coalesced: one
+  thread loads the value and the others wait for its result (SingleFlight).
+- Between processes, the loader takes a short lock in the shared cache with
+  cache.add(). While it loads, other processes serve the value they already
+  have, or poll the shared cache for a short while when they have none.
+- Entries are refreshed early, with a probability growing as their expiry
+  nears and with the time they took to compute (the XFetch algorithm), so
+  under load one request refreshes a hot entry before it actually expires.
+
+Entries are kept GRACE seconds past their expiry so that there is something
+to serve while they are refreshed. Updates write the new recipe through to
+both tiers of the writing process, and deletions drop it, once the
+transaction commits. Other processes can serve their local copy for up to
+LOCAL_TIMEOUT seconds more.
+
+When the RECIPE_CACHE['CACHE'] cache is itself private to the process (local
+memory), other workers' writes would never reach it: a recipe served from
+the cache is then checked against its version column, one indexed read, and
+loaded again when it changed or is gone.
+"""
+import math
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from recipe_api.caching import is_process_local
+
+from .models import Recipe
+
+DEFAULTS = {
+    'ENABLED': True,
+    'CACHE': 'default',
+    'TIMEOUT': 300,
+    'GRACE': 60,
+    'LOCAL_TIMEOUT': 5,
+    'LOCAL_SIZE': 1024,
+    'BETA': 1.0,  # Above 1 refreshes earlier, below 1 later
+    'LOCK_TIMEOUT': 10,
+    'LOCK_WAIT': 2.0,  # Seconds to wait for another process loading a missing entry
+}
+
+POLL_INTERVAL = 0.05
+
+
+def get_setting(name):
+    return getattr(settings, 'RECIPE_CACHE', {}).get(name, DEFAULTS[name])
+
+
+class LocalCache:
+    """Small thread-safe LRU whose entries expire."""
+
+    def __init__(self, size):
+        self.size = size
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires <= time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + timeout, value)
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class SingleFlight:
+    """Run a function once per key at a time; concurrent callers get the result of the running call."""
+
+    class Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, function):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = self.Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+        return call.result
+
+
+class TwoTierCache:
+    """
+    Values cached in a per-process LocalCache in front of a Django cache.
+
+    The shared cache holds (value, delta, expiry) tuples: delta is how long
+    computing the value took, expiry the time.time() at which it goes stale.
+    version, when given, maps a value to a number: a freshly loaded value
+    does not replace a cached one with a higher number, which a concurrent
+    write may have stored meanwhile.
+    """
+
+    def __init__(self, prefix, version=None):
+        self.prefix = prefix
+        self.version = version
+        self.flight = SingleFlight()
+        self._local = None
+
+    @property
+    def cache(self):
+        return caches[get_setting('CACHE')]
+
+    @property
+    def local(self):
+        if self._local is None:
+            self._local = LocalCache(get_setting('LOCAL_SIZE'))
+        return self._local
+
+    def make_key(self, key):
+        return f'{self.prefix}:{key}'
+
+    def get(self, key, loader):
+        """
+        Return the value of key, calling loader() to compute it when neither
+        tier has a fresh one. A loader returning None (nothing to cache, e.g.
+        a missing recipe) is not cached.
+        """
+        key = self.make_key(key)
+        value = self.local.get(key)
+        if value is not None:
+            return value
+        return self.flight.do(key, lambda: self._get_shared(key, loader))
+
+    def _get_shared(self, key, loader):
+        entry = self.cache.get(key)
+        lock_key = f'{key}:lock'
+        if entry is not None:
+            value, delta, expiry = entry
+            if not self._refresh_due(delta, expiry) or not self.cache.add(lock_key, 1, get_setting('LOCK_TIMEOUT')):
+                # Fresh, or another process is refreshing it: serve what is there
+                self._set_local(key, value, expiry)
+                return value
+            return self._load(key, loader, lock_key)
+
+        if not self.cache.add(lock_key, 1, get_setting('LOCK_TIMEOUT')):
+            deadline = time.monotonic() + get_setting('LOCK_WAIT')
+            while time.monotonic() < deadline:
+                time.sleep(POLL_INTERVAL)
+                entry = self.cache.get(key)
+                if entry is not None:
+                    self._set_local(key, entry[0], entry[2])
+                    return entry[0]
+            # The other process is too slow or died: load without the lock
+            lock_key = None
+        return self._load(key, loader, lock_key)
+
+    @staticmethod
+    def _refresh_due(delta, expiry):
+        # XFetch: -log(u) for u uniform in (0, 1] is small most of the time and
+        # rarely large, so requests close to the expiry occasionally refresh
+        return time.time() - delta * get_setting('BETA') * math.log(1.0 - random.random()) >= expiry
+
+    def _load(self, key, loader, lock_key):
+        try:
+            start = time.monotonic()
+            value = loader()
+            delta = time.monotonic() - start
+            if value is not None:
+                self._store(key, value, delta, keep_newer=True)
+            return value
+        finally:
+            if lock_key is not None:
+                self.cache.delete(lock_key)
+
+    def _store(self, key, value, delta, keep_newer=False):
+        if keep_newer and self.version is not None:
+            current = self.cache.get(key)
+            if current is not None and self.version(current[0]) > self.version(value):
+                value, delta, expiry = current
+                self._set_local(key, value, expiry)
+                return
+        timeout = get_setting('TIMEOUT')
+        expiry = time.time() + timeout
+        self.cache.set(key, (value, delta, expiry), timeout + get_setting('GRACE'))
+        self._set_local(key, value, expiry)
+
+    def _set_local(self, key, value, expiry):
+        timeout = min(get_setting('LOCAL_TIMEOUT'), expiry - time.time())
+        if timeout > 0:
+            self.local.set(key, value, timeout)
+        else:
+            self.local.delete(key)
+
+    def set(self, key, value):
+        """Write value through to both tiers."""
+        self._store(self.make_key(key), value, 0.0)
+
+    def delete_many(self, keys):
+        keys = [self.make_key(key) for key in keys]
+        for key in keys:
+            self.local.delete(key)
+        self.cache.delete_many(keys)
+
+
+recipes = TwoTierCache('recipes:recipe', version=lambda recipe: recipe.version)
+representations = TwoTierCache('recipes:recipe-data')
+
+
+def enabled():
+    return get_setting('ENABLED')
+
+
+def with_token(recipe):
+    # Representations are cached under this token, so any new copy of the
+    # recipe (reloaded after an expiry or an invalidation, or written through)
+    # never serves one serialized from an older copy
+    if recipe is not None:
+        recipe._cache_token = uuid.uuid4().hex
+    return recipe
+
+
+def load_recipe(recipe_id):
+    return with_token(Recipe.objects.filter(pk=recipe_id).first())
+
+
+def get_recipe(recipe_id):
+    """Return the recipe with the given id, with all its fields, or None when there is none."""
+    if not str(recipe_id).isdigit():
+        return None
+    recipe_id = int(recipe_id)
+    loaded = []
+
+    def load():
+        loaded.append(True)
+        return load_recipe(recipe_id)
+
+    recipe = recipes.get(recipe_id, load)
+    if recipe is None or loaded or not is_process_local(get_setting('CACHE')):
+        return recipe
+    version = Recipe.objects.filter(pk=recipe_id).values_list('version', flat=True).first()
+    if version == recipe.version:
+        return recipe
+    # Changed or deleted by another worker
+    recipes.delete_many([recipe_id])
+    return recipes.get(recipe_id, lambda: load_recipe(recipe_id))
+
+
+def get_representation(recipe, base_url, serialize):
+    """
+    Return the serialized form of a recipe returned by get_recipe(), calling
+    serialize() when it is not cached.
+    """
+    key = f'{recipe.pk}:{recipe._cache_token}:{base_url}'
+    return representations.get(key, lambda: dict(serialize()))
+
+
+def recipe_saved(recipe):
+    """Write the saved recipe through to the cache once the transaction commits."""
+    if enabled():
+        transaction.on_commit(lambda: recipes.set(recipe.pk, with_token(recipe)))
+
+
+def invalidate(recipe_ids):
+    """Drop deleted or otherwise changed recipes from the cache once the transaction commits."""
+    if enabled():
+        transaction.on_commit(lambda: recipes.delete_many(list(recipe_ids)))
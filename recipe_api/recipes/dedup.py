@@ -0,0 +1,180 @@
+"""
+Near-duplicate recipe detection with MinHash and locality-sensitive hashing.
+
+A recipe is reduced to a set of features: its normalized ingredient names
+and the SHINGLE_SIZE-word shingles of its instructions. The MinHash
+signature of that set (NUM_PERM minimums of as many hash functions) is
+stored in RecipeSignature, NUM_PERM 32-bit values in a small binary
+column; the share of equal positions in two signatures estimates the
+Jaccard similarity of the recipes.
+
+The signature is also cut into BANDS bands of ROWS values, and the hash of
+each band is stored in RecipeSignatureBand. Two recipes that share at least
+one band bucket are candidates: recipes with a similarity s end up in a
+common bucket with probability 1 - (1 - s ** ROWS) ** BANDS, about 0.98
+for s = 0.8 and 0.02 for s = 0.2 with the defaults. Finding the duplicates
+of a recipe is one indexed lookup of its BANDS buckets and a comparison
+with the few candidates, instead of a comparison with every recipe.
+
+A recipe without any feature (no ingredient name, no instruction word) has
+no signature: it is neither indexed nor reported as a duplicate, as all of
+them would otherwise share every bucket with a similarity of 1.
+"""
+import hashlib
+import random
+import re
+from array import array
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from .ingredients import parse_ingredients
+from .models import RecipeSignature, RecipeSignatureBand
+
+DEFAULTS = {
+    'THRESHOLD': 0.7,
+}
+
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 3
+
+PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+# The hash functions h(x) = (a * x + b) mod PRIME; the seed is fixed so
+# stored signatures stay comparable across processes and restarts
+_random = random.Random(1301)
+PERMUTATIONS = [(_random.randrange(1, PRIME), _random.randrange(0, PRIME)) for _ in range(NUM_PERM)]
+
+WORD = re.compile(r'[a-z0-9]+')
+
+
+def get_setting(name):
+    return getattr(settings, 'RECIPE_DEDUP', {}).get(name, DEFAULTS[name])
+
+
+def features(ingredients, instructions, parsed=None):
+    """The feature set of a recipe: ingredient names and instruction shingles."""
+    parsed = parsed or parse_ingredients(ingredients)
+    result = {'i:' + ' '.join(WORD.findall(name.lower())) for name in parsed['name']}
+    words = WORD.findall((instructions or '').lower())
+    if 0 < len(words) < SHINGLE_SIZE:
+        result.add('s:' + ' '.join(words))
+    else:
+        result.update('s:' + ' '.join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1))
+    return result
+
+
+def _hash(feature):
+    return int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), 'little')
+
+
+def minhash(feature_set):
+    """Return the MinHash signature of a feature set as a list of NUM_PERM ints, None when it is empty."""
+    hashes = [_hash(feature) for feature in feature_set]
+    if not hashes:
+        return None
+    return [min((a * x + b) % PRIME for x in hashes) & MAX_HASH for a, b in PERMUTATIONS]
+
+
+def pack(signature):
+    return array('I', signature).tobytes()
+
+
+def unpack(data):
+    signature = array('I')
+    signature.frombytes(bytes(data))
+    return signature
+
+
+def band_buckets(signature):
+    """Return the (band, bucket) pairs of a signature."""
+    buckets = []
+    for band in range(BANDS):
+        rows = array('I', signature[band * ROWS:(band + 1) * ROWS]).tobytes()
+        buckets.append((band, int.from_bytes(hashlib.blake2b(rows, digest_size=8).digest(), 'little', signed=True)))
+    return buckets
+
+
+def similarity(first, second):
+    """Estimated Jaccard similarity of two signatures."""
+    return sum(1 for x, y in zip(first, second) if x == y) / NUM_PERM
+
+
+def recipe_signature(recipe):
+    return minhash(features(recipe.ingredients, recipe.instructions, recipe.parsed_ingredients))
+
+
+def find_similar(signature, exclude=None, threshold=None):
+    """
+    Return (recipe id, title, similarity) of the indexed recipes whose
+    estimated similarity to the signature is at least the threshold, most
+    similar first. A recipe without signature has none.
+    """
+    if signature is None:
+        return []
+    threshold = get_setting('THRESHOLD') if threshold is None else threshold
+    q = Q()
+    for band, bucket in band_buckets(signature):
+        q |= Q(band=band, bucket=bucket)
+    candidates = RecipeSignatureBand.objects.filter(q).values('recipe_id')
+    rows = RecipeSignature.objects.filter(recipe_id__in=candidates)
+    if exclude is not None:
+        rows = rows.exclude(recipe_id=exclude)
+
+    similar = []
+    for recipe_id, title, data in rows.values_list('recipe_id', 'recipe__title', 'signature'):
+        score = similarity(signature, unpack(data))
+        if score >= threshold:
+            similar.append((recipe_id, title, score))
+    return sorted(similar, key=lambda item: -item[2])
+
+
+def index_recipe(recipe, signature=None):
+    """
+    Store the signature and band buckets of a recipe, replacing previous ones,
+    or just remove them when the recipe has no signature.
+    """
+    signature = recipe_signature(recipe) if signature is None else signature
+    with transaction.atomic():
+        RecipeSignatureBand.objects.filter(recipe_id=recipe.pk).delete()
+        if signature is None:
+            RecipeSignature.objects.filter(recipe_id=recipe.pk).delete()
+            return None
+        RecipeSignature.objects.update_or_create(recipe_id=recipe.pk, defaults={'signature': pack(signature)})
+        RecipeSignatureBand.objects.bulk_create(
+            [RecipeSignatureBand(recipe_id=recipe.pk, band=band, bucket=bucket) for band, bucket in band_buckets(signature)])
+    return signature
+
+
+def index_new_recipe(recipe):
+    """Index a newly created recipe and return its likely duplicates."""
+    signature = recipe_signature(recipe)
+    if signature is None:
+        return []
+    similar = find_similar(signature, exclude=recipe.pk)
+    index_recipe(recipe, signature)
+    return similar
+
+
+def index_recipes(recipes):
+    """
+    Store the signatures and band buckets of a batch of recipes with a few
+    statements, and return how many recipes had a signature.
+    """
+    recipes = list(recipes)
+    signatures = {recipe.pk: recipe_signature(recipe) for recipe in recipes}
+    signatures = {pk: signature for pk, signature in signatures.items() if signature is not None}
+    with transaction.atomic():
+        RecipeSignature.objects.filter(recipe_id__in=[recipe.pk for recipe in recipes]).delete()
+        RecipeSignatureBand.objects.filter(recipe_id__in=[recipe.pk for recipe in recipes]).delete()
+        RecipeSignature.objects.bulk_create(
+            [RecipeSignature(recipe_id=pk, signature=pack(signature)) for pk, signature in signatures.items()])
+        RecipeSignatureBand.objects.bulk_create([
+            RecipeSignatureBand(recipe_id=pk, band=band, bucket=bucket)
+            for pk, signature in signatures.items() for band, bucket in band_buckets(signature)
+        ])
+    return len(signatures)
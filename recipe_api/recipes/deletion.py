@@ -0,0 +1,53 @@
+from django.db import transaction
+
+from . import cache as recipe_cache
+from .facets import recipes_deleted
+from .media import revision_pictures, schedule_media_cleanup
+from .models import Favorite, RateAndReview, RatingSummary, Recipe, RecipeRevision, RecipeSignature, RecipeSignatureBand
+
+
+def recipe_dependents(recipe_ids):
+    """
+    Querysets of every row referring to the given recipes, which must be gone
+    before the recipes themselves. recipe_ids may be a list or a subquery.
+    """
+    return [
+        RateAndReview.objects.filter(recipe_id__in=recipe_ids),
+        Favorite.objects.filter(recipe_id__in=recipe_ids),
+        RatingSummary.objects.filter(recipe_id__in=recipe_ids),
+        RecipeRevision.objects.filter(recipe_id__in=recipe_ids),
+        RecipeSignature.objects.filter(recipe_id__in=recipe_ids),
+        RecipeSignatureBand.objects.filter(recipe_id__in=recipe_ids),
+    ]
+
+
+def delete_recipes(queryset):
+    """
+    Delete the recipes of the queryset with one DELETE statement per table.
+
+    Unlike QuerySet.delete(), no row is loaded into memory and no delete
+    signals are sent. The recipes' pictures, including those of their older
+    versions, are removed in the background after the transaction commits.
+
+    Returns the number of deleted rows over all tables.
+    """
+    with transaction.atomic():
+        ids = list(queryset.values_list('pk', flat=True))
+        if not ids:
+            return 0
+        pictures = set(
+            Recipe.objects.filter(pk__in=ids).exclude(picture='').values_list('picture', flat=True)
+        )
+        # Pictures of older versions go with the revisions
+        pictures.update(revision_pictures(RecipeRevision.objects.filter(recipe_id__in=ids)))
+
+        deleted = 0
+        for dependents in recipe_dependents(ids):
+            deleted += dependents._raw_delete(dependents.db)
+        recipes = Recipe.objects.filter(pk__in=ids)
+        deleted += recipes._raw_delete(recipes.db)
+
+        schedule_media_cleanup(pictures)
+        recipes_deleted(ids)
+        recipe_cache.invalidate(ids)
+    return deleted
@@ -0,0 +1,251 @@
+"""
+In-memory facet counts for recipe browsing.
+
+Every worker process keeps one bitmap per category, per total time bucket and
+per distinct total time, a Python int in which bit n is set when the recipe
+with id n has that value. Counting a facet for a result set is then an AND of
+two ints and a popcount, whatever the filter combination. A result set
+filtered by category and total time is itself built from the bitmaps (see
+FacetIndex.select()); only other filters, e.g. text search, read the ids of
+the matching recipes from the database.
+
+Recipe writes bump a generation counter kept in the FACETS['CACHE'] cache.
+The writing process applies the change to its own bitmaps in place; other
+processes see the new generation on their next facet request and rebuild
+from one query over (id, category, total_time). Use a cache shared by all
+workers (e.g. redis or memcached) for that to work across processes.
+
+When the cache is private to the process (local memory), a counter there
+would never reach the other workers, so the generation is read from the
+database instead: the count, highest id and sum of the versions of the
+recipes, which every creation, deletion and versioned update changes. That
+costs a scan of the recipe table, at most once every CHECK_INTERVAL seconds
+per process and after each write of the process.
+"""
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Count, Max, Sum
+
+from recipe_api.caching import is_process_local
+
+from .models import CATEGORY_CHOICES, Recipe
+
+DEFAULTS = {
+    'CACHE': 'default',
+    'CHECK_INTERVAL': 5,  # Seconds between database generation checks, with a process-local cache
+}
+
+GENERATION_KEY = 'recipes:facets:generation'
+
+# Total time (preparation + cooking) buckets in minutes, upper bound excluded
+TIME_BUCKETS = [
+    ('under_15', 0, 15),
+    ('15_to_30', 15, 30),
+    ('30_to_60', 30, 60),
+    ('over_60', 60, None),
+]
+
+
+def get_setting(name):
+    return getattr(settings, 'FACETS', {}).get(name, DEFAULTS[name])
+
+
+def time_bucket(total):
+    for label, low, high in TIME_BUCKETS:
+        if total >= low and (high is None or total < high):
+            return label
+    return None
+
+
+def bitmap(ids):
+    """Build a bitmap from an iterable of non-negative ids."""
+    ids = list(ids)
+    if not ids:
+        return 0
+    bits = bytearray(max(ids) // 8 + 1)
+    for recipe_id in ids:
+        bits[recipe_id >> 3] |= 1 << (recipe_id & 7)
+    return int.from_bytes(bits, 'little')
+
+
+class FacetIndex:
+    """Bitmaps of the recipe ids per category and per total time bucket."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.generation = None
+        self.all = 0
+        self.categories = {}
+        self.time_buckets = {}
+        self.total_times = {}
+        # (category, total time) of every indexed recipe, to clear its bits on change
+        self.values = {}
+        # (time.monotonic(), generation) of the last database check
+        self.checked = None
+
+    @property
+    def cache(self):
+        return caches[get_setting('CACHE')]
+
+    @property
+    def shared(self):
+        return not is_process_local(get_setting('CACHE'))
+
+    def current_generation(self):
+        if not self.shared:
+            return self.database_generation()
+        self.cache.add(GENERATION_KEY, 0, None)
+        return self.cache.get(GENERATION_KEY, 0)
+
+    def database_generation(self):
+        checked = self.checked
+        if checked is not None and time.monotonic() - checked[0] < get_setting('CHECK_INTERVAL'):
+            return checked[1]
+        generation = tuple(Recipe.objects.aggregate(
+            count=Count('pk'), last=Max('pk'), versions=Sum('version')).values())
+        self.checked = (time.monotonic(), generation)
+        return generation
+
+    def ensure_fresh(self):
+        generation = self.current_generation()
+        if generation != self.generation:
+            self.rebuild(generation)
+
+    def rebuild(self, generation):
+        rows = Recipe.objects.order_by().values_list('pk', 'category', 'total_time')
+        values = {
+            recipe_id: (category, total_time)
+            for recipe_id, category, total_time in rows.iterator(chunk_size=5000)
+        }
+        categories = {value: [] for value, _ in CATEGORY_CHOICES}
+        time_buckets = {label: [] for label, _, _ in TIME_BUCKETS}
+        total_times = {}
+        for recipe_id, (category, total_time) in values.items():
+            categories.setdefault(category, []).append(recipe_id)
+            time_buckets[time_bucket(total_time)].append(recipe_id)
+            total_times.setdefault(total_time, []).append(recipe_id)
+
+        with self.lock:
+            self.values = values
+            self.all = bitmap(values)
+            self.categories = {value: bitmap(ids) for value, ids in categories.items()}
+            self.time_buckets = {label: bitmap(ids) for label, ids in time_buckets.items()}
+            self.total_times = {total_time: bitmap(ids) for total_time, ids in total_times.items()}
+            self.generation = generation
+
+    def _bump(self, apply):
+        """Move to the next generation, applying the change here if this index was current."""
+        if not self.shared:
+            # Read the new generation from the database on the next request
+            self.checked = None
+            return
+        self.current_generation()
+        generation = self.cache.incr(GENERATION_KEY)
+        with self.lock:
+            if self.generation == generation - 1:
+                apply()
+                self.generation = generation
+
+    def _remove(self, recipe_id):
+        previous = self.values.pop(recipe_id, None)
+        if previous is None:
+            return
+        category, total_time = previous
+        mask = ~(1 << recipe_id)
+        self.all &= mask
+        self.categories[category] &= mask
+        self.time_buckets[time_bucket(total_time)] &= mask
+        self.total_times[total_time] &= mask
+        if not self.total_times[total_time]:
+            del self.total_times[total_time]
+
+    def _add(self, recipe_id, category, total_time):
+        bit = 1 << recipe_id
+        self.values[recipe_id] = (category, total_time)
+        self.all |= bit
+        self.categories[category] = self.categories.get(category, 0) | bit
+        self.time_buckets[time_bucket(total_time)] |= bit
+        self.total_times[total_time] = self.total_times.get(total_time, 0) | bit
+
+    def recipe_saved(self, recipe):
+        values = (recipe.pk, recipe.category, recipe.total_time)
+
+        def apply():
+            self._remove(values[0])
+            self._add(*values)
+        self._bump(apply)
+
+    def recipes_deleted(self, recipe_ids):
+        def apply():
+            for recipe_id in recipe_ids:
+                self._remove(recipe_id)
+        self._bump(apply)
+
+    def select(self, categories=None, min_total_time=None, max_total_time=None):
+        """
+        Return the bitmap of the recipes in one of the given categories and
+        within the total time bounds (inclusive), as RecipeFilterBackend
+        filters them. None means no restriction.
+        """
+        self.ensure_fresh()
+        with self.lock:
+            result = self.all
+            if categories is not None:
+                selected = 0
+                for category in categories:
+                    selected |= self.categories.get(category, 0)
+                result &= selected
+            if min_total_time is not None or max_total_time is not None:
+                low = 0 if min_total_time is None else min_total_time
+                high = math.inf if max_total_time is None else max_total_time
+                selected = 0
+                for total_time, ids in self.total_times.items():
+                    if low <= total_time <= high:
+                        selected |= ids
+                result &= selected
+            return result
+
+    def counts(self, result=None):
+        """
+        Return the facet counts of a result set given as a bitmap, or of all
+        recipes when result is None.
+        """
+        self.ensure_fresh()
+        with self.lock:
+            result = self.all if result is None else result & self.all
+            return {
+                'category': {value: (result & ids).bit_count() for value, ids in self.categories.items()},
+                'total_time': {label: (result & ids).bit_count() for label, ids in self.time_buckets.items()},
+            }
+
+
+facet_index = FacetIndex()
+
+
+def recipe_saved(recipe):
+    """Update the facets once the transaction saving the recipe commits."""
+    transaction.on_commit(lambda: facet_index.recipe_saved(recipe))
+
+
+def recipes_deleted(recipe_ids):
+    transaction.on_commit(lambda: facet_index.recipes_deleted(list(recipe_ids)))
+
+
+def facet_counts(queryset, selection=None):
+    """
+    Facet counts of the recipes of a queryset. selection, when given, holds
+    the queryset's filters as the arguments of FacetIndex.select() (see
+    RecipeFilterBackend.facet_selection()), and the counts come from the
+    bitmaps alone, as they do for an unfiltered queryset. Other filtered
+    querysets are counted after reading their ids.
+    """
+    if selection is not None:
+        return facet_index.counts(facet_index.select(**selection))
+    if not queryset.query.where:
+        return facet_index.counts()
+    return facet_index.counts(bitmap(queryset.order_by().values_list('pk', flat=True).iterator(chunk_size=5000)))
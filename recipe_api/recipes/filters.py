@@ -0,0 +1,175 @@
+"""
+Typed query parameter filters for the recipe list.
+
+Every filter validates its parameters before any SQL is built, so malformed
+values give a 400 listing all the bad parameters instead of a database
+error, and all the filters of a request are combined into a single WHERE
+clause that the (category, total_time) and total_time indexes can serve.
+Facet counts of a list filtered only by category and total time are computed
+from the in-memory bitmaps of recipes/facets.py, see
+RecipeFilterBackend.facet_selection().
+"""
+from django.db.models import Q
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+from .models import CATEGORY_CHOICES
+
+
+class RangeFilter:
+    """
+    ?min_<name>= and ?max_<name>= bounds, both inclusive, on an integer column.
+    With null_as_zero a null column counts as 0, so a recipe without cooking
+    time is not dropped by a max_cooking_time bound.
+    """
+
+    def __init__(self, name, null_as_zero=False):
+        self.name = name
+        self.null_as_zero = null_as_zero
+        self.parser = serializers.IntegerField(min_value=0)
+
+    @property
+    def params(self):
+        return [f'min_{self.name}', f'max_{self.name}']
+
+    def get_bounds(self, params, errors):
+        """Return the given bounds as a dict with 'gte' and/or 'lte' keys."""
+        bounds = {}
+        for param, lookup in zip(self.params, ('gte', 'lte')):
+            value = params.get(param)
+            if value in (None, ''):
+                continue
+            try:
+                bounds[lookup] = self.parser.run_validation(value)
+            except serializers.ValidationError as e:
+                errors[param] = e.detail
+        if len(bounds) == 2 and bounds['gte'] > bounds['lte']:
+            errors[f'min_{self.name}'] = [f'Must not be greater than max_{self.name}.']
+        return bounds
+
+    def get_q(self, params, errors):
+        bounds = self.get_bounds(params, errors)
+        if not bounds:
+            return Q()
+
+        q = Q(**{f'{self.name}__{lookup}': value for lookup, value in bounds.items()})
+        if self.null_as_zero and bounds.get('gte', 0) == 0:
+            q |= Q(**{f'{self.name}__isnull': True})
+        return q
+
+
+class MultipleChoiceFilter:
+    """?<name>=a,b matches any of the given choices with a single IN."""
+
+    def __init__(self, name, choices):
+        self.name = name
+        self.choices = [value for value, _ in choices]
+
+    @property
+    def params(self):
+        return [self.name]
+
+    def get_values(self, params, errors):
+        """Return the list of given choices, None when the parameter is absent or invalid."""
+        value = params.get(self.name)
+        if not value:
+            return None
+        values = [item.strip() for item in value.split(',') if item.strip()]
+        unknown = [item for item in values if item not in self.choices]
+        if unknown:
+            errors[self.name] = [f'Unknown choice(s): {", ".join(unknown)}.']
+            return None
+        return values
+
+    def get_q(self, params, errors):
+        values = self.get_values(params, errors)
+        if values is None:
+            return Q()
+        return Q(**{f'{self.name}__in': values})
+
+
+class SearchFilter:
+    """?search= matches the title, category or ingredients, case-insensitively."""
+
+    fields = ['title', 'category', 'ingredients']
+    params = ['search']
+
+    def get_q(self, params, errors):
+        search = params.get('search')
+        if not search:
+            return Q()
+        q = Q()
+        for field in self.fields:
+            q |= Q(**{f'{field}__icontains': search})
+        return q
+
+
+class RecipeFilterBackend(BaseFilterBackend):
+    """
+    Filter backend applying the recipe filters to the list action.
+
+    The parameters of the original API are still accepted and mapped to their
+    typed counterpart: ?cooking_time= and ?preparation_time= are maximums,
+    ?servings= is a minimum.
+    """
+
+    category_filter = MultipleChoiceFilter('category', CATEGORY_CHOICES)
+    total_time_filter = RangeFilter('total_time')
+    filters = [
+        SearchFilter(),
+        category_filter,
+        RangeFilter('preparation_time'),
+        RangeFilter('cooking_time', null_as_zero=True),
+        total_time_filter,
+        RangeFilter('servings'),
+    ]
+
+    legacy_params = {
+        'cooking_time': 'max_cooking_time',
+        'preparation_time': 'max_preparation_time',
+        'servings': 'min_servings',
+    }
+
+    def get_params(self, request):
+        """Return the query parameters with the legacy ones mapped, and the mapping used."""
+        params = request.query_params.dict()
+        mapped = {}
+        for legacy, param in self.legacy_params.items():
+            if params.get(legacy) and not params.get(param):
+                params[param] = params[legacy]
+                mapped[param] = legacy
+        return params, mapped
+
+    def filter_queryset(self, request, queryset, view):
+        if getattr(view, 'action', None) != 'list':
+            return queryset
+
+        params, mapped = self.get_params(request)
+        errors = {}
+        q = Q()
+        for recipe_filter in self.filters:
+            q &= recipe_filter.get_q(params, errors)
+        if errors:
+            # Report errors under the parameter the client actually sent
+            raise ValidationError({mapped.get(param, param): detail for param, detail in errors.items()})
+        return queryset.filter(q) if q else queryset
+
+    def facet_selection(self, request):
+        """
+        Return the filters of a list request as the keyword arguments of
+        FacetIndex.select(), or None when it uses other filters (text search,
+        preparation or cooking time, servings), whose matches are read from
+        the database instead. Call it after filter_queryset() validated them.
+        """
+        params, _ = self.get_params(request)
+        bitmap_params = {*self.category_filter.params, *self.total_time_filter.params}
+        if any(params.get(param) for recipe_filter in self.filters for param in recipe_filter.params
+               if param not in bitmap_params):
+            return None
+        errors = {}
+        categories = self.category_filter.get_values(params, errors)
+        bounds = self.total_time_filter.get_bounds(params, errors)
+        if errors:
+            return None
+        return {'categories': categories, 'min_total_time': bounds.get('gte'), 'max_total_time': bounds.get('lte')}
@@ -0,0 +1,200 @@
+"""
+Recipe versioning.
+
+Every update of a recipe increments Recipe.version and appends a
+RecipeRevision. Revisions whose version follows a multiple of
+RECIPE_HISTORY['SNAPSHOT_EVERY'] (1, 11, 21, ... by default) store the full
+recipe; the others only the changed fields, long text (by line) and lists
+as difflib opcodes against the previous version. Reading a version loads the
+closest snapshot at or below it and replays at most SNAPSHOT_EVERY - 1 diffs.
+"""
+import json
+from difflib import SequenceMatcher
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotFound
+
+from .models import Recipe, RecipeRevision
+
+DEFAULTS = {
+    'SNAPSHOT_EVERY': 10,
+}
+
+# Recipe fields kept in the history
+TRACKED_FIELDS = [
+    'title', 'picture', 'description', 'ingredients', 'instructions',
+    'category', 'preparation_time', 'cooking_time', 'servings',
+]
+
+
+def get_setting(name):
+    return getattr(settings, 'RECIPE_HISTORY', {}).get(name, DEFAULTS[name])
+
+
+class PreconditionFailed(APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = 'The recipe has been modified since it was read.'
+    default_code = 'precondition_failed'
+
+
+def etag(recipe_id, version):
+    return f'"recipe-{recipe_id}-v{version}"'
+
+
+def etag_matches(header, recipe_id, version):
+    """
+    Whether an If-Match/If-None-Match header lists the given version of the
+    recipe. Weak tags (e.g. from compressed responses) match their strong form.
+    """
+    tags = parse_etags(header)
+    current = etag(recipe_id, version)
+    return '*' in tags or any(tag.removeprefix('W/') == current for tag in tags)
+
+
+def check_if_match(request, recipe):
+    """Raise PreconditionFailed when the request's If-Match does not name the current version."""
+    header = request.headers.get('If-Match')
+    if header and not etag_matches(header, recipe.pk, recipe.version):
+        raise PreconditionFailed()
+
+
+def snapshot(recipe):
+    """Return the tracked fields of a recipe as JSON-serializable values."""
+    state = {}
+    for name in TRACKED_FIELDS:
+        value = getattr(recipe, name)
+        if name == 'picture':
+            value = value.name or None
+        state[name] = value
+    return state
+
+
+def diff(old, new):
+    """
+    Encode how to get new from old. Text (by line) and lists (by item) are
+    stored as a list of [start, end] ranges copied from old and inserted
+    pieces, other values as they are.
+    """
+    if isinstance(old, str) and isinstance(new, str):
+        old_items, new_items = old.splitlines(keepends=True), new.splitlines(keepends=True)
+    elif isinstance(old, list) and isinstance(new, list):
+        old_items, new_items = old, new
+    else:
+        return {'value': new}
+
+    # List items may be dicts (structured ingredients), so compare them by their JSON
+    old_keys = old_items if isinstance(old, str) else [json.dumps(item, sort_keys=True) for item in old_items]
+    new_keys = new_items if isinstance(new, str) else [json.dumps(item, sort_keys=True) for item in new_items]
+    ops = []
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, old_keys, new_keys, autojunk=False).get_opcodes():
+        if tag == 'equal':
+            ops.append([i1, i2])
+        elif tag != 'delete':
+            inserted = new_items[j1:j2]
+            ops.append({'insert': ''.join(inserted) if isinstance(new, str) else inserted})
+    return {'ops': ops}
+
+
+def patch(old, change):
+    """Apply a change made by diff() to the old value."""
+    if 'value' in change:
+        return change['value']
+    if isinstance(old, str):
+        lines = old.splitlines(keepends=True)
+        return ''.join(op['insert'] if isinstance(op, dict) else ''.join(lines[op[0]:op[1]]) for op in change['ops'])
+    return [item for op in change['ops'] for item in (op['insert'] if isinstance(op, dict) else old[op[0]:op[1]])]
+
+
+def record_revision(recipe, previous):
+    """
+    Append the revision for recipe.version, given the snapshot of the
+    previous version. Recipes created before versioning get a snapshot of
+    that previous version first.
+    """
+    revisions = RecipeRevision.objects.filter(recipe_id=recipe.pk)
+    if recipe.version > 1 and not revisions.exists():
+        RecipeRevision.objects.create(recipe_id=recipe.pk, version=recipe.version - 1, snapshot=previous)
+
+    current = snapshot(recipe)
+    if (recipe.version - 1) % get_setting('SNAPSHOT_EVERY') == 0:
+        return RecipeRevision.objects.create(recipe_id=recipe.pk, version=recipe.version, snapshot=current)
+
+    # Picture names are stored whole, so that recipes/media.py finds the files old versions refer to
+    changes = {
+        name: {'value': current[name]} if name == 'picture' else diff(previous[name], current[name])
+        for name in TRACKED_FIELDS if previous[name] != current[name]
+    }
+    return RecipeRevision.objects.create(recipe_id=recipe.pk, version=recipe.version, changes=changes)
+
+
+def _differs(recipe, name, value):
+    field = recipe._meta.get_field(name)
+    if field.is_relation:
+        return getattr(recipe, field.attname) != getattr(value, 'pk', value)
+    return getattr(recipe, name) != value
+
+
+def save_version(recipe, values):
+    """
+    Save the given field values of the recipe as its next version.
+
+    Only the fields whose value actually changes are written, together with
+    version, updated_date and the derived total_time and parsed_ingredients
+    when they follow, by a single UPDATE ... WHERE version = <version
+    the recipe was read at>. When another update got there first no row
+    matches and PreconditionFailed is raised. The revision is appended in the
+    same transaction.
+
+    Returns False, without writing anything, when no value changes.
+    """
+    changed = [name for name, value in values.items() if _differs(recipe, name, value)]
+    if not changed:
+        return False
+
+    previous = snapshot(recipe)
+    expected = recipe.version
+    for name in changed:
+        setattr(recipe, name, values[name])
+    recipe.version = expected + 1
+    written = [*changed, 'updated_date', 'version']
+    if recipe.compute_total_time():
+        written.append('total_time')
+    if 'ingredients' in changed and recipe.compute_parsed_ingredients():
+        written.append('parsed_ingredients')
+
+    with transaction.atomic():
+        columns = {}
+        for name in written:
+            field = recipe._meta.get_field(name)
+            # pre_save() commits uploaded files and fills in auto_now dates
+            columns[field.attname] = field.pre_save(recipe, add=False)
+        if not Recipe.objects.filter(pk=recipe.pk, version=expected).update(**columns):
+            recipe.version = expected
+            raise PreconditionFailed()
+        record_revision(recipe, previous)
+    return True
+
+
+def get_version(recipe, version):
+    """Rebuild the tracked fields of a recipe at the given version."""
+    if version == recipe.version:
+        return snapshot(recipe)
+    recipe_id = recipe.pk
+    base = (RecipeRevision.objects.filter(recipe_id=recipe_id, version__lte=version, snapshot__isnull=False)
+            .order_by('-version').values_list('version', 'snapshot').first())
+    if base is None:
+        raise NotFound('This version of the recipe is not available.')
+
+    base_version, state = base
+    revisions = (RecipeRevision.objects.filter(recipe_id=recipe_id, version__gt=base_version, version__lte=version)
+                 .order_by('version').values_list('version', 'changes'))
+    reached = base_version
+    for reached, changes in revisions:
+        for name, change in (changes or {}).items():
+            state[name] = patch(state[name], change)
+    if reached != version:
+        raise NotFound('This version of the recipe is not available.')
+    return state
@@ -0,0 +1,209 @@
+"""
+Ingredient parsing, scaling and aggregation.
+
+Recipe.ingredients is free-form JSON: a list of strings such as
+"1 1/2 cups flour", or of {"name", "quantity", "unit"} objects. When a
+recipe is saved the list is parsed once into Recipe.parsed_ingredients, a
+dict of parallel arrays (columns):
+
+    name           ingredient name
+    quantity       amount in the recipe's unit, null when none was given
+    unit           canonical unit ("cup", "g", ...), null for plain counts
+    base_quantity  amount in the base unit of the dimension (g, ml or pieces)
+    base_unit      "g", "ml", "piece", or null when the amount is unknown
+
+Scaling and aggregation then work column-wise on these arrays without
+parsing any text again. Amounts that are not finite ("nan", "inf") or above
+MAX_QUANTITY are left unparsed: JSON has no value for the former, and
+scaling the latter could overflow to infinity.
+"""
+import math
+import re
+import threading
+from collections import OrderedDict
+from fractions import Fraction
+
+COLUMNS = ['name', 'quantity', 'unit', 'base_quantity', 'base_unit']
+
+MAX_QUANTITY = 10 ** 9
+
+# Canonical unit: (aliases, base unit, amount of base unit per unit)
+UNITS = {
+    'g': (['g', 'gram', 'grams', 'gr'], 'g', 1),
+    'kg': (['kg', 'kilogram', 'kilograms', 'kilo', 'kilos'], 'g', 1000),
+    'oz': (['oz', 'ounce', 'ounces'], 'g', 28.3495),
+    'lb': (['lb', 'lbs', 'pound', 'pounds'], 'g', 453.592),
+    'ml': (['ml', 'milliliter', 'milliliters', 'millilitre', 'millilitres'], 'ml', 1),
+    'l': (['l', 'liter', 'liters', 'litre', 'litres'], 'ml', 1000),
+    'tsp': (['tsp', 'teaspoon', 'teaspoons'], 'ml', 4.92892),
+    'tbsp': (['tbsp', 'tablespoon', 'tablespoons', 'tbs'], 'ml', 14.7868),
+    'cup': (['cup', 'cups'], 'ml', 236.588),
+    'pint': (['pint', 'pints', 'pt'], 'ml', 473.176),
+}
+UNIT_ALIASES = {alias: unit for unit, (aliases, _, _) in UNITS.items() for alias in aliases}
+
+# Units shown for aggregated base amounts, largest first
+DISPLAY_UNITS = {
+    'g': [('kg', 1000), ('g', 1)],
+    'ml': [('l', 1000), ('ml', 1)],
+}
+
+UNICODE_FRACTIONS = {'½': '1/2', '⅓': '1/3', '⅔': '2/3', '¼': '1/4', '¾': '3/4', '⅛': '1/8'}
+
+QUANTITY = re.compile(r'^\s*(?P<quantity>\d+\s+\d+/\d+|\d+/\d+|\d+(?:[.,]\d+)?)\s*(?P<rest>.*)$')
+
+
+def parse_quantity(text):
+    """Parse "2", "1.5", "3/4" or "1 1/2" into a float."""
+    text = text.replace(',', '.')
+    total = Fraction(0)
+    for part in text.split():
+        total += Fraction(part)
+    return float(total)
+
+
+def _is_valid_quantity(quantity):
+    return math.isfinite(quantity) and abs(quantity) <= MAX_QUANTITY
+
+
+def parse_ingredient(item):
+    """Parse one ingredient entry into a (name, quantity, unit, base_quantity, base_unit) tuple."""
+    if isinstance(item, dict):
+        name = str(item.get('name', '')).strip()
+        quantity = item.get('quantity')
+        unit = item.get('unit')
+        try:
+            quantity = float(quantity) if quantity not in (None, '') else None
+        except (TypeError, ValueError, OverflowError):
+            quantity = None
+        if quantity is not None and not _is_valid_quantity(quantity):
+            quantity = None
+        unit = UNIT_ALIASES.get(str(unit).strip().lower().rstrip('.')) if unit else None
+    else:
+        text = str(item).strip()
+        for symbol, fraction in UNICODE_FRACTIONS.items():
+            text = text.replace(symbol, f' {fraction}')
+        match = QUANTITY.match(text)
+        if match is None:
+            return (text, None, None, None, None)
+        try:
+            quantity = parse_quantity(match.group('quantity'))
+        except (ZeroDivisionError, OverflowError):
+            return (text, None, None, None, None)
+        if not _is_valid_quantity(quantity):
+            return (text, None, None, None, None)
+        rest = match.group('rest')
+        first, _, remainder = rest.partition(' ')
+        unit = UNIT_ALIASES.get(first.lower().rstrip('.'))
+        name = remainder.strip() if unit else rest.strip()
+
+    if quantity is None:
+        return (name, None, None, None, None)
+    if unit is None:
+        return (name, quantity, None, quantity, 'piece')
+    _, base_unit, factor = UNITS[unit]
+    return (name, quantity, unit, quantity * factor, base_unit)
+
+
+def parse_ingredients(ingredients):
+    """Parse a recipe's ingredients into the column arrays stored in parsed_ingredients."""
+    if not isinstance(ingredients, list):
+        ingredients = [ingredients] if ingredients else []
+    rows = [parse_ingredient(item) for item in ingredients]
+    return {column: [row[index] for row in rows] for index, column in enumerate(COLUMNS)}
+
+
+def _round(value):
+    return None if value is None else round(value, 2)
+
+
+def scale(parsed, factor):
+    """Return the ingredient list of parsed scaled by factor."""
+    quantities = [None if quantity is None else quantity * factor for quantity in parsed['quantity']]
+    return [
+        {'name': name, 'quantity': _round(quantity), 'unit': unit}
+        for name, quantity, unit in zip(parsed['name'], quantities, parsed['unit'])
+    ]
+
+
+class ScaledIngredientsCache:
+    """Small thread-safe LRU of scaled ingredient lists keyed on (recipe id, version, servings)."""
+
+    def __init__(self, size=1024):
+        self.size = size
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get_or_compute(self, key, compute):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+        value = compute()
+        with self.lock:
+            self.entries[key] = value
+            if len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+        return value
+
+
+scaled_cache = ScaledIngredientsCache()
+
+
+def scaled_ingredients(recipe, servings):
+    """The recipe's ingredients for the given number of servings, memoized per recipe version."""
+    return scaled_cache.get_or_compute(
+        (recipe.pk, recipe.version, servings),
+        lambda: scale(recipe.parsed_ingredients or parse_ingredients(recipe.ingredients), servings / (recipe.servings or 1)),
+    )
+
+
+def display_amount(base_quantity, base_unit):
+    """Express a base amount in the largest display unit giving at least 1, e.g. 1500 g as 1.5 kg."""
+    for unit, factor in DISPLAY_UNITS.get(base_unit, []):
+        if base_quantity >= factor:
+            return _round(base_quantity / factor), unit
+    if base_unit == 'piece':
+        return _round(base_quantity), None
+    return _round(base_quantity), base_unit
+
+
+class IngredientAggregator:
+    """
+    Streaming merge of parsed ingredient lists. Amounts of the same ingredient
+    (case-insensitive name) and dimension are summed in base units; entries
+    without an amount are listed once.
+    """
+
+    def __init__(self):
+        self.amounts = {}
+        self.names = {}
+        self.unmeasured = {}
+
+    def add(self, parsed, factor=1):
+        for name, base_quantity, base_unit in zip(parsed['name'], parsed['base_quantity'], parsed['base_unit']):
+            key = name.lower()
+            if base_quantity is None:
+                self.unmeasured.setdefault(key, name)
+                continue
+            self.names.setdefault(key, name)
+            self.amounts[key, base_unit] = self.amounts.get((key, base_unit), 0) + base_quantity * factor
+
+    def result(self):
+        items = []
+        for (key, base_unit), base_quantity in self.amounts.items():
+            quantity, unit = display_amount(base_quantity, base_unit)
+            items.append({'name': self.names[key], 'quantity': quantity, 'unit': unit})
+        measured = {key for key, _ in self.amounts}
+        for key, name in self.unmeasured.items():
+            if key not in measured:
+                items.append({'name': name, 'quantity': None, 'unit': None})
+        return sorted(items, key=lambda item: (item['name'].lower(), item['unit'] or ''))
+
+
+def aggregate(parsed_lists):
+    """Merge an iterable of parsed ingredient lists into one list."""
+    aggregator = IngredientAggregator()
+    for parsed in parsed_lists:
+        aggregator.add(parsed)
+    return aggregator.result()
@@ -0,0 +1,138 @@
+import gc
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from recipe_api.warmup import warm_up
+
+# A cold worker: a fresh interpreter importing the application and serving one request
+COLD_WORKER = '''
+import json, sys
+from recipes.management.commands.bench_boot import first_response, memory_usage
+module, attribute = sys.argv[1].rsplit('.', 1)
+__import__(module)
+status = first_response(getattr(sys.modules[module], attribute), sys.argv[2])
+print(json.dumps({'status': status, **memory_usage()}), flush=True)
+'''
+
+
+def first_response(application, path):
+    """Call the WSGI application with a GET of path and return the status code."""
+    from wsgiref.util import setup_testing_defaults
+
+    environ = {'PATH_INFO': path, 'REQUEST_METHOD': 'GET', 'wsgi.url_scheme': 'https'}
+    setup_testing_defaults(environ)
+    result = {}
+
+    def start_response(status, headers, exc_info=None):
+        result['status'] = int(status.split()[0])
+
+    body = application(environ, start_response)
+    try:
+        for _ in body:
+            pass
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+    return result['status']
+
+
+def memory_usage():
+    """Return the process' RSS, PSS and private (unshared) memory in KiB from /proc/self/smaps_rollup."""
+    values = {}
+    with open('/proc/self/smaps_rollup') as rollup:
+        for line in rollup:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                values[parts[0].rstrip(':')] = int(parts[1])
+    return {
+        'rss_kb': values.get('Rss', 0),
+        'pss_kb': values.get('Pss', 0),
+        'private_kb': values.get('Private_Clean', 0) + values.get('Private_Dirty', 0),
+    }
+
+
+class Command(BaseCommand):
+    """
+    Measure worker boot: time to first response and memory per worker.
+
+    cold starts every worker as a new interpreter that imports the application
+    and serves one request. preload imports and warms the application once in
+    this process (see recipe_api/warmup.py), freezes the collector and forks
+    the workers, as gunicorn does with gunicorn.conf.py. Memory is read from
+    /proc, so this needs Linux.
+    """
+    help = 'Benchmark time to first response and memory per worker, cold versus preloaded.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/api/recipes/', help='Path of the first request.')
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--mode', choices=['cold', 'preload', 'both'], default='both')
+        parser.add_argument('--application', default=settings.WSGI_APPLICATION)
+
+    def handle(self, *args, **options):
+        if not os.path.exists('/proc/self/smaps_rollup') or not hasattr(os, 'fork'):
+            raise CommandError('bench_boot needs Linux (fork and /proc/self/smaps_rollup).')
+
+        if options['mode'] in ('cold', 'both'):
+            self.report('cold', [self.cold_worker(options) for _ in range(options['workers'])])
+        if options['mode'] in ('preload', 'both'):
+            self.report('preload', self.preloaded_workers(options))
+
+    def cold_worker(self, options):
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': settings.SETTINGS_MODULE,
+               'PYTHONPATH': os.pathsep.join(filter(None, [os.getcwd(), os.environ.get('PYTHONPATH')]))}
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, '-c', COLD_WORKER, options['application'], options['path']],
+                                env=env, capture_output=True, text=True)
+        elapsed = (time.perf_counter() - start) * 1000
+        if result.returncode:
+            raise CommandError(f'Cold worker failed:\n{result.stderr[-2000:]}')
+        return {'ms': elapsed, **json.loads(result.stdout.strip().splitlines()[-1])}
+
+    def preloaded_workers(self, options):
+        module, attribute = options['application'].rsplit('.', 1)
+        __import__(module)
+        application = getattr(sys.modules[module], attribute)
+        timings = warm_up()
+        self.stdout.write(f'Warm-up (ms): {timings}')
+        gc.freeze()
+
+        results = []
+        for _ in range(options['workers']):
+            read_fd, write_fd = os.pipe()
+            start = time.perf_counter()
+            pid = os.fork()
+            if pid == 0:
+                os.close(read_fd)
+                try:
+                    status = first_response(application, options['path'])
+                    os.write(write_fd, json.dumps({'status': status, **memory_usage()}).encode())
+                finally:
+                    os._exit(0)
+            os.close(write_fd)
+            with os.fdopen(read_fd) as pipe:
+                data = pipe.read()
+            elapsed = (time.perf_counter() - start) * 1000
+            os.waitpid(pid, 0)
+            if not data:
+                raise CommandError('Forked worker failed.')
+            results.append({'ms': elapsed, **json.loads(data)})
+        gc.unfreeze()
+        return results
+
+    def report(self, mode, results):
+        statuses = sorted({result['status'] for result in results})
+        self.stdout.write(self.style.SUCCESS(
+            f'{mode}: {len(results)} worker(s), status {statuses}\n'
+            f'  time to first response: median {statistics.median(r["ms"] for r in results):.1f} ms, '
+            f'max {max(r["ms"] for r in results):.1f} ms\n'
+            f'  per worker: RSS {statistics.mean(r["rss_kb"] for r in results) / 1024:.1f} MiB, '
+            f'PSS {statistics.mean(r["pss_kb"] for r in results) / 1024:.1f} MiB, '
+            f'private {statistics.mean(r["private_kb"] for r in results) / 1024:.1f} MiB'))
@@ -0,0 +1,61 @@
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from rest_framework.authtoken.models import Token
+
+DEFAULT_ENDPOINTS = [
+    '/api/recipes/',
+    '/api/reviews/',
+    '/api/FollowingFeedView/',
+    '/api/FavoriteFeedView/',
+    '/accounts/following/',
+]
+
+ENCODINGS = ['identity', 'gzip', 'br']
+
+
+class Command(BaseCommand):
+    """
+    Measure bytes on the wire and latency per endpoint with compression off
+    (identity) and on (gzip, br), using the in-process test client.
+    """
+    help = 'Benchmark response size and latency per endpoint with and without compression.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('endpoints', nargs='*', default=DEFAULT_ENDPOINTS)
+        parser.add_argument('--username', help='User to authenticate as (defaults to the first user).')
+        parser.add_argument('--requests', type=int, default=50, help='Requests per endpoint and encoding.')
+
+    def handle(self, *args, **options):
+        user_model = get_user_model()
+        if options['username']:
+            user = user_model.objects.filter(username=options['username']).first()
+        else:
+            user = user_model.objects.order_by('pk').first()
+        if user is None:
+            raise CommandError('No user to authenticate as.')
+        token, _ = Token.objects.get_or_create(user=user)
+
+        client = Client(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.stdout.write(f'{"endpoint":<32}{"accept":<10}{"sent":<10}{"bytes":>10}{"p50 ms":>10}{"p95 ms":>10}')
+        for endpoint in options['endpoints']:
+            for encoding in ENCODINGS:
+                sizes, timings = [], []
+                for _ in range(options['requests']):
+                    start = time.perf_counter()
+                    response = client.get(endpoint, secure=True, HTTP_ACCEPT_ENCODING=encoding)
+                    content = b''.join(response.streaming_content) if response.streaming else response.content
+                    timings.append((time.perf_counter() - start) * 1000)
+                    sizes.append(len(content))
+                if response.status_code != 200:
+                    self.stderr.write(f'{endpoint} returned {response.status_code}')
+                    break
+                used = response.get('Content-Encoding', 'identity')
+                p95 = statistics.quantiles(timings, n=20)[-1] if len(timings) > 1 else timings[0]
+                self.stdout.write(
+                    f'{endpoint:<32}{encoding:<10}{used:<10}{statistics.mean(sizes):>10.0f}'
+                    f'{statistics.median(timings):>10.2f}{p95:>10.2f}'
+                )
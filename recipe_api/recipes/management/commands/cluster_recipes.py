@@ -0,0 +1,110 @@
+from django.core.management.base import BaseCommand
+
+from recipes.dedup import BANDS, get_setting, index_recipes, similarity, unpack
+from recipes.models import Recipe, RecipeSignature, RecipeSignatureBand
+
+
+class UnionFind:
+    """Disjoint sets of the recipe ids found similar, holding only ids that are in a pair."""
+
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, item):
+        root = item
+        while self.parent.get(root, root) != root:
+            root = self.parent[root]
+        while item != root:
+            self.parent[item], item = root, self.parent[item]
+        return root
+
+    def union(self, first, second):
+        first, second = self.find(first), self.find(second)
+        if first != second:
+            self.parent.setdefault(first, first)
+            self.parent.setdefault(second, second)
+            self.parent[max(first, second)] = min(first, second)
+
+    def groups(self):
+        groups = {}
+        for item in self.parent:
+            groups.setdefault(self.find(item), []).append(item)
+        return groups
+
+
+def buckets(band, chunk_size):
+    """Yield the recipe ids of every bucket of a band with two or more recipes, streamed in bucket order."""
+    rows = (RecipeSignatureBand.objects.filter(band=band).order_by('bucket', 'recipe_id')
+            .values_list('bucket', 'recipe_id').iterator(chunk_size=chunk_size))
+    current, members = None, []
+    for bucket, recipe_id in rows:
+        if bucket != current:
+            if len(members) > 1:
+                yield members
+            current, members = bucket, []
+        members.append(recipe_id)
+    if len(members) > 1:
+        yield members
+
+
+class Command(BaseCommand):
+    """
+    Group the catalog into clusters of near-duplicate recipes.
+
+    Recipes without a signature are indexed first, in batches. The clusters
+    are then built one LSH band at a time from the buckets streamed in order,
+    comparing the signatures within each bucket only, so memory holds one
+    bucket and the ids of the recipes found similar, never all the signatures.
+    """
+    help = 'Index recipe signatures and list clusters of near-duplicate recipes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reindex', action='store_true', help='Recompute the signatures of every recipe.')
+        parser.add_argument('--threshold', type=float, default=None,
+                            help='Minimum estimated similarity, RECIPE_DEDUP["THRESHOLD"] by default.')
+        parser.add_argument('--batch-size', type=int, default=500, help='Recipes indexed per batch.')
+        parser.add_argument('--max-bucket', type=int, default=200,
+                            help='Skip buckets with more recipes than this, e.g. of recipes with a single ingredient.')
+        parser.add_argument('--limit', type=int, default=50, help='Largest clusters to list.')
+
+    def handle(self, *args, **options):
+        indexed = self.index(options['reindex'], options['batch_size'])
+        self.stdout.write(f'Indexed {indexed} recipe(s).')
+
+        threshold = get_setting('THRESHOLD') if options['threshold'] is None else options['threshold']
+        clusters = UnionFind()
+        for band in range(BANDS):
+            for members in buckets(band, options['batch_size'] * 10):
+                if len(members) > options['max_bucket']:
+                    continue
+                if len({clusters.find(recipe_id) for recipe_id in members}) == 1:
+                    continue
+                signatures = {pk: unpack(data) for pk, data in
+                              RecipeSignature.objects.filter(recipe_id__in=members).values_list('recipe_id', 'signature')}
+                for i, first in enumerate(members):
+                    for second in members[i + 1:]:
+                        if (clusters.find(first) != clusters.find(second)
+                                and similarity(signatures[first], signatures[second]) >= threshold):
+                            clusters.union(first, second)
+
+        groups = sorted(clusters.groups().values(), key=len, reverse=True)
+        titles = dict(Recipe.objects.filter(pk__in=[pk for group in groups[:options['limit']] for pk in group])
+                      .values_list('pk', 'title'))
+        for group in groups[:options['limit']]:
+            group.sort()
+            self.stdout.write(f'{len(group)} recipes: ' + ', '.join(f'{pk} ({titles.get(pk, "")})' for pk in group))
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(groups)} cluster(s) of near-duplicates, {sum(map(len, groups))} recipe(s) in total.'))
+
+    def index(self, reindex, batch_size):
+        """Index the recipes in primary key order, one batch at a time."""
+        recipes = Recipe.objects.order_by('pk').only('pk', 'ingredients', 'instructions', 'parsed_ingredients')
+        if not reindex:
+            recipes = recipes.filter(signature__isnull=True)
+        indexed, last = 0, 0
+        while True:
+            batch = list(recipes.filter(pk__gt=last)[:batch_size])
+            if not batch:
+                return indexed
+            indexed += index_recipes(batch)
+            last = batch[-1].pk
@@ -0,0 +1,81 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from recipes.media import media_fields, revision_pictures
+from recipes.models import RecipeRevision
+
+
+def walk(root):
+    """Yield (relative name, modification time) of every file below root without listing whole trees."""
+    stack = ['']
+    while stack:
+        directory = stack.pop()
+        with os.scandir(os.path.join(root, directory)) as entries:
+            for entry in entries:
+                name = f'{directory}/{entry.name}' if directory else entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(name)
+                elif entry.is_file(follow_symlinks=False):
+                    yield name, entry.stat(follow_symlinks=False).st_mtime
+
+
+def referenced_names():
+    """Return the set of file names stored in any file field or recipe revision, streamed from the database."""
+    names = set()
+    for model, field in media_fields():
+        queryset = model._base_manager.exclude(**{f'{field}__isnull': True}).exclude(**{field: ''})
+        names.update(queryset.values_list(field, flat=True).iterator(chunk_size=2000))
+    names.update(revision_pictures(RecipeRevision.objects.all()))
+    return names
+
+
+class Command(BaseCommand):
+    """
+    Delete files under MEDIA_ROOT that no row refers to anymore, e.g. pictures
+    left behind by a crash between a delete and its after-commit cleanup.
+    """
+    help = 'Delete orphaned uploaded files from MEDIA_ROOT.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only list the orphaned files.')
+        parser.add_argument('--min-age', type=int, default=3600,
+                            help='Keep files younger than this many seconds, which may belong to uploads in progress.')
+        parser.add_argument('--workers', type=int, default=4, help='Threads deleting files.')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Files handed to the workers at a time.')
+
+    def handle(self, *args, **options):
+        root = str(settings.MEDIA_ROOT)
+        if not os.path.isdir(root):
+            self.stdout.write(f'{root} does not exist, nothing to do.')
+            return
+
+        referenced = referenced_names()
+        cutoff = time.time() - options['min_age']
+        orphans = (
+            name for name, modified in walk(root)
+            if modified < cutoff and name not in referenced
+        )
+
+        found = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            while True:
+                chunk = list(islice(orphans, options['chunk_size']))
+                if not chunk:
+                    break
+                found += len(chunk)
+                if options['dry_run']:
+                    for name in chunk:
+                        self.stdout.write(name)
+                else:
+                    # Waiting for every chunk keeps the number of queued deletions bounded
+                    list(executor.map(default_storage.delete, chunk))
+
+        action = 'Found' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} {found} orphaned file(s), {len(referenced)} file(s) referenced.'))
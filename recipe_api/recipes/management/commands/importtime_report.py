@@ -0,0 +1,101 @@
+import os
+import re
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+# Run in a fresh interpreter, whose stderr gets the -X importtime lines
+# (__import__ rather than importlib.import_module, which -X importtime does not log)
+SCRIPT = '''
+import sys
+module, attribute = sys.argv[1].rsplit('.', 1)
+__import__(module)
+getattr(sys.modules[module], attribute)
+if sys.argv[2] == '1':
+    from django.urls import get_resolver
+    get_resolver().url_patterns
+'''
+
+# Modules worth knowing about when they are loaded at startup
+NOTABLE = ['PIL', 'django.test', 'unittest', 'yaml', 'pygments', 'django.contrib.admin', 'rest_framework_simplejwt']
+
+
+def parse(output):
+    """Return (module, self µs, cumulative µs, depth) for every line of -X importtime output."""
+    rows = []
+    for line in output.splitlines():
+        match = LINE.match(line)
+        if match:
+            rows.append((match[4], int(match[1]), int(match[2]), len(match[3]) // 2))
+    return rows
+
+
+def parents(rows):
+    """Map every module to the module that first imported it (None at the top level)."""
+    # importtime prints a module after everything it imported, one level deeper
+    result = {}
+    stack = []
+    for name, _, _, depth in reversed(rows):
+        del stack[depth:]
+        result.setdefault(name, stack[-1] if stack else None)
+        stack.append(name)
+    return result
+
+
+class Command(BaseCommand):
+    """
+    Report where a fresh worker spends its startup time: imports the WSGI
+    application (and optionally the URLconf, as the first request does) in a
+    new interpreter run with -X importtime, then lists the slowest imports,
+    the time per top-level package and which notable optional modules got
+    loaded, and by whom.
+    """
+    help = 'Measure import time of the WSGI application with python -X importtime.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--application', default=settings.WSGI_APPLICATION,
+                            help='Dotted path of the object to import, WSGI_APPLICATION by default.')
+        parser.add_argument('--no-urls', action='store_true', help='Do not import the URLconf.')
+        parser.add_argument('--top', type=int, default=20, help='Number of modules and packages to list.')
+
+    def handle(self, *args, **options):
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': settings.SETTINGS_MODULE}
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', SCRIPT, options['application'], '0' if options['no_urls'] else '1'],
+            env=env, capture_output=True, text=True)
+        if result.returncode:
+            raise CommandError(f'Importing {options["application"]} failed:\n{result.stderr[-2000:]}')
+
+        rows = parse(result.stderr)
+        imported_by = parents(rows)
+        total = sum(own for _, own, _, _ in rows)
+        self.stdout.write(f'{len(rows)} modules imported in {total / 1000:.1f} ms\n')
+
+        self.stdout.write('Slowest imports (cumulative ms, self ms, imported by):')
+        for name, own, cumulative, _ in sorted(rows, key=lambda row: -row[2])[:options['top']]:
+            self.stdout.write(f'  {cumulative / 1000:8.1f} {own / 1000:8.1f}  {name}  <- {imported_by[name] or "-"}')
+
+        packages = {}
+        for name, own, _, _ in rows:
+            package = name.split('.')[0]
+            packages[package] = packages.get(package, 0) + own
+        self.stdout.write('\nTime per top-level package (self ms):')
+        for package, own in sorted(packages.items(), key=lambda item: -item[1])[:options['top']]:
+            self.stdout.write(f'  {own / 1000:8.1f}  {package}')
+
+        self.stdout.write('\nNotable modules loaded at startup (cumulative ms, import chain):')
+        cumulative = {name: total for name, _, total, _ in rows}
+        found = False
+        for name in NOTABLE:
+            if name in cumulative:
+                found = True
+                chain = [name]
+                while imported_by.get(chain[-1]):
+                    chain.append(imported_by[chain[-1]])
+                self.stdout.write(f'  {cumulative[name] / 1000:8.1f}  {" <- ".join(chain)}')
+        if not found:
+            self.stdout.write('  none')
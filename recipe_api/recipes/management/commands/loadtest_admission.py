@@ -0,0 +1,88 @@
+import statistics
+import threading
+import time
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+from rest_framework.authtoken.models import Token
+
+
+class Command(BaseCommand):
+    """
+    Flood the recipe search with concurrent requests and measure the latency of
+    a cheap route (recipe retrieve) before and during the flood, to check that
+    admission control keeps cheap routes responsive.
+    """
+    help = 'Load test admission control: cheap route latency under a search flood.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--flood-threads', type=int, default=16)
+        parser.add_argument('--probe-threads', type=int, default=2)
+        parser.add_argument('--duration', type=float, default=5.0, help='Seconds per phase.')
+        parser.add_argument('--search', default='a', help='Search term used by the flood.')
+
+    def handle(self, *args, **options):
+        users = list(get_user_model().objects.order_by('pk')[:2])
+        if len(users) < 2:
+            raise CommandError('The load test needs at least two users.')
+        recipe = users[0].recipes.first() or users[1].recipes.first()
+        if recipe is None:
+            raise CommandError('The load test needs at least one recipe.')
+
+        flood_token = Token.objects.get_or_create(user=users[0])[0].key
+        probe_token = Token.objects.get_or_create(user=users[1])[0].key
+        probe_path = f'/api/recipes/{recipe.pk}/'
+        flood_path = f'/api/recipes/?search={options["search"]}'
+
+        baseline, _ = self.run_phase(options, probe_path, probe_token, None, None)
+        flooded, statuses = self.run_phase(options, probe_path, probe_token, flood_path, flood_token)
+
+        self.report('baseline', baseline)
+        self.report('under flood', flooded)
+        self.stdout.write('flood responses: ' + ', '.join(f'{code}: {count}' for code, count in sorted(statuses.items())))
+
+    def run_phase(self, options, probe_path, probe_token, flood_path, flood_token):
+        stop = threading.Event()
+        timings = []
+        statuses = Counter()
+        lock = threading.Lock()
+
+        def probe():
+            client = Client(HTTP_AUTHORIZATION=f'Token {probe_token}')
+            while not stop.is_set():
+                start = time.perf_counter()
+                client.get(probe_path, secure=True)
+                with lock:
+                    timings.append((time.perf_counter() - start) * 1000)
+            connections.close_all()
+
+        def flood():
+            client = Client(HTTP_AUTHORIZATION=f'Token {flood_token}')
+            while not stop.is_set():
+                response = client.get(flood_path, secure=True)
+                with lock:
+                    statuses[response.status_code] += 1
+            connections.close_all()
+
+        threads = [threading.Thread(target=probe) for _ in range(options['probe_threads'])]
+        if flood_path is not None:
+            threads += [threading.Thread(target=flood) for _ in range(options['flood_threads'])]
+        for thread in threads:
+            thread.start()
+        time.sleep(options['duration'])
+        stop.set()
+        for thread in threads:
+            thread.join()
+        return timings, statuses
+
+    def report(self, label, timings):
+        if len(timings) < 2:
+            self.stdout.write(f'{label}: not enough samples')
+            return
+        percentiles = statistics.quantiles(timings, n=100)
+        self.stdout.write(
+            f'{label}: {len(timings)} probe requests, p50 {percentiles[49]:.2f} ms, p99 {percentiles[98]:.2f} ms'
+        )
@@ -0,0 +1,67 @@
+"""
+Removal of uploaded files that no longer belong to any row.
+
+Uploads are stored under content-hashed names and identical files are shared
+(see recipe_api/storage.py), so a file is only removed once no FileField in
+any model refers to it anymore, and no recipe revision either: old versions
+of a recipe keep the name of the picture they had (see recipes/history.py).
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.apps import apps
+from django.core.files.storage import default_storage
+from django.db import connections, models, transaction
+from django.db.models import Q
+
+from .models import RecipeRevision
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='media-cleanup')
+
+
+def media_fields():
+    """Yield (model, field name) for every file field stored in the default storage."""
+    for model in apps.get_models():
+        for field in model._meta.concrete_fields:
+            if isinstance(field, models.FileField) and field.storage is default_storage:
+                yield model, field.name
+
+
+def revision_pictures(revisions):
+    """Return the set of picture names stored in the snapshots and changes of the revisions queryset."""
+    names = set()
+    rows = revisions.values_list('snapshot__picture', 'changes__picture__value').iterator(chunk_size=2000)
+    for in_snapshot, in_changes in rows:
+        names.update(name for name in (in_snapshot, in_changes) if name)
+    return names
+
+
+def is_referenced(name):
+    return any(
+        model._base_manager.filter(**{field: name}).exists()
+        for model, field in media_fields()
+    ) or RecipeRevision.objects.filter(Q(snapshot__picture=name) | Q(changes__picture__value=name)).exists()
+
+
+def remove_unreferenced(names):
+    """Delete the given stored files unless some row or revision still refers to them."""
+    try:
+        for name in names:
+            if not is_referenced(name):
+                default_storage.delete(name)
+    except Exception:
+        logger.exception('Failed to remove media files %s', names)
+    finally:
+        connections.close_all()
+
+
+def schedule_media_cleanup(names):
+    """
+    Remove the files in a background thread once the current transaction
+    commits. Files missed here (e.g. on a crash) are collected by gc_media.
+    """
+    names = [name for name in names if name]
+    if names:
+        transaction.on_commit(lambda: _executor.submit(remove_unreferenced, names))
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.2 on 2026-10-18 23:29
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RatingSummary',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rating_summary', serialize=False, to='recipes.recipe')),
+                ('rating_1', models.PositiveIntegerField(default=0)),
+                ('rating_2', models.PositiveIntegerField(default=0)),
+                ('rating_3', models.PositiveIntegerField(default=0)),
+                ('rating_4', models.PositiveIntegerField(default=0)),
+                ('rating_5', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='rateandreview',
+            index=models.Index(fields=['recipe', 'created_date'], name='review_recipe_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rateandreview',
+            index=models.Index(fields=['recipe', 'rating', 'created_date'], name='review_recipe_rating_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.2 on 2026-10-18 23:29
+
+from collections import defaultdict
+
+from django.db import migrations
+from django.db.models import Count
+
+
+def backfill_rating_summaries(apps, schema_editor):
+    RateAndReview = apps.get_model('recipes', 'RateAndReview')
+    RatingSummary = apps.get_model('recipes', 'RatingSummary')
+
+    histograms = defaultdict(dict)
+    counts = (RateAndReview.objects.filter(rating__isnull=False)
+              .values_list('recipe_id', 'rating').annotate(number=Count('pk')).order_by())
+    for recipe_id, rating, number in counts.iterator():
+        histograms[recipe_id][f'rating_{rating}'] = number
+
+    RatingSummary.objects.all().delete()
+    RatingSummary.objects.bulk_create(
+        [RatingSummary(recipe_id=recipe_id, **histogram) for recipe_id, histogram in histograms.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0002_ratingsummary_review_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_rating_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.2 on 2026-10-18 23:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_backfill_ratingsummary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+        migrations.CreateModel(
+            name='RecipeRevision',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField()),
+                ('snapshot', models.JSONField(blank=True, null=True)),
+                ('changes', models.JSONField(blank=True, null=True)),
+                ('created_date', models.DateTimeField(auto_now_add=True)),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='revisions', to='recipes.recipe')),
+            ],
+            options={
+                'ordering': ['recipe', 'version'],
+                'constraints': [models.UniqueConstraint(fields=('recipe', 'version'), name='unique_recipe_revision_version')],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.2 on 2026-10-18 23:37
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_total_time(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Recipe.objects.update(total_time=F('preparation_time') + Coalesce(F('cooking_time'), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_recipe_version_reciperevision'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='total_time',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Preparation plus cooking time in minutes'),
+        ),
+        migrations.RunPython(fill_total_time, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['total_time'], name='recipe_total_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['category', 'total_time'], name='recipe_category_time_idx'),
+        ),
+    ]
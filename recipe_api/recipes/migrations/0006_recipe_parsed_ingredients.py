@@ -0,0 +1,34 @@
+# Generated by Django 5.1.2 on 2026-10-18 23:38
+
+from django.db import migrations, models
+
+
+def fill_parsed_ingredients(apps, schema_editor):
+    from recipes.ingredients import parse_ingredients
+
+    Recipe = apps.get_model('recipes', 'Recipe')
+    batch = []
+    for recipe in Recipe.objects.only('pk', 'ingredients').iterator(chunk_size=1000):
+        recipe.parsed_ingredients = parse_ingredients(recipe.ingredients)
+        batch.append(recipe)
+        if len(batch) == 1000:
+            Recipe.objects.bulk_update(batch, ['parsed_ingredients'])
+            batch = []
+    if batch:
+        Recipe.objects.bulk_update(batch, ['parsed_ingredients'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_recipe_total_time'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='parsed_ingredients',
+            field=models.JSONField(default=dict, editable=False),
+        ),
+        migrations.RunPython(fill_parsed_ingredients, migrations.RunPython.noop),
+    ]
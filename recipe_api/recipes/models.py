@@ -2,6 +2,8 @@ from django.db import models
 from django.conf import settings
 from django.core.validators import MinValueValidator, MaxValueValidator
 
+from .ingredients import parse_ingredients
+
 CATEGORY_CHOICES = [
     ('appetizer', 'Appetizer'),
     ('main_course', 'Main Course'),
@@ -35,15 +37,100 @@ class Recipe(models.Model):
     servings = models.IntegerField(validators=[MinValueValidator(1)], help_text='Number of servings')
     created_date = models.DateField(auto_now_add=True)
     updated_date = models.DateField(auto_now=True)
+    version = models.PositiveIntegerField(default=1, editable=False)# Incremented on every update, see RecipeRevision
+    total_time = models.PositiveIntegerField(default=0, editable=False, help_text='Preparation plus cooking time in minutes')
+    parsed_ingredients = models.JSONField(default=dict, editable=False)# Columns parsed from ingredients, see recipes/ingredients.py
 
     class Meta:
         ordering = ['created_date']
         verbose_name = 'Recipe'
         verbose_name_plural = 'Recipes'
+        indexes = [
+            models.Index(fields=['total_time'], name='recipe_total_time_idx'),
+            models.Index(fields=['category', 'total_time'], name='recipe_category_time_idx'),
+            models.Index(fields=['title'], name='recipe_title_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
+    def compute_total_time(self):
+        """Set total_time from the preparation and cooking times, returning whether it changed."""
+        total_time = (self.preparation_time or 0) + (self.cooking_time or 0)
+        changed = total_time != self.total_time
+        self.total_time = total_time
+        return changed
+
+    def compute_parsed_ingredients(self):
+        """Parse the ingredients into parsed_ingredients, returning whether it changed."""
+        parsed = parse_ingredients(self.ingredients)
+        changed = parsed != self.parsed_ingredients
+        self.parsed_ingredients = parsed
+        return changed
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or {'preparation_time', 'cooking_time'} & set(update_fields):
+            self.compute_total_time()
+            if update_fields is not None:
+                update_fields = {*update_fields, 'total_time'}
+        if update_fields is None or 'ingredients' in update_fields:
+            self.compute_parsed_ingredients()
+            if update_fields is not None:
+                update_fields = {*update_fields, 'parsed_ingredients'}
+        if update_fields is not None:
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
+
+class RecipeRevision(models.Model):
+    """
+        Append-only history of a recipe. Every few versions the revision holds a
+        full snapshot of the recipe's fields, the others only the changes from
+        the previous version (compact diffs for long text and lists).
+    """
+
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, related_name='revisions')
+    version = models.PositiveIntegerField()
+    snapshot = models.JSONField(blank=True, null=True)
+    changes = models.JSONField(blank=True, null=True)
+    created_date = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['recipe', 'version']
+        constraints = [
+            models.UniqueConstraint(fields=['recipe', 'version'], name='unique_recipe_revision_version')
+        ]
+
+    def __str__(self):
+        return f"{self.recipe_id} version {self.version}"
+
+class RecipeSignature(models.Model):
+    """
+        MinHash signature of a recipe's ingredients and instructions, used to
+        find near-duplicate recipes (see recipes/dedup.py).
+    """
+
+    recipe = models.OneToOneField(Recipe, on_delete=models.CASCADE, primary_key=True, related_name='signature')
+    signature = models.BinaryField()
+
+    def __str__(self):
+        return f"Signature of recipe {self.recipe_id}"
+
+class RecipeSignatureBand(models.Model):
+    """Locality-sensitive hashing bucket of one band of a recipe's signature."""
+
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, related_name='signature_bands')
+    band = models.PositiveSmallIntegerField()
+    bucket = models.BigIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['band', 'bucket'], name='signature_band_bucket_idx'),
+        ]
+
+    def __str__(self):
+        return f"Recipe {self.recipe_id} band {self.band}"
+
 class RateAndReview(models.Model):
     """Model for storing ratings and review data based on the Recipe model."""
 
@@ -56,10 +143,48 @@ class RateAndReview(models.Model):
 
     class Meta:
         unique_together = ('user', 'recipe')
+        indexes = [
+            # Newest first listing and rating ordering/filtering of a recipe's reviews
+            models.Index(fields=['recipe', 'created_date'], name='review_recipe_created_idx'),
+            models.Index(fields=['recipe', 'rating', 'created_date'], name='review_recipe_rating_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user} reviewed {self.recipe.title} - Rating: {self.rating}"
 
+class RatingSummary(models.Model):
+    """
+        Number of ratings per star of a recipe, kept up to date on every review write
+        so the histogram and average are read from a single row.
+    """
+
+    recipe = models.OneToOneField(Recipe, on_delete=models.CASCADE, primary_key=True, related_name='rating_summary')
+    rating_1 = models.PositiveIntegerField(default=0)
+    rating_2 = models.PositiveIntegerField(default=0)
+    rating_3 = models.PositiveIntegerField(default=0)
+    rating_4 = models.PositiveIntegerField(default=0)
+    rating_5 = models.PositiveIntegerField(default=0)
+
+    STARS = range(1, 6)
+
+    @property
+    def histogram(self):
+        return {star: getattr(self, f'rating_{star}') for star in self.STARS}
+
+    @property
+    def count(self):
+        return sum(self.histogram.values())
+
+    @property
+    def average(self):
+        count = self.count
+        if not count:
+            return None
+        return round(sum(star * number for star, number in self.histogram.items()) / count, 2)
+
+    def __str__(self):
+        return f"Ratings of recipe {self.recipe_id}: {self.histogram}"
+
 class Favorite(models.Model):
     """Model for storing favorite recipes from the Recipe model."""
 
@@ -14,4 +14,8 @@ class FollowingFeedPagination(PageNumberPagination):
 
 class FavoriteFeedPagination(PageNumberPagination):
     """Paginate the number of retrived recipes to a limit of 20 per page."""
-    page_size = 20
\ No newline at end of file
+    page_size = 20
+
+class RecipeHistoryPagination(PageNumberPagination):
+    """Paginate the number of retrived recipe revisions to a limit of 30 per page."""
+    page_size = 30
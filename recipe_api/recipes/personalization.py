@@ -0,0 +1,69 @@
+from django.db.models import BooleanField, Exists, IntegerField, OuterRef, Subquery, Value
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS
+
+from .models import Favorite, RateAndReview
+
+
+class PersonalFieldsMixin:
+    """
+    View mixin adding per-user fields to recipe read requests.
+
+    ?include=is_favorited,my_rating adds whether the current user favorited
+    each recipe and the rating they gave it. Both are computed as subquery
+    annotations of the recipe query, so a page costs no extra queries however
+    many recipes it holds. Anonymous users get False and null.
+    """
+
+    def get_includes(self):
+        """Return the tuple of optional field names requested with ?include=."""
+        if not hasattr(self, '_includes'):
+            self._includes = self._parse_includes()
+        return self._includes
+
+    def _parse_includes(self):
+        if self.request is None or self.request.method not in SAFE_METHODS:
+            return ()
+        value = self.request.query_params.get('include')
+        if not value:
+            return ()
+
+        available = self.get_serializer_class().optional_fields
+        names = [name.strip() for name in value.split(',') if name.strip()]
+        unknown = [name for name in names if name not in available]
+        if unknown:
+            raise ValidationError({'include': [f'Unknown field(s): {", ".join(unknown)}. Choose from: {", ".join(available)}.']})
+        return tuple(name for name in available if name in names)
+
+    def annotate_includes(self, queryset):
+        """Annotate the recipes with the requested per-user fields."""
+        includes = self.get_includes()
+        if not includes:
+            return queryset
+
+        user = self.request.user
+        annotations = {}
+        if 'is_favorited' in includes:
+            if user.is_authenticated:
+                annotations['is_favorited'] = Exists(Favorite.objects.filter(user_id=user.pk, recipe=OuterRef('pk')))
+            else:
+                annotations['is_favorited'] = Value(False, output_field=BooleanField())
+        if 'my_rating' in includes:
+            if user.is_authenticated:
+                annotations['my_rating'] = Subquery(
+                    RateAndReview.objects.filter(user_id=user.pk, recipe=OuterRef('pk')).values('rating')[:1])
+            else:
+                annotations['my_rating'] = Value(None, output_field=IntegerField())
+        return queryset.annotate(**annotations)
+
+    def get_serializer(self, *args, **kwargs):
+        includes = self.get_includes()
+        if includes:
+            kwargs.setdefault('include', includes)
+        return super().get_serializer(*args, **kwargs)
+
+    def get_fast_rows(self, queryset, **kwargs):
+        return super().get_fast_rows(self.annotate_includes(queryset), extra=self.get_includes(), **kwargs)
+
+    def get_fast_serializer(self, rows, **kwargs):
+        return super().get_fast_serializer(rows, extra=self.get_includes(), **kwargs)
@@ -0,0 +1,94 @@
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS
+
+
+class FieldProjectionMixin:
+    """
+    View mixin adding sparse fieldsets to read requests.
+
+    - ?fields=title,picture returns only the listed fields.
+    - ?exclude=instructions,ingredients returns every field but the listed ones.
+    - ?preset=card selects one of the serializer's named ``presets``.
+
+    The selected fields also limit the columns read from the database, so large
+    TEXT/JSON columns are never loaded when they are not requested.
+    """
+
+    def get_projected_fields(self):
+        """
+        Return the tuple of field names requested by the client, or None when
+        every field should be returned.
+        """
+        if not hasattr(self, '_projected_fields'):
+            self._projected_fields = self._parse_projection()
+        return self._projected_fields
+
+    def _parse_projection(self):
+        if self.request is None or self.request.method not in SAFE_METHODS:
+            return None
+
+        params = self.request.query_params
+        fields = self._split(params.get('fields'))
+        exclude = self._split(params.get('exclude'))
+        preset = params.get('preset')
+        if not fields and not exclude and not preset:
+            return None
+
+        serializer_class = self.get_serializer_class()
+        available = list(serializer_class.Meta.fields)
+
+        if fields and preset:
+            raise ValidationError({'fields': ['Use either fields or preset, not both.']})
+
+        if preset:
+            presets = getattr(serializer_class, 'presets', {})
+            if preset not in presets:
+                raise ValidationError({'preset': [f'Unknown preset. Choose from: {", ".join(presets)}.']})
+            selected = set(presets[preset])
+        elif fields:
+            self._check_known('fields', fields, available)
+            selected = set(fields)
+        else:
+            selected = set(available)
+
+        if exclude:
+            self._check_known('exclude', exclude, available)
+            selected -= set(exclude)
+
+        if not selected:
+            raise ValidationError({'fields': ['At least one field must be selected.']})
+
+        # Keep the serializer's field order
+        return tuple(name for name in available if name in selected)
+
+    @staticmethod
+    def _split(value):
+        if not value:
+            return []
+        return [name.strip() for name in value.split(',') if name.strip()]
+
+    @staticmethod
+    def _check_known(param, names, available):
+        unknown = [name for name in names if name not in available]
+        if unknown:
+            raise ValidationError({param: [f'Unknown field(s): {", ".join(unknown)}.']})
+
+    def project_queryset(self, queryset, *required):
+        """Defer every column the projected fields and the required columns do not need."""
+        fields = self.get_projected_fields()
+        if fields is None:
+            return queryset
+        return queryset.only(*self.fast_serializer_class.columns(fields), *required)
+
+    def get_serializer(self, *args, **kwargs):
+        fields = self.get_projected_fields()
+        if fields is not None:
+            kwargs.setdefault('fields', fields)
+        return super().get_serializer(*args, **kwargs)
+
+    def get_fast_rows(self, queryset, **kwargs):
+        return self.fast_serializer_class.get_rows(queryset, self.get_projected_fields(), **kwargs)
+
+    def get_fast_serializer(self, rows, **kwargs):
+        return self.fast_serializer_class(
+            rows, context=self.get_serializer_context(), fields=self.get_projected_fields(), **kwargs)
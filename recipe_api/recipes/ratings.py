@@ -0,0 +1,140 @@
+"""
+Incremental maintenance of the per-recipe rating histograms (RatingSummary).
+
+Every write of a review passes the ratings it removes and adds to
+update_histograms(), which adjusts the counters with F() expressions in the
+same transaction, so reading a histogram is a single primary key lookup.
+"""
+from collections import Counter, defaultdict
+
+from django.db import connections, transaction
+from django.db.models import Count, F
+
+from .models import RateAndReview, RatingSummary
+
+
+def update_histograms(changes):
+    """
+    Apply (recipe_id, rating, delta) changes to the rating summaries.
+    Null ratings are ignored; missing summary rows are created.
+    """
+    per_recipe = defaultdict(Counter)
+    for recipe_id, rating, delta in changes:
+        if rating is not None:
+            per_recipe[recipe_id][rating] += delta
+
+    for recipe_id, deltas in per_recipe.items():
+        updates = {f'rating_{rating}': F(f'rating_{rating}') + delta for rating, delta in deltas.items() if delta}
+        if not updates:
+            continue
+        summaries = RatingSummary.objects.filter(recipe_id=recipe_id)
+        if not summaries.update(**updates):
+            RatingSummary.objects.bulk_create([RatingSummary(recipe_id=recipe_id)], ignore_conflicts=True)
+            summaries.update(**updates)
+
+
+def rating_changed(old, new):
+    """
+    Update the histograms for a review going from old to new, each being a
+    (recipe_id, rating) pair or None for a created or deleted review.
+    """
+    changes = []
+    if old is not None:
+        changes.append((old[0], old[1], -1))
+    if new is not None:
+        changes.append((new[0], new[1], 1))
+    update_histograms(changes)
+
+
+def delete_reviews(queryset):
+    """
+    Delete the reviews of the queryset with a single DELETE statement,
+    taking their ratings out of the histograms. Returns the deleted count.
+    """
+    with transaction.atomic():
+        counts = queryset.filter(rating__isnull=False).values_list('recipe_id', 'rating').annotate(
+            number=Count('pk')).order_by()
+        update_histograms((recipe_id, rating, -number) for recipe_id, rating, number in counts)
+        return queryset._raw_delete(queryset.db)
+
+
+def rate_recipe(user, recipe_id, **values):
+    """
+    Create or update the user's review of a recipe with a single upsert
+    (INSERT ... ON CONFLICT / ON DUPLICATE KEY UPDATE) and update the
+    recipe's histogram in the same transaction. Only the given values
+    (rating and/or review) are overwritten on an existing review.
+
+    The recipe must exist. Returns (review, summary, created).
+    """
+    with transaction.atomic():
+        # Locking the summary row serializes concurrent ratings of the recipe,
+        # so the previous rating read below is the one being replaced
+        RatingSummary.objects.bulk_create([RatingSummary(recipe_id=recipe_id)], ignore_conflicts=True)
+        summary = RatingSummary.objects.select_for_update().get(recipe_id=recipe_id)
+        reviews = RateAndReview.objects.filter(user=user, recipe_id=recipe_id)
+        previous = reviews.values_list('rating').first()
+        created = previous is None
+
+        connection = connections[RateAndReview.objects.db]
+        unique_fields = ['user', 'recipe'] if connection.features.supports_update_conflicts_with_target else None
+        RateAndReview.objects.bulk_create(
+            [RateAndReview(user=user, recipe_id=recipe_id, **values)],
+            update_conflicts=True,
+            update_fields=[*values, 'updated_date'],
+            unique_fields=unique_fields,
+        )
+        review = reviews.get()
+
+        rating_changed(None if created else (recipe_id, previous[0]), (recipe_id, review.rating))
+        summary.refresh_from_db()
+    return review, summary, created
+
+
+def get_summary(recipe_id):
+    """Return the recipe's RatingSummary, an empty unsaved one if it has no ratings yet."""
+    return RatingSummary.objects.filter(recipe_id=recipe_id).first() or RatingSummary(recipe_id=recipe_id)
+
+
+def summary_data(summary):
+    return {
+        'count': summary.count,
+        'average': summary.average,
+        'histogram': {str(star): number for star, number in summary.histogram.items()},
+    }
+
+
+class RatingSummaryMixin:
+    """
+    View mixin keeping the rating histograms in step with review writes made
+    through the create, update and destroy actions.
+    """
+
+    def perform_create(self, serializer):
+        # The serializer answers 400 for an existing review; one created
+        # concurrently since then is updated by the upsert instead of failing
+        data = serializer.validated_data
+        values = {name: data[name] for name in ('rating', 'review') if name in data}
+        serializer.instance, _, _ = rate_recipe(data['user'], data['recipe'].pk, **values)
+
+    def locked_rating(self, review):
+        """
+        Read the stored (recipe_id, rating) of the review and lock its row, so
+        that a concurrent update or deletion waits and then reads what this
+        one stored instead of the rating both were loaded with. None when the
+        review is gone.
+        """
+        return RateAndReview.objects.select_for_update().filter(pk=review.pk).values_list('recipe_id', 'rating').first()
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            old = self.locked_rating(serializer.instance)
+            review = serializer.save()
+            rating_changed(old, (review.recipe_id, review.rating))
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            old = self.locked_rating(instance)
+            if old is not None:
+                rating_changed(old, None)
+                instance.delete()
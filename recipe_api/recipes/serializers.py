@@ -1,5 +1,7 @@
 from rest_framework import serializers
-from .models import Recipe, RateAndReview, Favorite
+from .models import Recipe, RecipeRevision, RateAndReview, Favorite
+from recipe_api.instrumentation import TimedListSerializer
+from recipe_api.fast_serializers import FastSerializer
 
 class RecipeSerializer(serializers.ModelSerializer):
     """
@@ -17,6 +19,7 @@ class RecipeSerializer(serializers.ModelSerializer):
         servings: Number of servings the recipe yields.
         created_date: Timestamp of when the recipe was created (read-only).
         updated_date: Timestamp of when the recipe was last updated (read-only).
+        version: Number of the recipe's current version, incremented on every update (read-only).
     """
     
     class Meta:
@@ -24,9 +27,37 @@ class RecipeSerializer(serializers.ModelSerializer):
         fields = [
             'creator', 'title', 'picture', 'description', 'ingredients', 
             'instructions', 'category', 'preparation_time', 
-            'cooking_time', 'servings', 'created_date', 'updated_date'
+            'cooking_time', 'servings', 'created_date', 'updated_date', 'version'
         ]
-        read_only_fields = ['created_date', 'updated_date']
+        read_only_fields = ['created_date', 'updated_date', 'version']
+        list_serializer_class = TimedListSerializer
+
+    # Named field selections for ?preset=
+    presets = {
+        'card': ['creator', 'title', 'picture', 'category', 'preparation_time', 'cooking_time', 'servings'],
+        'full': Meta.fields,
+    }
+
+    # Per-user fields added with ?include=, read from queryset annotations
+    optional_fields = {
+        'is_favorited': serializers.BooleanField,
+        'my_rating': serializers.IntegerField,
+    }
+
+    def __init__(self, *args, **kwargs):
+        """
+        Accept an optional 'fields' argument limiting the serialized fields to the given names,
+        and an 'include' argument adding the given optional_fields.
+        """
+        fields = kwargs.pop('fields', None)
+        include = kwargs.pop('include', ())
+        super().__init__(*args, **kwargs)
+
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+        for name in include:
+            self.fields[name] = self.optional_fields[name](read_only=True, allow_null=True)
 
     def validate_title(self, value):
         """
@@ -171,6 +202,26 @@ class RecipeSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError('Servings can only be one or more')
         return value
 
+class RecipeRevisionSerializer(serializers.ModelSerializer):
+    """
+    Serializer listing the revisions of a recipe.
+
+    Fields:
+        version: the version the revision created.
+        created_date: Timestamp of the revision (read-only).
+        changed_fields: the fields changed from the previous version, null for full snapshots.
+    """
+    changed_fields = serializers.SerializerMethodField()
+
+    class Meta:
+        model = RecipeRevision
+        fields = ['version', 'created_date', 'changed_fields']
+
+    def get_changed_fields(self, revision):
+        if revision.changes is None:
+            return None
+        return sorted(revision.changes)
+
 class RateAndReviewSerializer(serializers.ModelSerializer):
     """
     Serializer for the RatingAndReview model, handling the creation of the RatingAndReview data.
@@ -188,6 +239,33 @@ class RateAndReviewSerializer(serializers.ModelSerializer):
         model = RateAndReview
         fields = ['user', 'recipe', 'review', 'rating', 'created_date', 'updated_date']
         read_only_fields = ['created_date', 'updated_date']
+        list_serializer_class = TimedListSerializer
+
+class RecipeRatingSerializer(serializers.ModelSerializer):
+    """
+    Serializer validating the rating and optional review of the rate action.
+
+    Fields:
+        rating: an out of 5 rating of the recipe.
+        review: an optional review message.
+    """
+
+    class Meta:
+        model = RateAndReview
+        fields = ['rating', 'review']
+        extra_kwargs = {'rating': {'required': True, 'allow_null': False}}
+
+class FastRecipeSerializer(FastSerializer):
+    """
+    Read-only counterpart of RecipeSerializer used for list responses.
+    """
+    serializer_class = RecipeSerializer
+
+class FastRateAndReviewSerializer(FastSerializer):
+    """
+    Read-only counterpart of RateAndReviewSerializer used for list responses.
+    """
+    serializer_class = RateAndReviewSerializer
 
 class FavoriteSerializer(serializers.ModelSerializer):
     """
@@ -200,3 +278,28 @@ class FavoriteSerializer(serializers.ModelSerializer):
     model = Favorite
     class Meta:
         fields = ['user', 'recipe']
+
+class FavoriteBatchSerializer(serializers.Serializer):
+    """
+        Serializer validating a batch of favorite changes.
+
+        Fields:
+            add: ids of the recipes to add to the user's favorites
+            remove: ids of the recipes to remove from the user's favorites
+    """
+    MAX_BATCH_SIZE = 500
+
+    add = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False,
+                                default=list, max_length=MAX_BATCH_SIZE)
+    remove = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False,
+                                   default=list, max_length=MAX_BATCH_SIZE)
+
+    def validate(self, data):
+        """Checks that the batch is not empty and no recipe is both added and removed"""
+        if not data['add'] and not data['remove']:
+            raise serializers.ValidationError('Provide recipe ids to add and/or remove.')
+        both = set(data['add']) & set(data['remove'])
+        if both:
+            raise serializers.ValidationError(
+                f'Recipes cannot be added and removed at once: {", ".join(map(str, sorted(both)))}.')
+        return data
@@ -0,0 +1,64 @@
+"""
+Shopping lists merged from several recipes.
+
+The ingredients of the chosen recipes are read with one query over
+(id, parsed_ingredients), streamed into an IngredientAggregator and summed
+per ingredient in base units. Results are cached under the user and a hash
+of the (id, version) pairs of the recipes, so editing or deleting any of
+them changes the key and the stale list is never served again.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .ingredients import IngredientAggregator
+from .models import Favorite, Recipe
+
+DEFAULTS = {
+    'CACHE': 'default',
+    'TIMEOUT': 600,
+    'MAX_RECIPES': 100,
+}
+
+
+def get_setting(name):
+    return getattr(settings, 'SHOPPING_LIST', {}).get(name, DEFAULTS[name])
+
+
+def cache_key(user, versions):
+    digest = hashlib.sha1(','.join(f'{pk}:{version}' for pk, version in versions).encode()).hexdigest()
+    return f'recipes:shopping-list:{user.pk}:{digest}'
+
+
+def shopping_list(user, recipe_ids=None):
+    """
+    Return the merged shopping list of the given recipes, or of the user's
+    favorites when recipe_ids is None, as a dict with the ids of the recipes
+    found and the ingredient list. Like lists of ids, favorites are capped at
+    MAX_RECIPES: the most recent ones are used, and the dict then also says
+    whether any were left out under truncated.
+    """
+    truncated = None
+    if recipe_ids is None:
+        max_recipes = get_setting('MAX_RECIPES')
+        favorites = Favorite.objects.filter(user=user).order_by('-pk').values_list('recipe_id', flat=True)
+        recipe_ids = list(favorites[:max_recipes + 1])
+        truncated = len(recipe_ids) > max_recipes
+        recipe_ids = recipe_ids[:max_recipes]
+    versions = list(Recipe.objects.filter(pk__in=recipe_ids).order_by('pk').values_list('pk', 'version'))
+
+    cache = caches[get_setting('CACHE')]
+    key = cache_key(user, versions)
+    result = cache.get(key)
+    if result is None:
+        aggregator = IngredientAggregator()
+        rows = Recipe.objects.filter(pk__in=[pk for pk, _ in versions]).values_list('parsed_ingredients', flat=True)
+        for parsed in rows.iterator(chunk_size=500):
+            if parsed:
+                aggregator.add(parsed)
+        result = {'recipes': [pk for pk, _ in versions], 'ingredients': aggregator.result()}
+        cache.set(key, result, get_setting('TIMEOUT'))
+    if truncated is not None:
+        result = {**result, 'truncated': truncated}
+    return result
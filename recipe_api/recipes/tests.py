@@ -1,3 +1,1206 @@
-from django.test import TestCase
+import gzip
+import tempfile
+from importlib import import_module
+from types import SimpleNamespace
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.apps import apps
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.db.models import Count, F, Q
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.exceptions import NotFound
+from rest_framework.test import APIClient, APIRequestFactory
+
+from accounts.models import CustomUser
+from recipe_api import throttling
+from recipe_api.instrumentation import registry
+from recipe_api.middleware import CompressionMiddleware, brotli
+from recipe_api.renderers import FastJSONRenderer
+
+from . import cache as recipe_cache
+from .dedup import index_new_recipe
+from .deletion import delete_recipes, recipe_dependents
+from .facets import TIME_BUCKETS, facet_counts, facet_index, recipes_deleted
+from .filters import RecipeFilterBackend
+from .history import PreconditionFailed, diff, etag, etag_matches, get_version, patch, save_version, snapshot
+from .ingredients import parse_ingredient, parse_ingredients, scale, scaled_cache
+from .management.commands.gc_media import referenced_names
+from .media import is_referenced, remove_unreferenced
+from .models import Favorite, RateAndReview, RatingSummary, Recipe, RecipeRevision, RecipeSignature
+from .ratings import rate_recipe, rating_changed
+from .serializers import RateAndReviewSerializer, RecipeSerializer
+from .shopping import shopping_list
+from .views import RateAndReviewViewSet, RecipeAndReviewsListView, RecipeViewSet
+
+
+def create_recipe(creator, **fields):
+    values = {
+        'title': 'Pancakes',
+        'ingredients': ['200 g flour', '2 eggs'],
+        'instructions': 'Mix and fry.',
+        'category': 'breakfast',
+        'preparation_time': 10,
+        'cooking_time': 15,
+        'servings': 4,
+    }
+    values.update(fields)
+    return Recipe.objects.create(creator=creator, **values)
+
+
+def clear_caches():
+    # The rolled back tests reuse recipe ids, and so cache keys
+    caches['default'].clear()
+    recipe_cache.recipes.local.clear()
+    recipe_cache.representations.local.clear()
+    scaled_cache.entries.clear()
+
+
+@override_settings(ADMISSION_CONTROL={'ENABLED': False}, SECURE_SSL_REDIRECT=False)
+class FastListTests(TestCase):
+    """The fast list path returns the same bytes as DRF's serializers and JSONRenderer."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(username='cook', email='cook@example.com', password='x')
+        cls.other = CustomUser.objects.create_user(username='other', email='other@example.com', password='x')
+        cls.user.following.add(cls.other)
+        recipes = [
+            create_recipe(cls.other, title='Crêpes\u2028line', picture='images/crepes 1.jpg'),
+            create_recipe(cls.other, title='Soup', category='soup', cooking_time=None, description='Ünïcode ✓'),
+            create_recipe(cls.user, title='Bread', category='bread',
+                          ingredients=[{'name': 'flour', 'quantity': 0.5, 'unit': 'kg'}, '1 tsp salt']),
+        ]
+        for recipe in recipes:
+            Favorite.objects.create(user=cls.user, recipe=recipe)
+            RateAndReview.objects.create(user=cls.user, recipe=recipe, rating=4, review='Good ')
+        cls.recipe = recipes[0]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, url):
+        response = self.client.get(url, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response.content
+
+    def assertSameAsDRF(self, url, view_class):
+        fast = self.get(url)
+        with mock.patch.object(view_class, 'fast_serializer_class', None), \
+                mock.patch.object(view_class, 'renderer_classes', [JSONRenderer]):
+            original = self.get(url)
+        self.assertEqual(fast, original)
+
+    def test_recipe_list(self):
+        self.assertSameAsDRF('/api/recipes/', RecipeViewSet)
+
+    def test_recipe_list_projected(self):
+        self.assertSameAsDRF('/api/recipes/?fields=title,picture,cooking_time', RecipeViewSet)
+
+    def test_review_lists(self):
+        self.assertSameAsDRF('/api/reviews/', RateAndReviewViewSet)
+        self.assertSameAsDRF(f'/api/{self.recipe.pk}/reviews/', RecipeAndReviewsListView)
+
+    def test_feeds(self):
+        for url, recipes in [
+            ('/api/FollowingFeedView/', Recipe.objects.filter(creator=self.other)),
+            ('/api/FavoriteFeedView/', Recipe.objects.all()),
+        ]:
+            response = self.client.get(url, HTTP_ACCEPT='application/json')
+            expected = RecipeSerializer(recipes.order_by('-updated_date'), many=True).data
+            self.assertEqual(FastJSONRenderer().render(response.data['results']), JSONRenderer().render(expected))
+
+    def test_renderer_rejects_non_finite_floats(self):
+        for value in [float('nan'), float('inf')]:
+            data = {'results': [{'quantity': value, 'unit': None}]}
+            with self.assertRaises(ValueError):
+                JSONRenderer().render(data)
+            with self.assertRaises(ValueError):
+                FastJSONRenderer().render(data)
+
+
+@override_settings(ADMISSION_CONTROL={'ENABLED': False}, SECURE_SSL_REDIRECT=False)
+class PersonalFieldsTests(TestCase):
+    """?include=is_favorited,my_rating costs no queries beyond those of the plain read."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(username='cook', email='cook@example.com', password='x')
+        cls.recipes = [create_recipe(cls.user, title=f'Recipe {index}') for index in range(5)]
+        Favorite.objects.create(user=cls.user, recipe=cls.recipes[0])
+        RateAndReview.objects.create(user=cls.user, recipe=cls.recipes[1], rating=3)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, url):
+        response = self.client.get(url, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_list(self):
+        # The count and the page, whatever the page size
+        with self.assertNumQueries(2):
+            data = self.get('/api/recipes/?include=is_favorited,my_rating')
+        personal = {item['title']: (item['is_favorited'], item['my_rating']) for item in data['results']}
+        self.assertEqual(len(personal), 5)
+        self.assertEqual(personal['Recipe 0'], (True, None))
+        self.assertEqual(personal['Recipe 1'], (False, 3))
+        self.assertEqual(personal['Recipe 2'], (False, None))
+
+    def test_retrieve(self):
+        for recipe, expected in [(self.recipes[0], (True, None)), (self.recipes[1], (False, 3))]:
+            with self.assertNumQueries(1):
+                data = self.get(f'/api/recipes/{recipe.pk}/?include=is_favorited,my_rating')
+            self.assertEqual((data['is_favorited'], data['my_rating']), expected)
+
+    def test_anonymous(self):
+        self.client.force_authenticate(None)
+        with self.assertNumQueries(1):
+            data = self.get(f'/api/recipes/{self.recipes[0].pk}/?include=is_favorited,my_rating')
+        self.assertEqual((data['is_favorited'], data['my_rating']), (False, None))
+
+
+@override_settings(ADMISSION_CONTROL={'ENABLED': False}, SECURE_SSL_REDIRECT=False)
+class RecipeFilterTests(TestCase):
+    """Each typed filter of the recipe list, its validation and the indexes it uses."""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = CustomUser.objects.create_user(username='cook', email='cook@example.com', password='x')
+        create_recipe(user, title='Pancakes', category='breakfast', preparation_time=10, cooking_time=15, servings=4)
+        create_recipe(user, title='Gazpacho', category='soup', preparation_time=20, cooking_time=None, servings=6,
+                      ingredients=['1 kg tomatoes', '1 cucumber'])
+        create_recipe(user, title='Bread', category='bread', preparation_time=30, cooking_time=45, servings=1)
+        create_recipe(user, title='Lentil soup', category='soup', preparation_time=5, cooking_time=0, servings=2)
+
+    def titles(self, query):
+        response = APIClient().get('/api/recipes/', query, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return {item['title'] for item in response.json()['results']}
+
+    def errors(self, query):
+        response = APIClient().get('/api/recipes/', query, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 400)
+        return response.json()
+
+    def test_search(self):
+        self.assertEqual(self.titles({'search': 'SOUP'}), {'Gazpacho', 'Lentil soup'})
+        self.assertEqual(self.titles({'search': 'cucumber'}), {'Gazpacho'})
+
+    def test_category(self):
+        self.assertEqual(self.titles({'category': 'soup'}), {'Gazpacho', 'Lentil soup'})
+        self.assertEqual(self.titles({'category': 'bread, breakfast'}), {'Bread', 'Pancakes'})
+
+    def test_preparation_time(self):
+        self.assertEqual(self.titles({'min_preparation_time': '10', 'max_preparation_time': '20'}),
+                         {'Pancakes', 'Gazpacho'})
+
+    def test_cooking_time_counts_null_as_zero(self):
+        self.assertEqual(self.titles({'max_cooking_time': '15'}), {'Pancakes', 'Gazpacho', 'Lentil soup'})
+        self.assertEqual(self.titles({'min_cooking_time': '0', 'max_cooking_time': '0'}), {'Gazpacho', 'Lentil soup'})
+        self.assertEqual(self.titles({'min_cooking_time': '1'}), {'Pancakes', 'Bread'})
+
+    def test_total_time(self):
+        self.assertEqual(self.titles({'max_total_time': '20'}), {'Gazpacho', 'Lentil soup'})
+        self.assertEqual(self.titles({'min_total_time': '25', 'max_total_time': '75'}), {'Pancakes', 'Bread'})
+
+    def test_servings(self):
+        self.assertEqual(self.titles({'min_servings': '4'}), {'Pancakes', 'Gazpacho'})
+        self.assertEqual(self.titles({'max_servings': '1'}), {'Bread'})
+
+    def test_legacy_params(self):
+        self.assertEqual(self.titles({'cooking_time': '15'}), {'Pancakes', 'Gazpacho', 'Lentil soup'})
+        self.assertEqual(self.titles({'preparation_time': '10'}), {'Pancakes', 'Lentil soup'})
+        self.assertEqual(self.titles({'servings': '6'}), {'Gazpacho'})
+        self.assertEqual(set(self.errors({'servings': 'many'})), {'servings'})
+
+    def test_combined(self):
+        self.assertEqual(self.titles({'category': 'soup', 'max_total_time': '10', 'search': 'lentil'}), {'Lentil soup'})
+
+    def test_bad_values(self):
+        errors = self.errors({'min_total_time': '-1', 'max_servings': 'x', 'category': 'soup,stew',
+                              'min_preparation_time': '30', 'max_preparation_time': '10'})
+        self.assertEqual(set(errors), {'min_total_time', 'max_servings', 'category', 'min_preparation_time'})
+
+    @skipUnless(connection.vendor == 'sqlite', 'Query plans are checked on SQLite')
+    def test_time_filters_use_the_indexes(self):
+        def plan(query):
+            request = Request(APIRequestFactory().get('/api/recipes/', query))
+            view = SimpleNamespace(action='list')
+            return RecipeFilterBackend().filter_queryset(request, Recipe.objects.all(), view).explain()
+
+        self.assertIn('USING INDEX recipe_total_time_idx', plan({'min_total_time': '10', 'max_total_time': '30'}))
+        self.assertIn('USING INDEX recipe_category_time_idx', plan({'category': 'soup,bread', 'max_total_time': '30'}))
+
+
+class DuplicateDetectionTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(username='cook', email='cook@example.com', password='x')
+
+    def test_similar_recipes(self):
+        first = create_recipe(self.user, instructions='Mix the flour and the eggs, then fry in butter.')
+        self.assertEqual(index_new_recipe(first), [])
+        second = create_recipe(self.user, title='Crêpes', instructions='Mix the flour and the eggs, then fry in butter.')
+        self.assertEqual([(pk, score) for pk, _, score in index_new_recipe(second)], [(first.pk, 1.0)])
+
+    def test_recipes_without_features_are_not_duplicates(self):
+        for title in ['Water', 'Ice']:
+            recipe = create_recipe(self.user, title=title, ingredients=[], instructions='...')
+            self.assertEqual(index_new_recipe(recipe), [])
+        self.assertFalse(RecipeSignature.objects.exists())
+
+
+@override_settings(ADMISSION_CONTROL={'ENABLED': False}, SECURE_SSL_REDIRECT=False)
+class AdminTests(TestCase):
+    """Admin writes go through the same helpers as the API's."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_superuser(username='admin', email='admin@example.com', password='x')
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.admin)
+
+    def post(self, url, data):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 302, response.content[:2000])
+
+    def recipe_form(self, **fields):
+        data = {
+            'creator': self.admin.pk, 'title': 'Pancakes', 'description': '',
+            'ingredients': '["200 g flour", "2 eggs"]', 'instructions': 'Mix the flour and the eggs, then fry.',
+            'category': 'breakfast', 'preparation_time': 10, 'cooking_time': 15, 'servings': 4,
+        }
+        data.update(fields)
+        return data
+
+    def facets(self):
+        response = APIClient().get('/api/recipes/?facets=true', HTTP_ACCEPT='application/json')
+        return response.json()['facets']['category']
+
+    def test_recipe_add_change_delete(self):
+        self.post('/admin/recipes/recipe/add/', self.recipe_form())
+        recipe = Recipe.objects.get()
+        self.assertEqual(recipe.total_time, 25)
+        self.assertEqual(list(RecipeRevision.objects.values_list('version', flat=True)), [1])
+        self.assertTrue(RecipeSignature.objects.filter(recipe=recipe).exists())
+        self.assertEqual(self.facets()['breakfast'], 1)
+
+        signature = RecipeSignature.objects.get(recipe=recipe).signature
+        self.post(f'/admin/recipes/recipe/{recipe.pk}/change/', self.recipe_form(
+            category='dessert', cooking_time='', ingredients='["200 g flour", "2 eggs", "sugar"]'))
+        recipe.refresh_from_db()
+        self.assertEqual((recipe.version, recipe.category, recipe.total_time), (2, 'dessert', 10))
+        self.assertEqual(RecipeRevision.objects.get(version=2).changes.keys(), {'category', 'cooking_time', 'ingredients'})
+        self.assertNotEqual(bytes(RecipeSignature.objects.get(recipe=recipe).signature), bytes(signature))
+        self.assertEqual((self.facets()['breakfast'], self.facets()['dessert']), (0, 1))
+        response = APIClient().get(f'/api/recipes/{recipe.pk}/', HTTP_ACCEPT='application/json')
+        self.assertEqual(response.json()['category'], 'dessert')
+
+        RateAndReview.objects.create(user=self.admin, recipe=recipe, rating=5)
+        self.post(f'/admin/recipes/recipe/{recipe.pk}/delete/', {'post': 'yes'})
+        self.assertFalse(Recipe.objects.exists())
+        self.assertFalse(RateAndReview.objects.exists())
+        self.assertFalse(RecipeRevision.objects.exists())
+        self.assertEqual(self.facets()['dessert'], 0)
+
+    def test_review_histograms(self):
+        recipe = create_recipe(self.admin)
+        summary = RatingSummary.objects.filter(recipe=recipe)
+        data = {'recipe': recipe.pk, 'user': self.admin.pk, 'rating': 4, 'review': ''}
+        self.post('/admin/recipes/rateandreview/add/', data)
+        review = RateAndReview.objects.get()
+        self.assertEqual(summary.get().histogram, {1: 0, 2: 0, 3: 0, 4: 1, 5: 0})
+
+        self.post(f'/admin/recipes/rateandreview/{review.pk}/change/', {**data, 'rating': 2})
+        self.assertEqual(summary.get().histogram, {1: 0, 2: 1, 3: 0, 4: 0, 5: 0})
+
+        self.post(f'/admin/recipes/rateandreview/{review.pk}/delete/', {'post': 'yes'})
+        self.assertEqual(summary.get().count, 0)
+
+
+@override_settings(ADMISSION_CONTROL={'ENABLED': False}, SECURE_SSL_REDIRECT=False)
+class FacetGenerationTests(TestCase):
+    """With a process-local cache, workers notice other workers' writes through the database."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(username='cook', email='cook@example.com', password='x')
+        cls.recipe = create_recipe(cls.user, category='soup')
+
+    def setUp(self):
+        facet_index.generation = facet_index.checked = None
+
+    def categories(self):
+        return {name: count for name, count in facet_index.counts()['category'].items() if count}
+
+    @override_settings(FACETS={'CHECK_INTERVAL': 0})
+    def test_writes_of_other_workers(self):
+        self.assertEqual(self.categories(), {'soup': 1})
+        # Writes without this process' facet hooks, as another worker's look here
+        other = create_recipe(self.user, category='bread')
+        self.assertEqual(self.categories(), {'soup': 1, 'bread': 1})
+        Recipe.objects.filter(pk=self.recipe.pk).update(category='bread', version=F('version') + 1)
+        self.assertEqual(self.categories(), {'bread': 2})
+        Recipe.objects.filter(pk=other.pk).delete()
+        self.assertEqual(self.categories(), {'bread': 1})
+
+    @override_settings(FACETS={'CHECK_INTERVAL': 3600})
+    def test_writes_of_this_process_are_seen_at_once(self):
+        self.assertEqual(self.categories(), {'soup': 1})
+        with self.captureOnCommitCallbacks(execute=True):
+            Recipe.objects.filter(pk=self.recipe.pk).delete()
+            recipes_deleted([self.recipe.pk])
+        self.assertEqual(self.categories(), {})
+
+
+@override_settings(ADMISSION_CONTROL={'ENABLED': False}, SECURE_SSL_REDIRECT=False)
+class RecipeCacheTests(TestCase):
+    """With a process-local cache, cached recipes are checked against the database."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(username='cook', email='cook@example.com', password='x')
+        cls.recipe = create_recipe(cls.user)
+
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+        self.url = f'/api/recipes/{self.recipe.pk}/'
+
+    def get(self, **headers):
+        return self.client.get(self.url, HTTP_ACCEPT='application/json', **headers)
+
+    def test_writes_of_other_workers(self):
+        old_etag = self.get()['ETag']
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get(HTTP_IF_NONE_MATCH=old_etag).status_code, 304)
+
+        # Written without this process' cache hooks, as by another worker
+        Recipe.objects.filter(pk=self.recipe.pk).update(title='Waffles', version=F('version') + 1)
+        response = self.get(HTTP_IF_NONE_MATCH=old_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['title'], 'Waffles')
+        self.assertNotEqual(response['ETag'], old_etag)
+
+        Recipe.objects.filter(pk=self.recipe.pk).delete()
+        self.assertEqual(self.get().status_code, 404)
+
+
+@override_settings(ADMISSION_CONTROL={'ENABLED': False}, SECURE_SSL_REDIRECT=False)
+class IngredientTests(TestCase):
+
+    def setUp(self):
+        clear_caches()
+
+    def test_parse_text(self):
+        self.assertEqual(parse_ingredient('1 1/2 cups flour'), ('flour', 1.5, 'cup', 1.5 * 236.588, 'ml'))
+        self.assertEqual(parse_ingredient('½ tsp salt'), ('salt', 0.5, 'tsp', 0.5 * 4.92892, 'ml'))
+        self.assertEqual(parse_ingredient('0,5 kg potatoes'), ('potatoes', 0.5, 'kg', 500.0, 'g'))
+        self.assertEqual(parse_ingredient('2 eggs'), ('eggs', 2.0, None, 2.0, 'piece'))
+        self.assertEqual(parse_ingredient('salt to taste'), ('salt to taste', None, None, None, None))
+        self.assertEqual(parse_ingredient('1/0 cup milk'), ('1/0 cup milk', None, None, None, None))
+
+    def test_parse_dict(self):
+        self.assertEqual(parse_ingredient({'name': ' Milk ', 'quantity': '0.5', 'unit': 'L.'}),
+                         ('Milk', 0.5, 'l', 500.0, 'ml'))
+        self.assertEqual(parse_ingredient({'name': 'basil', 'quantity': 'a handful'}), ('basil', None, None, None, None))
+
+    def test_non_finite_and_huge_amounts_are_unparsed(self):
+        for quantity in ['nan', 'inf', '-inf', float('nan'), float('inf'), 10 ** 400, 2 * 10 ** 9]:
+            self.assertEqual(parse_ingredient({'name': 'milk', 'quantity': quantity, 'unit': 'ml'}),
+                             ('milk', None, None, None, None))
+        for text in ['9' * 400 + ' g sugar', '2000000000 g rice']:
+            self.assertEqual(parse_ingredient(text), (text, None, None, None, None))
+
+    def test_scale(self):
+        parsed = parse_ingredients(['200 g flour', '2 eggs', 'salt'])
+        self.assertEqual(scale(parsed, 1.5), [
+            {'name': 'flour', 'quantity': 300.0, 'unit': 'g'},
+            {'name': 'eggs', 'quantity': 3.0, 'unit': None},
+            {'name': 'salt', 'quantity': None, 'unit': None},
+        ])
+
+    def test_scaled_retrieve(self):
+        user = CustomUser.objects.create_user(username='cook', email='cook@example.com', password='x')
+        recipe = create_recipe(user, servings=2, ingredients=['1 cup milk', {'name': 'sugar', 'quantity': 'nan'}])
+        response = APIClient().get(f'/api/recipes/{recipe.pk}/?servings=6', HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['scaled_ingredients'], [
+            {'name': 'milk', 'quantity': 3.0, 'unit': 'cup'},
+            {'name': 'sugar', 'quantity': None, 'unit': None},
+        ])
+
+    def test_backfill_migration(self):
+        user = CustomUser.objects.create_user(username='cook', email='cook@example.com', password='x')
+        recipes = [create_recipe(user, ingredients=[f'{index} g flour']) for index in range(1, 4)]
+        Recipe.objects.update(parsed_ingredients={})
+        migration = import_module('recipes.migrations.0006_recipe_parsed_ingredients')
+        migration.fill_parsed_ingredients(apps, None)
+        for recipe in recipes:
+            recipe.refresh_from_db()
+            self.assertEqual(recipe.parsed_ingredients, parse_ingredients(recipe.ingredients))
+            self.assertTrue(recipe.parsed_ingredients['name'])
+
+
+ADMISSION_CONTROL = {
+    'ENABLED': True,
+    'RATES': {'user': {'CAPACITY': 10, 'REFILL_RATE': 0.01}, 'anon': {'CAPACITY': 3, 'REFILL_RATE': 0.01}},
+    'COSTS': {'recipe-list': 2, 'recipe-list:search': 10},
+    'EXPENSIVE_COST': 5,
+    'MAX_IN_FLIGHT': 4,
+    'MAX_EXPENSIVE_IN_FLIGHT': 0,
+    'RETRY_AFTER': 7,
+}
+
+
+@override_settings(ADMISSION_CONTROL=ADMISSION_CONTROL, SECURE_SSL_REDIRECT=False)
+class AdmissionControlTests(TestCase):
+    """Token bucket throttling (429) and load shedding (503) of the requests."""
+
+    def setUp(self):
+        caches['default'].clear()
+        self.client = APIClient()
+
+    def get(self, url):
+        return self.client.get(url, HTTP_ACCEPT='application/json')
+
+    def test_bucket_runs_out(self):
+        recipe = create_recipe(CustomUser.objects.create_user(username='cook', email='cook@example.com', password='x'))
+        # 3 tokens: a retrieve costs 1, a list 2
+        self.assertEqual(self.get(f'/api/recipes/{recipe.pk}/').status_code, 200)
+        self.assertEqual(self.get('/api/recipes/').status_code, 200)
+        response = self.get('/api/recipes/')
+        self.assertEqual(response.status_code, 429)
+        # 2 tokens missing at 0.01 token per second
+        self.assertEqual(response['Retry-After'], '200')
+
+    def test_buckets_refill(self):
+        store = throttling.get_store()
+        self.assertEqual(store.consume('bucket', 3, 3, 1.0, now=100), (True, 0))
+        self.assertEqual(store.consume('bucket', 2, 3, 1.0, now=101), (False, 1.0))
+        self.assertEqual(store.consume('bucket', 2, 3, 1.0, now=102), (True, 0))
+        # Costs above the capacity take the whole bucket instead of never passing
+        self.assertEqual(store.consume('other', 50, 3, 1.0, now=100), (True, 0))
+
+    def test_busy_worker_sheds_load(self):
+        for _ in range(ADMISSION_CONTROL['MAX_IN_FLIGHT']):
+            self.assertTrue(throttling.in_flight.try_enter(False))
+        try:
+            response = self.get('/api/recipes/')
+        finally:
+            for _ in range(ADMISSION_CONTROL['MAX_IN_FLIGHT']):
+                throttling.in_flight.leave(False)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '7')
+        self.assertEqual(self.get('/api/recipes/').status_code, 200)
+
+    def test_expensive_requests_are_capped_first(self):
+        self.assertEqual(self.get('/api/recipes/?search=soup').status_code, 503)
+        self.assertEqual(self.get('/api/recipes/').status_code, 200)
+        self.assertEqual((throttling.in_flight.total, throttling.in_flight.expensive), (0, 0))
+
+
+@override_settings(ADMISSION_CONTROL={'ENABLED': False}, SECURE_SSL_REDIRECT=False, FACETS={'CHECK_INTERVAL': 0})
+class FacetCountTests(TestCase):
+    """Facet counts from the bitmaps match COUNT() aggregates of the same filters."""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = CustomUser.objects.create_user(username='cook', email='cook@example.com', password='x')
+        times = [(5, None), (10, 4), (10, 5), (20, 10), (25, 35), (45, 15), (90, 30)]
+        for index, (preparation_time, cooking_time) in enumerate(times):
+            for category in ['soup', 'bread', 'dessert'][:index % 3 + 1]:
+                create_recipe(user, title=f'{category} {index}', category=category,
+                              preparation_time=preparation_time, cooking_time=cooking_time)
+
+    def setUp(self):
+        facet_index.generation = facet_index.checked = None
+
+    def expected(self, queryset):
+        categories = dict(queryset.order_by().values_list('category').annotate(Count('pk')))
+        buckets = queryset.aggregate(**{
+            label: Count('pk', filter=Q(total_time__gte=low) & (Q(total_time__lt=high) if high else Q()))
+            for label, low, high in TIME_BUCKETS
+        })
+        return {
+            'category': {name: count for name, count in categories.items()},
+            'total_time': buckets,
+        }
+
+    def assertCounts(self, query):
+        response = APIClient().get('/api/recipes/', {**query, 'facets': 'true'}, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        facets = response.json()['facets']
+        facets['category'] = {name: count for name, count in facets['category'].items() if count}
+        request = Request(APIRequestFactory().get('/api/recipes/', query))
+        queryset = RecipeFilterBackend().filter_queryset(request, Recipe.objects.all(), SimpleNamespace(action='list'))
+        self.assertEqual(facets, self.expected(queryset))
+
+    def test_counts(self):
+        for query in [
+            {},
+            {'category': 'soup'},
+            {'category': 'bread,dessert'},
+            {'min_total_time': '15'},
+            {'max_total_time': '15'},
+            {'min_total_time': '14', 'max_total_time': '30'},
+            {'category': 'soup', 'min_total_time': '30', 'max_total_time': '60'},
+            # Read from the database
+            {'search': 'bread'},
+            {'max_cooking_time': '10'},
+            {'category': 'dessert', 'min_servings': '2'},
+        ]:
+            with self.subTest(query=query):
+                self.assertCounts(query)
+
+    def test_bitmap_filters_read_no_ids(self):
+        backend = RecipeFilterBackend()
+        request = Request(APIRequestFactory().get('/api/recipes/', {'category': 'soup', 'max_total_time': '30'}))
+        selection = backend.facet_selection(request)
+        self.assertEqual(selection, {'categories': ['soup'], 'min_total_time': None, 'max_total_time': 30})
+        facet_index.ensure_fresh()
+        with self.settings(FACETS={'CHECK_INTERVAL': 3600}), self.assertNumQueries(0):
+            facet_counts(Recipe.objects.all(), selection)
+        request = Request(APIRequestFactory().get('/api/recipes/', {'category': 'soup', 'search': 'x'}))
+        self.assertIsNone(backend.facet_selection(request))
+
+
+@override_settings(ADMISSION_CONTROL={'ENABLED': False}, SECURE_SSL_REDIRECT=False)
+class ReviewTests(TestCase):
+    """Review lists of a recipe, and the rating histograms kept by review writes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        users = [CustomUser.objects.create_user(username=f'user{index}', email=f'{index}@example.com')
+                 for index in range(35)]
+        cls.user = users[0]
+        cls.recipe = create_recipe(cls.user)
+        for index, user in enumerate(users[1:]):
+            rating = index % 5 + 1
+            RateAndReview.objects.create(user=user, recipe=cls.recipe, rating=rating)
+            rating_changed(None, (cls.recipe.pk, rating))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f'/api/{self.recipe.pk}/reviews/'
+
+    def get(self, url, status_code=200):
+        response = self.client.get(url, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, status_code)
+        return response.json()
+
+    def assertHistogramMatches(self):
+        counts = dict(RateAndReview.objects.filter(recipe=self.recipe, rating__isnull=False)
+                      .order_by().values_list('rating').annotate(Count('pk')))
+        summary = RatingSummary.objects.get(recipe=self.recipe)
+        self.assertEqual(summary.histogram, {star: counts.get(star, 0) for star in RatingSummary.STARS})
+
+    def test_pagination_and_summary(self):
+        data = self.get(self.url)
+        self.assertEqual((data['count'], len(data['results'])), (34, 30))
+        self.assertEqual(len(self.get(data['next'])['results']), 4)
+        self.assertEqual(data['rating_summary']['count'], 34)
+        self.assertEqual(data['rating_summary']['histogram'], {'1': 7, '2': 7, '3': 7, '4': 7, '5': 6})
+
+    def test_ordering(self):
+        newest = self.get(self.url)['results']
+        self.assertEqual([review['created_date'] for review in newest],
+                         sorted((review['created_date'] for review in newest), reverse=True))
+        ratings = [review['rating'] for review in self.get(f'{self.url}?ordering=rating')['results']]
+        self.assertEqual(ratings, sorted(ratings, reverse=True))
+        self.assertIn('ordering', self.get(f'{self.url}?ordering=oldest', 400))
+
+    def test_rating_filter(self):
+        data = self.get(f'{self.url}?rating=5')
+        self.assertEqual(data['count'], 6)
+        self.assertEqual({review['rating'] for review in data['results']}, {5})
+        for value in ['0', '6', 'five']:
+            self.assertIn('rating', self.get(f'{self.url}?rating={value}', 400))
+
+    def test_writes_keep_the_histogram(self):
+        response = self.client.post('/api/reviews/', {'user': self.user.pk, 'recipe': self.recipe.pk, 'rating': 3},
+                                    format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertHistogramMatches()
+        review = RateAndReview.objects.get(user=self.user)
+        self.assertEqual(self.client.patch(f'/api/reviews/{review.pk}/', {'rating': 1}, format='json').status_code, 200)
+        self.assertHistogramMatches()
+        self.assertEqual(self.client.patch(f'/api/reviews/{review.pk}/', {'rating': None}, format='json').status_code, 200)
+        self.assertHistogramMatches()
+        self.assertEqual(self.client.delete(f'/api/reviews/{review.pk}/').status_code, 204)
+        self.assertHistogramMatches()
+
+    def test_update_takes_out_the_stored_rating(self):
+        # Loaded before a concurrent update changed the rating from 1 to 4
+        review = RateAndReview.objects.filter(recipe=self.recipe, rating=1).first()
+        stale = RateAndReview.objects.get(pk=review.pk)
+        RateAndReview.objects.filter(pk=review.pk).update(rating=4)
+        rating_changed((self.recipe.pk, 1), (self.recipe.pk, 4))
+
+        view = RateAndReviewViewSet()
+        serializer = RateAndReviewSerializer(stale, data={'rating': 2}, partial=True)
+        serializer.is_valid(raise_exception=True)
+        view.perform_update(serializer)
+        self.assertHistogramMatches()
+        view.perform_destroy(stale)
+        view.perform_destroy(stale)
+        self.assertHistogramMatches()
+
+
+@override_settings(ADMISSION_CONTROL={'ENABLED': False}, SECURE_SSL_REDIRECT=False)
+class RateTests(TestCase):
+    """The rate action and review creation upsert the user's review of a recipe."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(username='cook', email='cook@example.com')
+        cls.recipe = create_recipe(cls.user)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def rate(self, **data):
+        return self.client.post(f'/api/recipes/{self.recipe.pk}/rate/', data, format='json')
+
+    def histogram(self):
+        return RatingSummary.objects.get(recipe=self.recipe).histogram
+
+    def test_insert_then_update(self):
+        response = self.rate(rating=4, review='Good')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['rating_summary']['count'], 1)
+        self.assertEqual(self.histogram(), {1: 0, 2: 0, 3: 0, 4: 1, 5: 0})
+
+        response = self.rate(rating=2)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()['review']['rating'], response.json()['review']['review']), (2, 'Good'))
+        self.assertEqual(self.histogram(), {1: 0, 2: 1, 3: 0, 4: 0, 5: 0})
+        self.assertEqual(RateAndReview.objects.count(), 1)
+
+        self.assertEqual(self.rate(rating=6).status_code, 400)
+        self.assertEqual(self.client.post('/api/recipes/0/rate/', {'rating': 3}, format='json').status_code, 404)
+
+    def test_create_of_an_existing_review(self):
+        data = {'user': self.user.pk, 'recipe': self.recipe.pk, 'rating': 5}
+        self.assertEqual(self.client.post('/api/reviews/', data, format='json').status_code, 201)
+        self.assertEqual(self.client.post('/api/reviews/', data, format='json').status_code, 400)
+
+    def test_create_racing_another_one(self):
+        serializer = RateAndReviewSerializer(data={'user': self.user.pk, 'recipe': self.recipe.pk, 'rating': 5})
+        serializer.is_valid(raise_exception=True)
+        # Created by a concurrent request after the validation
+        self.rate(rating=1)
+
+        RateAndReviewViewSet().perform_create(serializer)
+        self.assertEqual(serializer.data['rating'], 5)
+        self.assertEqual(RateAndReview.objects.get().rating, 5)
+        self.assertEqual(self.histogram(), {1: 0, 2: 0, 3: 0, 4: 0, 5: 1})
+
+
+@override_settings(ADMISSION_CONTROL={'ENABLED': False}, SECURE_SSL_REDIRECT=False)
+class HistoryTests(TestCase):
+    """Recipe updates are saved as versions that can be read back."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(username='cook', email='cook@example.com')
+
+    def setUp(self):
+        clear_caches()
+        self.recipe = create_recipe(self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_diff_patch_round_trip(self):
+        pairs = [
+            ('Mix.\nFry.\nServe.\n', 'Mix well.\nFry.\nServe hot.\nEat.'),
+            ('', 'Mix.'),
+            (['200 g flour', '2 eggs', 'milk'], ['2 eggs', 'milk', 'salt']),
+            ([{'name': 'flour', 'quantity': 200}, {'name': 'eggs', 'quantity': 2}],
+             [{'quantity': 2, 'name': 'eggs'}, {'name': 'milk', 'quantity': 0.5}]),
+            (10, 20),
+            (None, 'pictures/a.jpg'),
+            ('Mix.', None),
+        ]
+        for old, new in pairs:
+            with self.subTest(old=old, new=new):
+                self.assertEqual(patch(old, diff(old, new)), new)
+
+        # Unchanged lines are stored as ranges of the old text
+        change = diff('a\nb\nc\n', 'a\nb\nd\n')
+        self.assertEqual(change, {'ops': [[0, 2], {'insert': 'd\n'}]})
+
+    def test_etag_matches(self):
+        current = etag(self.recipe.pk, 3)
+        self.assertTrue(etag_matches(current, self.recipe.pk, 3))
+        self.assertTrue(etag_matches(f'W/{current}', self.recipe.pk, 3))
+        self.assertTrue(etag_matches(f'"other", W/{current}', self.recipe.pk, 3))
+        self.assertTrue(etag_matches('*', self.recipe.pk, 3))
+        self.assertFalse(etag_matches(current, self.recipe.pk, 4))
+        self.assertFalse(etag_matches(current, self.recipe.pk + 1, 3))
+
+    def test_stale_conditional_update(self):
+        first, second = Recipe.objects.get(pk=self.recipe.pk), Recipe.objects.get(pk=self.recipe.pk)
+        self.assertTrue(save_version(first, {'title': 'Crepes'}))
+        self.assertFalse(save_version(first, {'title': 'Crepes'}))
+
+        with self.assertRaises(PreconditionFailed):
+            save_version(second, {'title': 'Waffles'})
+        self.assertEqual(second.version, 1)
+        self.assertEqual(Recipe.objects.values_list('title', 'version').get(pk=self.recipe.pk), ('Crepes', 2))
+        self.assertEqual(list(RecipeRevision.objects.filter(recipe=self.recipe).values_list('version', flat=True)), [1, 2])
+
+    @override_settings(RECIPE_HISTORY={'SNAPSHOT_EVERY': 3})
+    def test_versions_across_snapshot_boundaries(self):
+        recipe = Recipe.objects.get(pk=self.recipe.pk)
+        states = {1: snapshot(recipe)}
+        for step in range(2, 9):
+            save_version(recipe, {
+                'instructions': recipe.instructions + f'\nStep {step}.',
+                'ingredients': recipe.ingredients[1:] + [{'name': f'spice {step}', 'quantity': step}],
+                'cooking_time': recipe.cooking_time + 1,
+            })
+            states[step] = snapshot(recipe)
+
+        snapshots = RecipeRevision.objects.filter(recipe=recipe, snapshot__isnull=False)
+        self.assertEqual(sorted(snapshots.values_list('version', flat=True)), [1, 4, 7])
+        stored = Recipe.objects.get(pk=recipe.pk)
+        for version, state in states.items():
+            with self.subTest(version=version):
+                self.assertEqual(get_version(stored, version), state)
+        with self.assertRaises(NotFound):
+            get_version(stored, 9)
+
+    def test_history_endpoints(self):
+        response = self.client.patch(f'/api/recipes/{self.recipe.pk}/', {'title': 'Crepes'}, format='json',
+                                     HTTP_IF_MATCH=f'W/{etag(self.recipe.pk, 1)}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], etag(self.recipe.pk, 2))
+
+        response = self.client.get(f'/api/recipes/{self.recipe.pk}/history/')
+        self.assertEqual([(item['version'], item['changed_fields']) for item in response.json()['results']],
+                         [(2, ['title']), (1, None)])
+
+        response = self.client.get(f'/api/recipes/{self.recipe.pk}/history/1/')
+        self.assertEqual(response['ETag'], etag(self.recipe.pk, 1))
+        self.assertEqual((response.json()['version'], response.json()['title']), (1, 'Pancakes'))
+        self.assertEqual(self.client.get(f'/api/recipes/{self.recipe.pk}/history/5/').status_code, 404)
+
+    def test_pictures_of_old_versions_stay_referenced(self):
+        recipe = create_recipe(self.user, picture='pictures/a.jpg')
+        save_version(recipe, {'picture': 'pictures/b.jpg'})
+        save_version(recipe, {'picture': 'pictures/c.jpg'})
+
+        # a.jpg is in the snapshot of version 1, b.jpg in the changes of version 2
+        for name in ['pictures/a.jpg', 'pictures/b.jpg', 'pictures/c.jpg']:
+            self.assertTrue(is_referenced(name), name)
+        self.assertFalse(is_referenced('pictures/d.jpg'))
+        self.assertLessEqual({'pictures/a.jpg', 'pictures/b.jpg', 'pictures/c.jpg'}, referenced_names())
+
+        with mock.patch('recipes.deletion.schedule_media_cleanup') as cleanup:
+            delete_recipes(Recipe.objects.filter(pk=recipe.pk))
+        self.assertEqual(set(cleanup.call_args.args[0]), {'pictures/a.jpg', 'pictures/b.jpg', 'pictures/c.jpg'})
+        self.assertFalse(is_referenced('pictures/a.jpg'))
+
+
+@override_settings(ADMISSION_CONTROL={'ENABLED': False}, SECURE_SSL_REDIRECT=False)
+class RecipeUpdateTests(TestCase):
+    """Updates are conditional on the version they were based on and only write what changed."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(username='cook', email='cook@example.com')
+
+    def setUp(self):
+        clear_caches()
+        self.recipe = create_recipe(self.user, description='A long description.')
+        self.url = f'/api/recipes/{self.recipe.pk}/'
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def stored(self):
+        return Recipe.objects.values_list('title', 'version').get(pk=self.recipe.pk)
+
+    def test_patch_with_a_stale_etag(self):
+        stale = etag(self.recipe.pk, 1)
+        self.assertEqual(self.client.patch(self.url, {'title': 'Crepes'}, format='json', HTTP_IF_MATCH=stale).status_code, 200)
+
+        response = self.client.patch(self.url, {'title': 'Waffles'}, format='json', HTTP_IF_MATCH=stale)
+        self.assertEqual(response.status_code, 412)
+        self.assertEqual(self.stored(), ('Crepes', 2))
+        self.assertEqual(RecipeRevision.objects.filter(recipe=self.recipe).count(), 2)
+        self.assertEqual(self.client.delete(self.url, HTTP_IF_MATCH=stale).status_code, 412)
+        self.assertTrue(Recipe.objects.filter(pk=self.recipe.pk).exists())
+
+    def test_patch_racing_another_update(self):
+        def concurrent_update(request, recipe):
+            Recipe.objects.filter(pk=recipe.pk).update(title='Waffles', version=F('version') + 1)
+
+        # The other update lands between reading the recipe and writing it
+        with mock.patch('recipes.views.check_if_match', side_effect=concurrent_update):
+            response = self.client.patch(self.url, {'title': 'Crepes'}, format='json')
+        self.assertEqual(response.status_code, 412)
+        self.assertEqual(self.stored(), ('Waffles', 2))
+        self.assertFalse(RecipeRevision.objects.filter(recipe=self.recipe).exists())
+
+    def test_patch_writes_only_the_changed_fields(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(self.url, {'title': 'Crepes', 'servings': 4}, format='json')
+        self.assertEqual(response.status_code, 200)
+        update, = [query['sql'] for query in queries if query['sql'].startswith('UPDATE "recipes_recipe"')]
+        self.assertIn('"title"', update)
+        self.assertNotIn('"servings"', update)
+        self.assertNotIn('"description"', update)
+        self.assertIn('WHERE ("recipes_recipe"."id" = %s AND "recipes_recipe"."version" = 1)' % self.recipe.pk, update)
+
+
+@override_settings(ADMISSION_CONTROL={'ENABLED': False}, SECURE_SSL_REDIRECT=False)
+class RecipeDeletionTests(TestCase):
+    """delete_recipes removes every row referring to the recipes, and their pictures once unused."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(username='cook', email='cook@example.com')
+        cls.fan = CustomUser.objects.create_user(username='fan', email='fan@example.com')
+
+    def setUp(self):
+        clear_caches()
+
+    def create_with_dependents(self, title):
+        recipe = create_recipe(self.user, title=title, instructions=f'Mix the {title} batter.\nFry it in butter.')
+        index_new_recipe(recipe)
+        rate_recipe(self.fan, recipe.pk, rating=4, review='Good')
+        Favorite.objects.create(user=self.fan, recipe=recipe)
+        save_version(recipe, {'servings': 2})
+        return recipe
+
+    def test_dependents_cover_every_relation(self):
+        covered = {queryset.model for queryset in recipe_dependents([0])}
+        for relation in Recipe._meta.related_objects:
+            with self.subTest(relation=relation.name):
+                self.assertIn(relation.related_model, covered)
+
+    def test_delete_recipes_empties_every_dependent_table(self):
+        recipe = self.create_with_dependents('Pancakes')
+        kept = self.create_with_dependents('Waffles')
+        for queryset in recipe_dependents([recipe.pk]):
+            self.assertTrue(queryset.exists(), queryset.model)
+
+        with mock.patch('recipes.deletion.schedule_media_cleanup'):
+            deleted = delete_recipes(Recipe.objects.filter(pk=recipe.pk))
+        self.assertFalse(Recipe.objects.filter(pk=recipe.pk).exists())
+        for queryset in recipe_dependents([recipe.pk]):
+            self.assertFalse(queryset.exists(), queryset.model)
+        for queryset in recipe_dependents([kept.pk]):
+            self.assertTrue(queryset.exists(), queryset.model)
+        self.assertGreaterEqual(deleted, 1 + len(recipe_dependents([0])))
+        self.assertEqual(delete_recipes(Recipe.objects.filter(pk=recipe.pk)), 0)
+
+    def test_shared_file_is_kept(self):
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            # Identical uploads are stored once, under the hash of their content
+            name = default_storage.save('recipe_pictures/a.jpg', ContentFile(b'picture'))
+            self.assertEqual(default_storage.save('recipe_pictures/b.jpg', ContentFile(b'picture')), name)
+            first = create_recipe(self.user, picture=name)
+            second = create_recipe(self.user, title='Waffles', picture=name)
+
+            # remove_unreferenced runs in a worker thread, which closes its connections
+            with mock.patch('recipes.media.connections'):
+                with mock.patch('recipes.deletion.schedule_media_cleanup') as cleanup:
+                    delete_recipes(Recipe.objects.filter(pk=first.pk))
+                remove_unreferenced(list(cleanup.call_args.args[0]))
+                self.assertTrue(default_storage.exists(name))
+
+                with mock.patch('recipes.deletion.schedule_media_cleanup') as cleanup:
+                    delete_recipes(Recipe.objects.filter(pk=second.pk))
+                remove_unreferenced(list(cleanup.call_args.args[0]))
+                self.assertFalse(default_storage.exists(name))
+
+
+@override_settings(ADMISSION_CONTROL={'ENABLED': False}, SECURE_SSL_REDIRECT=False,
+                   SHOPPING_LIST={'CACHE': 'default', 'TIMEOUT': 600, 'MAX_RECIPES': 3})
+class ShoppingListTests(TestCase):
+    """Shopping lists sum the ingredients of several recipes and are cached per set of recipe versions."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(username='cook', email='cook@example.com')
+        cls.pancakes = create_recipe(cls.user, ingredients=['200 g flour', '2 eggs', '300 ml milk', 'salt'])
+        cls.bread = create_recipe(cls.user, title='Bread', ingredients=['0.9 kg Flour', '1 l water', 'Salt'])
+
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, **params):
+        return self.client.get('/api/shopping-list/', params)
+
+    def test_aggregation(self):
+        response = self.get(recipes=f'{self.pancakes.pk},{self.bread.pk},0')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {
+            'recipes': [self.pancakes.pk, self.bread.pk],
+            'ingredients': [
+                {'name': 'eggs', 'quantity': 2, 'unit': None},
+                {'name': 'flour', 'quantity': 1.1, 'unit': 'kg'},
+                {'name': 'milk', 'quantity': 300, 'unit': 'ml'},
+                {'name': 'salt', 'quantity': None, 'unit': None},
+                {'name': 'water', 'quantity': 1, 'unit': 'l'},
+            ],
+            'not_found': [0],
+        })
+        self.assertEqual(self.get(recipes='1,x').status_code, 400)
+        self.assertEqual(self.get().status_code, 400)
+
+    def test_cached_per_recipe_versions(self):
+        recipe_ids = [self.pancakes.pk, self.bread.pk]
+        first = shopping_list(self.user, recipe_ids)
+        # Only the versions are read on a hit
+        with self.assertNumQueries(1):
+            self.assertEqual(shopping_list(self.user, recipe_ids), first)
+
+        save_version(Recipe.objects.get(pk=self.bread.pk), {'ingredients': ['100 g flour']})
+        flour, = [item for item in shopping_list(self.user, recipe_ids)['ingredients'] if item['name'] == 'flour']
+        self.assertEqual((flour['quantity'], flour['unit']), (300, 'g'))
+
+    def test_recipe_limit(self):
+        recipes = [create_recipe(self.user, title=f'Soup {i}') for i in range(3)]
+        response = self.get(recipes=','.join(str(recipe.pk) for recipe in [self.pancakes, *recipes]))
+        self.assertEqual(response.status_code, 400)
+
+        for recipe in [self.pancakes, self.bread, *recipes]:
+            Favorite.objects.create(user=self.user, recipe=recipe)
+        response = self.get(favorites='true')
+        self.assertEqual(response.status_code, 200)
+        # The most recently favorited ones
+        self.assertEqual(response.json()['recipes'], sorted(recipe.pk for recipe in recipes))
+        self.assertTrue(response.json()['truncated'])
+
+        Favorite.objects.filter(recipe__in=recipes[:2]).delete()
+        response = self.get(favorites='true')
+        self.assertEqual(response.json()['recipes'], [self.pancakes.pk, self.bread.pk, recipes[2].pk])
+        self.assertFalse(response.json()['truncated'])
+
+
+@override_settings(ADMISSION_CONTROL={'ENABLED': False}, SECURE_SSL_REDIRECT=False,
+                   INSTRUMENTATION={'ENABLED': True, 'METRICS_TOKEN': 'scraper-token'})
+class MetricsTests(TestCase):
+    """/metrics/ serves the request histograms to staff users and to scrapers holding the token."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(username='cook', email='cook@example.com')
+        cls.staff = CustomUser.objects.create_user(username='admin', email='admin@example.com', is_staff=True)
+
+    def setUp(self):
+        registry.reset()
+        self.addCleanup(registry.reset)
+        self.client = Client()
+
+    def test_access(self):
+        self.assertEqual(self.client.get('/metrics/').status_code, 403)
+        self.assertEqual(self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer wrong-token').status_code, 403)
+        self.assertEqual(self.client.get('/metrics/', HTTP_AUTHORIZATION='Token scraper-token').status_code, 403)
+        self.assertEqual(self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer scraper-token').status_code, 200)
+
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get('/metrics/').status_code, 403)
+        self.client.force_login(self.staff)
+        self.assertEqual(self.client.get('/metrics/').status_code, 200)
+
+    def test_without_token_only_staff(self):
+        with override_settings(INSTRUMENTATION={'ENABLED': True, 'METRICS_TOKEN': None}):
+            self.assertEqual(self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer None').status_code, 403)
+            self.client.force_login(self.staff)
+            self.assertEqual(self.client.get('/metrics/').status_code, 200)
+
+    def test_disabled(self):
+        self.client.force_login(self.staff)
+        with override_settings(INSTRUMENTATION={'ENABLED': False, 'METRICS_TOKEN': 'scraper-token'}):
+            self.assertEqual(self.client.get('/metrics/').status_code, 404)
+            self.assertEqual(self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer scraper-token').status_code, 404)
+
+    def test_histograms(self):
+        self.assertEqual(self.client.get('/api/recipes/').status_code, 200)
+        response = self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer scraper-token')
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        lines = response.content.decode().splitlines()
+        self.assertIn('# TYPE http_request_duration_seconds histogram', lines)
+        self.assertIn('http_request_duration_seconds_count{route="recipe-list"} 1', lines)
+
+
+@override_settings(ADMISSION_CONTROL={'ENABLED': False}, SECURE_SSL_REDIRECT=False)
+class FieldProjectionTests(TestCase):
+    """?fields=, ?exclude= and ?preset= select the fields of recipe reads."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(username='cook', email='cook@example.com')
+        cls.recipe = create_recipe(cls.user)
+        Favorite.objects.create(user=cls.user, recipe=cls.recipe)
+
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def keys(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        data = response.json()
+        return list((data['results'][0] if 'results' in data else data))
+
+    def error(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 400)
+        return response.json()
+
+    def test_selection(self):
+        card = RecipeSerializer.presets['card']
+        for url in ['/api/recipes/', f'/api/recipes/{self.recipe.pk}/', '/api/FavoriteFeedView/']:
+            with self.subTest(url=url):
+                # In the serializer's order, whatever the order asked for
+                self.assertEqual(self.keys(url, fields='version,title'), ['title', 'version'])
+                self.assertEqual(self.keys(url, preset='card'), card)
+                self.assertEqual(self.keys(url, preset='card', exclude='picture,creator'),
+                                 [name for name in card if name not in ('picture', 'creator')])
+                self.assertEqual(self.keys(url, exclude='instructions'),
+                                 [name for name in RecipeSerializer.Meta.fields if name != 'instructions'])
+                self.assertEqual(self.keys(url, preset='full'), RecipeSerializer.Meta.fields)
+
+    def test_unknown_fields_and_presets(self):
+        url = '/api/recipes/'
+        self.assertEqual(self.error(url, fields='title,secret,owner'), {'fields': ['Unknown field(s): secret, owner.']})
+        self.assertEqual(self.error(url, exclude='secret'), {'exclude': ['Unknown field(s): secret.']})
+        self.assertEqual(self.error(url, preset='tiny'), {'preset': ['Unknown preset. Choose from: card, full.']})
+        self.assertEqual(self.error(url, preset='card', fields='title'), {'fields': ['Use either fields or preset, not both.']})
+        self.assertEqual(self.error(url, fields='title', exclude='title'), {'fields': ['At least one field must be selected.']})
+        # Empty values select everything
+        self.assertEqual(self.keys(url, fields=','), RecipeSerializer.Meta.fields)
+
+    def test_writes_ignore_the_selection(self):
+        response = self.client.patch(f'/api/recipes/{self.recipe.pk}/?fields=nope', {'title': 'Crepes'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.json()['data']), RecipeSerializer.Meta.fields)
+
+    def test_serializer_fields_argument(self):
+        serializer = RecipeSerializer(self.recipe, fields=['title', 'servings', 'secret'])
+        self.assertEqual(serializer.data, {'title': 'Pancakes', 'servings': 4})
+        serializer = RecipeSerializer(self.recipe, fields=['title'], include=['is_favorited'])
+        self.assertEqual(list(serializer.fields), ['title', 'is_favorited'])
+
+    def test_retrieve_reads_only_the_selected_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.keys(f'/api/recipes/{self.recipe.pk}/', fields='title', include='is_favorited')
+        select, = [query['sql'] for query in queries if 'FROM "recipes_recipe"' in query['sql']]
+        self.assertIn('"recipes_recipe"."title"', select)
+        self.assertNotIn('"recipes_recipe"."instructions"', select)
+        self.assertNotIn('"recipes_recipe"."ingredients"', select)
+
+
+@override_settings(RESPONSE_COMPRESSION={'MIN_SIZE': 1024, 'BROTLI_QUALITY': 5})
+class CompressionTests(TestCase):
+    """CompressionMiddleware negotiates brotli or gzip for responses worth compressing."""
+
+    body = b'{"title": "Pancakes", "instructions": "Mix and fry."}' * 100
+
+    def compress(self, accept_encoding=None, body=None, **headers):
+        response = HttpResponse(self.body if body is None else body, content_type='application/json')
+        response.headers['ETag'] = '"recipe-1-v1"'
+        for name, value in headers.items():
+            response.headers[name] = value
+        request = RequestFactory().get('/api/recipes/', HTTP_ACCEPT_ENCODING=accept_encoding or '')
+        if accept_encoding is None:
+            del request.META['HTTP_ACCEPT_ENCODING']
+        return CompressionMiddleware(lambda request: response)(request)
+
+    def assertUncompressed(self, response, body=None):
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response.content, self.body if body is None else body)
+        self.assertEqual(response['ETag'], '"recipe-1-v1"')
+
+    def test_gzip(self):
+        accept_encoding = 'gzip, deflate' if brotli is None else 'gzip, br;q=0'
+        response = self.compress(accept_encoding)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), self.body)
+        self.assertEqual(response['Content-Length'], str(len(response.content)))
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        # The compressed bytes differ from the identity ones the strong ETag named
+        self.assertEqual(response['ETag'], 'W/"recipe-1-v1"')
+        self.assertEqual(self.compress('GZIP;q=1, br;q=0')['Content-Encoding'], 'gzip')
+
+    @skipUnless(brotli is not None, 'brotli is not installed')
+    def test_brotli_preferred(self):
+        for accept_encoding in ['gzip, br', 'br;q=0.5, gzip;q=1', '*']:
+            with self.subTest(accept_encoding=accept_encoding):
+                response = self.compress(accept_encoding)
+                self.assertEqual(response['Content-Encoding'], 'br')
+                self.assertEqual(brotli.decompress(response.content), self.body)
+                self.assertEqual(response['Content-Length'], str(len(response.content)))
+                self.assertEqual(response['Vary'], 'Accept-Encoding')
+                self.assertEqual(response['ETag'], 'W/"recipe-1-v1"')
+                self.assertTrue(response['X-Compression-Padding'])
+
+    @skipUnless(brotli is None, 'brotli is installed')
+    def test_brotli_missing(self):
+        self.assertEqual(self.compress('br').get('Content-Encoding'), None)
+        self.assertEqual(self.compress('br, gzip')['Content-Encoding'], 'gzip')
+        self.assertEqual(self.compress('*')['Content-Encoding'], 'gzip')
+
+    def test_not_accepted(self):
+        for accept_encoding in [None, 'identity', 'gzip;q=0', 'deflate', 'gzip;q=oops', '*;q=0']:
+            with self.subTest(accept_encoding=accept_encoding):
+                response = self.compress(accept_encoding)
+                self.assertUncompressed(response)
+                self.assertEqual(response['Vary'], 'Accept-Encoding')
+
+    def test_min_size(self):
+        small = self.body[:1023]
+        self.assertUncompressed(self.compress('gzip, br', body=small), small)
+        self.assertEqual(self.compress('gzip', body=self.body[:1024])['Content-Encoding'], 'gzip')
+        with override_settings(RESPONSE_COMPRESSION={'MIN_SIZE': 100}):
+            self.assertEqual(self.compress('gzip', body=small)['Content-Encoding'], 'gzip')
+
+    def test_skipped_responses(self):
+        self.assertUncompressed(self.compress('gzip', **{'Content-Type': 'image/png'}))
+        self.assertEqual(self.compress('gzip', **{'Content-Type': 'image/svg+xml'})['Content-Encoding'], 'gzip')
+        response = self.compress('gzip', **{'Content-Encoding': 'identity'})
+        self.assertEqual((response['Content-Encoding'], response.content), ('identity', self.body))
+
+    def test_accepted_encodings(self):
+        self.assertEqual(CompressionMiddleware.accepted_encodings('GZIP;q=0.5, br , deflate;q=x,,'),
+                         {'gzip': 0.5, 'br': 1.0, 'deflate': 0.0})
+        self.assertEqual(CompressionMiddleware.accepted_encodings('*;q=0.2, gzip'),
+                         {'*': 0.2, 'gzip': 1.0, 'br': 0.2})
+        self.assertEqual(CompressionMiddleware.accepted_encodings(''), {})
+
+    @override_settings(ADMISSION_CONTROL={'ENABLED': False}, SECURE_SSL_REDIRECT=False)
+    def test_api_response(self):
+        user = CustomUser.objects.create_user(username='cook', email='cook@example.com')
+        for i in range(20):
+            create_recipe(user, title=f'Pancakes {i}')
+        clear_caches()
+        client = Client()
+        plain = client.get('/api/recipes/')
+        response = client.get('/api/recipes/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(response.content), plain.content)
@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import RecipeViewSet, RateAndReviewViewSet, RecipeAndReviewsListView, AddToFavoritesView, RemoveFromFavoritesView, FollowingFeedView, FavoriteFeedView
+from .views import RecipeViewSet, RateAndReviewViewSet, RecipeAndReviewsListView, AddToFavoritesView, RemoveFromFavoritesView, FavoriteBatchView, ShoppingListView, FollowingFeedView, FavoriteFeedView
 
 router = DefaultRouter()
 router.register(r'recipes', RecipeViewSet)
@@ -11,6 +11,8 @@ urlpatterns = [
     path('<int:recipe_id>/reviews/', RecipeAndReviewsListView.as_view(), name='recipe-reviews'),
     path('<int:pk>/favorite/', AddToFavoritesView.as_view(), name='favourite'),
     path('<int:pk>/undo favorite/', RemoveFromFavoritesView.as_view(), name='undo favourite'),
+    path('favorites/batch/', FavoriteBatchView.as_view(), name='favorites-batch'),
+    path('shopping-list/', ShoppingListView.as_view(), name='shopping-list'),
     path('FollowingFeedView/', FollowingFeedView.as_view(), name='FollowingFeedView'),
     path('FavoriteFeedView/', FavoriteFeedView.as_view(), name='FavoriteFeed'),
 ]
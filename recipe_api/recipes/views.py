@@ -1,16 +1,30 @@
+from django.http import Http404
 from django.shortcuts import render, get_object_or_404
-from rest_framework import viewsets
-from .models import Recipe, RateAndReview, Favorite
-from .serializers import RecipeSerializer, RateAndReviewSerializer, FavoriteSerializer
+from rest_framework import serializers, viewsets
+from rest_framework.decorators import action
+from .models import Recipe, RecipeRevision, RateAndReview, RatingSummary, Favorite
+from .serializers import RecipeSerializer, RateAndReviewSerializer, FavoriteSerializer, FavoriteBatchSerializer, RecipeRatingSerializer, RecipeRevisionSerializer, FastRecipeSerializer, FastRateAndReviewSerializer
+from recipe_api.fast_serializers import FastListMixin
+from .projections import FieldProjectionMixin
+from .personalization import PersonalFieldsMixin
+from . import cache as recipe_cache
+from .dedup import index_new_recipe, index_recipe
+from .deletion import delete_recipes
+from .facets import facet_counts, recipe_saved
+from .filters import RecipeFilterBackend
+from .ingredients import scaled_ingredients
+from .shopping import get_setting as get_shopping_setting, shopping_list
+from .history import TRACKED_FIELDS, check_if_match, etag, etag_matches, get_version, record_revision, save_version
+from .ratings import RatingSummaryMixin, get_summary, rate_recipe, summary_data
 from rest_framework import permissions
-from .paginations import RecipePagination, RateAndReviewPagination, FollowingFeedPagination, FavoriteFeedPagination
-from rest_framework.exceptions import PermissionDenied
-from django.db.models import Q
+from .paginations import RecipePagination, RateAndReviewPagination, FollowingFeedPagination, FavoriteFeedPagination, RecipeHistoryPagination
+from rest_framework.exceptions import PermissionDenied, ValidationError
+from django.db import transaction
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework import generics
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(PersonalFieldsMixin, FieldProjectionMixin, FastListMixin, viewsets.ModelViewSet):
     """
     ViewSet for handling Recipe-related CRUD operations.
 
@@ -20,108 +34,281 @@ class RecipeViewSet(viewsets.ModelViewSet):
     - Create, update, or delete recipes (only for authenticated users)
     
     Additionally, it supports searching recipes based on various fields and filtering
-    results based on cooking time, servings, or preparation time.
+    results by category and by preparation, cooking, total time or servings
+    ranges (see recipes/filters.py). Read requests accept
+    ?fields=, ?exclude= and ?preset= to trim the returned fields, and
+    ?include=is_favorited,my_rating to add the current user's favorite and rating.
+    Lists accept ?facets=true to add facet counts for the matching recipes.
     """
     queryset = Recipe.objects.all()
     serializer_class = RecipeSerializer
+    fast_serializer_class = FastRecipeSerializer
     pagination_class = RecipePagination
+    filter_backends = [RecipeFilterBackend]
 
     def get_permissions(self):
         """
         Determine the permissions required for each action.
 
-        - 'list' and 'retrieve' actions are publicly accessible.
+        - 'list', 'retrieve' and the history actions are publicly accessible.
         - All other actions (create, update, delete) require the user to be authenticated.
         """
-        if self.action in ['list', 'retrieve']:
+        if self.action in ['list', 'retrieve', 'history', 'history_version']:
             permission_classes = [permissions.AllowAny]
         else:
             permission_classes = [permissions.IsAuthenticated]
         return [permission() for permission in permission_classes]
 
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Handle the retrieval of a recipe. The response carries the recipe's
+        version as its ETag, and a request whose If-None-Match names the current
+        version gets a 304 after reading only the version column.
+
+        ?servings=N adds the ingredients scaled to N servings as scaled_ingredients.
+        Requests without ?include= are served from the recipe cache.
+        """
+        servings = self.get_servings()
+        personal = bool(self.get_includes())
+        if not personal and recipe_cache.enabled():
+            return self.retrieve_cached(request, kwargs['pk'], servings)
+
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match and str(kwargs['pk']).isdigit():
+            version = Recipe.objects.filter(pk=kwargs['pk']).values_list('version', flat=True).first()
+            if version is not None and etag_matches(if_none_match, kwargs['pk'], version):
+                return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag(kwargs['pk'], version)})
+
+        instance = self.get_object()
+        serializer = self.get_serializer(instance)
+        data = serializer.data
+        if servings is not None:
+            data['scaled_servings'] = servings
+            data['scaled_ingredients'] = scaled_ingredients(instance, servings)
+        response = Response(data)
+        if not personal:
+            response['ETag'] = etag(instance.pk, instance.version)
+        return response
+
+    def retrieve_cached(self, request, pk, servings):
+        """
+        Retrieve a recipe without per-user fields from the recipe cache (see
+        recipes/cache.py), which also holds its full serialized form; ?fields=
+        and friends pick from that.
+        """
+        instance = recipe_cache.get_recipe(pk)
+        if instance is None:
+            raise Http404
+        self.check_object_permissions(request, instance)
+        headers = {'ETag': etag(instance.pk, instance.version)}
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match and etag_matches(if_none_match, instance.pk, instance.version):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        data = recipe_cache.get_representation(
+            instance, request.build_absolute_uri('/'),
+            lambda: self.get_serializer_class()(instance, context=self.get_serializer_context()).data,
+        )
+        fields = self.get_projected_fields()
+        data = {name: data[name] for name in fields} if fields is not None else dict(data)
+        if servings is not None:
+            data['scaled_servings'] = servings
+            data['scaled_ingredients'] = scaled_ingredients(instance, servings)
+        return Response(data, headers=headers)
+
+    def get_servings(self):
+        """Return the validated ?servings= of a retrieve, or None when not given."""
+        value = self.request.query_params.get('servings')
+        if value in (None, ''):
+            return None
+        try:
+            return serializers.IntegerField(min_value=1, max_value=1000).run_validation(value)
+        except serializers.ValidationError as e:
+            raise ValidationError({'servings': e.detail})
+
     def create(self, request, *args, **kwargs):
         """
-        Handle the creation of a new recipe.
+        Handle the creation of a new recipe. The response lists existing
+        recipes that are likely duplicates of it under possible_duplicates.
         """
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        self.perform_create(serializer)
+        duplicates = self.perform_create(serializer)
         headers = self.get_success_headers(serializer.data)
-        return Response({"message": "Recipe created successfully!", "data": serializer.data}, 
+        return Response({"message": "Recipe created successfully!", "data": serializer.data,
+                         "possible_duplicates": [
+                             {"id": pk, "title": title, "similarity": round(score, 2)} for pk, title, score in duplicates
+                         ]},
                         status=status.HTTP_201_CREATED, headers=headers)
 
     def update(self, request, *args, **kwargs):
         """
-        Handle the update of an existing recipe.
+        Handle the update of an existing recipe. PATCH requests only validate
+        and write the fields they send.
         """
+        partial = kwargs.pop('partial', False)
         instance = self.get_object()
-        if instance.creator != request.user:
+        if instance.creator_id != request.user.pk:
             raise PermissionDenied("You do not have permission to edit this recipe.")
+        check_if_match(request, instance)
         
-        serializer = self.get_serializer(instance, data=request.data)
+        serializer = self.get_serializer(instance, data=request.data, partial=partial)
         serializer.is_valid(raise_exception=True)
         self.perform_update(serializer)
         return Response({"message": "Recipe updated successfully!", "data": serializer.data},
-                        status=status.HTTP_200_OK)
+                        status=status.HTTP_200_OK, headers={'ETag': etag(instance.pk, instance.version)})
 
     def destroy(self, request, *args, **kwargs):
         """
         Handle the deletion of a recipe.
         """
         instance = self.get_object()
-        if instance.creator != request.user:
+        if instance.creator_id != request.user.pk:
             raise PermissionDenied('You do not have permission to delete this recipe')
+        check_if_match(request, instance)
         
         self.perform_destroy(instance)
         return Response({"message": "Recipe deleted successfully!"}, status=status.HTTP_204_NO_CONTENT)
 
-    def get_queryset(self):
+    def list(self, request, *args, **kwargs):
         """
-        Customize the queryset to support searching and filtering.
+        Handle the listing of recipes. With ?facets=true the response also holds
+        the number of matching recipes per category and total time bucket.
         """
-        queryset = super().get_queryset()
+        response = super().list(request, *args, **kwargs)
+        if request.query_params.get('facets') in ('true', '1'):
+            response.data['facets'] = facet_counts(
+                self.filter_queryset(self.get_queryset()), RecipeFilterBackend().facet_selection(request))
+        return response
+
+    def perform_create(self, serializer):
+        """Save the recipe and return its likely duplicates, see recipes/dedup.py."""
+        with transaction.atomic():
+            recipe = serializer.save()
+            record_revision(recipe, None)
+            recipe_saved(recipe)
+            return index_new_recipe(recipe)
+
+    def perform_update(self, serializer):
+        """
+        Write the changed fields as the recipe's next version with a conditional
+        UPDATE, answering 412 Precondition Failed when a concurrent update
+        saved a newer version since the recipe was read.
+        """
+        if save_version(serializer.instance, serializer.validated_data):
+            recipe_saved(serializer.instance)
+            recipe_cache.recipe_saved(serializer.instance)
+            if {'ingredients', 'instructions'} & set(serializer.validated_data):
+                index_recipe(serializer.instance)
 
-        # Search functionality
-        search = self.request.query_params.get('search', None)
-        if search:
-            queryset = queryset.filter(
-                Q(title__icontains=search) | 
-                Q(category__icontains=search) | 
-                Q(ingredients__icontains=search)
-            )
+    def perform_destroy(self, instance):
+        """
+        Delete the recipe, its reviews and favorites with one statement per table
+        instead of loading every dependent row. The picture is removed after commit.
+        """
+        delete_recipes(Recipe.objects.filter(pk=instance.pk))
 
-        # Optional filters
-        cooking_time = self.request.query_params.get('cooking_time', None)
-        if cooking_time:
-            queryset = queryset.filter(cooking_time__lte=cooking_time)
+    @action(detail=True, methods=['get'], pagination_class=RecipeHistoryPagination)
+    def history(self, request, pk=None):
+        """
+        List the versions of the recipe, newest first, with the fields each one changed.
+        """
+        recipe = generics.get_object_or_404(Recipe.objects.only('pk'), pk=pk)
+        revisions = (RecipeRevision.objects.filter(recipe=recipe).only('version', 'created_date', 'changes')
+                     .order_by('-version'))
+        page = self.paginate_queryset(revisions)
+        return self.get_paginated_response(RecipeRevisionSerializer(page, many=True).data)
+
+    @action(detail=True, methods=['get'], url_path=r'history/(?P<version>\d+)', url_name='history-version')
+    def history_version(self, request, pk=None, version=None):
+        """
+        Return the recipe's fields as they were at the given version.
+        """
+        recipe = generics.get_object_or_404(Recipe.objects.only(*TRACKED_FIELDS, 'version'), pk=pk)
+        version = int(version)
+        state = get_version(recipe, version)
+        if state['picture']:
+            state['picture'] = request.build_absolute_uri(Recipe._meta.get_field('picture').storage.url(state['picture']))
+        return Response({'version': version, **state}, headers={'ETag': etag(recipe.pk, version)})
+
+    @action(detail=True, methods=['post'], serializer_class=RecipeRatingSerializer)
+    def rate(self, request, pk=None):
+        """
+        Rate (and optionally review) the recipe as the current user. Rating the
+        same recipe again updates the existing review in place, so the request
+        can safely be repeated. Returns the review and the recipe's new rating summary.
+        """
+        recipe = generics.get_object_or_404(Recipe.objects.only('pk'), pk=pk)
+        serializer = RecipeRatingSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
 
-        servings = self.request.query_params.get('servings', None)
-        if servings:
-            queryset = queryset.filter(servings__gte=servings)
+        review, summary, created = rate_recipe(request.user, recipe.pk, **serializer.validated_data)
+        return Response({
+            'review': RateAndReviewSerializer(review).data,
+            'rating_summary': summary_data(summary),
+        }, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
 
-        preparation_time = self.request.query_params.get('preparation_time', None)
-        if preparation_time:
-            queryset = queryset.filter(preparation_time__lte=preparation_time)
+    def get_queryset(self):
+        """
+        Customize the queryset of single recipe reads. Searching and filtering
+        of the list are done by RecipeFilterBackend.
+        """
+        queryset = super().get_queryset()
+
+        # Only read the columns of the requested fields
+        if self.action == 'retrieve':
+            required = ['version']
+            if self.get_servings() is not None:
+                required += ['servings', 'ingredients', 'parsed_ingredients']
+            queryset = self.annotate_includes(self.project_queryset(queryset, *required))
 
         return queryset
     
-class RecipeAndReviewsListView(generics.ListCreateAPIView):
+class RecipeAndReviewsListView(RatingSummaryMixin, FastListMixin, generics.ListCreateAPIView):
     """
         The viewset for handling the retrieval of reviews for a specific recipe.
+
+        Reviews are paginated and ordered with ?ordering=newest (default) or
+        ?ordering=rating (highest first), and ?rating=N keeps the reviews with
+        N stars. The response carries the recipe's rating histogram.
     """
     serializer_class = RateAndReviewSerializer
+    fast_serializer_class = FastRateAndReviewSerializer
+    pagination_class = RateAndReviewPagination
+
+    orderings = {
+        'newest': ('-created_date', '-id'),
+        'rating': ('-rating', '-created_date', '-id'),
+    }
 
     def get_queryset(self):
         """
         This method retrieves the list of reviews for a specific recipe based on the 'recipe_id'
-        from the URL.
+        from the URL, filtered and ordered along the (recipe, created_date) and
+        (recipe, rating, created_date) indexes.
         """
         
         recipe_id = self.kwargs['recipe_id']
-        return RateAndReview.objects.filter(recipe_id=recipe_id)
+        queryset = RateAndReview.objects.filter(recipe_id=recipe_id)
+
+        rating = self.request.query_params.get('rating')
+        if rating:
+            if rating not in {str(star) for star in RatingSummary.STARS}:
+                raise ValidationError({'rating': ['Must be a whole number from 1 to 5.']})
+            queryset = queryset.filter(rating=int(rating))
 
+        ordering = self.request.query_params.get('ordering', 'newest')
+        if ordering not in self.orderings:
+            raise ValidationError({'ordering': [f'Choose from: {", ".join(self.orderings)}.']})
+        return queryset.order_by(*self.orderings[ordering])
 
-class RateAndReviewViewSet(viewsets.ModelViewSet):
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        response.data['rating_summary'] = summary_data(get_summary(self.kwargs['recipe_id']))
+        return response
+
+
+class RateAndReviewViewSet(RatingSummaryMixin, FastListMixin, viewsets.ModelViewSet):
     """
     Viewset for handling Rating and Reviewing related CRUD operations.
 
@@ -133,6 +320,7 @@ class RateAndReviewViewSet(viewsets.ModelViewSet):
     """
     queryset = RateAndReview.objects.all()
     serializer_class = RateAndReviewSerializer
+    fast_serializer_class = FastRateAndReviewSerializer
     permission_classes = [permissions.IsAuthenticated]
     pagination_class = RateAndReviewPagination
     
@@ -188,11 +376,94 @@ class RemoveFromFavoritesView(generics.GenericAPIView):
 
         return Response({'message': 'Removed recipe from favorites'}, status=status.HTTP_200_OK)
     
-class FollowingFeedView(generics.GenericAPIView):
+class FavoriteBatchView(generics.GenericAPIView):
+    """
+    View for adding and removing many favorites in one request, e.g. when a
+    client syncs favorites changed offline.
+
+    Expects {"add": [recipe ids], "remove": [recipe ids]} and answers with the
+    outcome per recipe id. Repeating a batch is harmless: already favorited or
+    already removed recipes are reported as such instead of failing the batch.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    serializer_class = FavoriteBatchSerializer
+
+    def post(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        add = list(dict.fromkeys(serializer.validated_data['add']))
+        remove = list(dict.fromkeys(serializer.validated_data['remove']))
+        recipe_ids = add + remove
+
+        with transaction.atomic():
+            existing = set(Recipe.objects.filter(pk__in=recipe_ids).values_list('pk', flat=True))
+            favorited = set(Favorite.objects.filter(user=request.user, recipe_id__in=recipe_ids)
+                            .values_list('recipe_id', flat=True))
+
+            to_add = [pk for pk in add if pk in existing and pk not in favorited]
+            to_remove = [pk for pk in remove if pk in favorited]
+            if to_add:
+                Favorite.objects.bulk_create(
+                    [Favorite(user=request.user, recipe_id=pk) for pk in to_add], ignore_conflicts=True)
+            if to_remove:
+                Favorite.objects.filter(user=request.user, recipe_id__in=to_remove).delete()
+
+        changed = set(to_add) | set(to_remove)
+
+        def outcome(pk, done, unchanged):
+            if pk not in existing:
+                return 'not_found'
+            return done if pk in changed else unchanged
+
+        return Response({
+            'add': {pk: outcome(pk, 'added', 'already_favorited') for pk in add},
+            'remove': {pk: outcome(pk, 'removed', 'not_favorited') for pk in remove},
+        }, status=status.HTTP_200_OK)
+
+class ShoppingListView(generics.GenericAPIView):
+    """
+    View returning one merged shopping list for several recipes.
+
+    ?recipes=1,2,3 selects the recipes, ?favorites=true the current user's
+    favorites, at most SHOPPING_LIST['MAX_RECIPES'] of either. Amounts of the same ingredient are summed across the
+    recipes in g, ml or pieces; recipes that do not exist are listed under
+    not_found.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_recipe_ids(self):
+        """Return the requested recipe ids, or None for all favorites."""
+        params = self.request.query_params
+        if params.get('favorites') in ('true', '1'):
+            return None
+        value = params.get('recipes')
+        if not value:
+            raise ValidationError({'recipes': ['Give recipe ids, e.g. ?recipes=1,2, or ?favorites=true.']})
+        try:
+            recipe_ids = list(dict.fromkeys(int(item) for item in value.split(',') if item.strip()))
+        except ValueError:
+            raise ValidationError({'recipes': ['Recipe ids must be integers.']})
+        max_recipes = get_shopping_setting('MAX_RECIPES')
+        if len(recipe_ids) > max_recipes:
+            raise ValidationError({'recipes': [f'Give at most {max_recipes} recipes.']})
+        return recipe_ids
+
+    def get(self, request):
+        recipe_ids = self.get_recipe_ids()
+        result = shopping_list(request.user, recipe_ids)
+        data = dict(result)
+        if recipe_ids is not None:
+            found = set(result['recipes'])
+            data['not_found'] = [pk for pk in recipe_ids if pk not in found]
+        return Response(data)
+
+class FollowingFeedView(PersonalFieldsMixin, FieldProjectionMixin, generics.GenericAPIView):
     """
         A view for handling the retrieval of recipes created by the followed users.
     """
     permission_classes = [permissions.IsAuthenticated]
+    serializer_class = RecipeSerializer
+    fast_serializer_class = FastRecipeSerializer
     pagination_class = FollowingFeedPagination
 
     def get(self, request):
@@ -202,17 +473,19 @@ class FollowingFeedView(generics.GenericAPIView):
         #Filter recipes from followed users
         recipes = Recipe.objects.filter(creator__in=following_users).order_by('-updated_date')
         
-        # Paginate the queryset
-        page = self.paginate_queryset(recipes)
+        # Paginate the queryset, reading only the requested columns
+        page = self.paginate_queryset(self.get_fast_rows(recipes))
         if page is not None:
-            serializer = RecipeSerializer(page, many=True)
+            serializer = FastRecipeSerializer(page, fields=self.get_projected_fields(), extra=self.get_includes())
             return self.get_paginated_response(serializer.data)
 
-class FavoriteFeedView(generics.GenericAPIView):
+class FavoriteFeedView(PersonalFieldsMixin, FieldProjectionMixin, generics.GenericAPIView):
     """
         A view for handling the retrieval of recipes a current user has added to favorites.
     """
     permission_classes = [permissions.IsAuthenticated]
+    serializer_class = RecipeSerializer
+    fast_serializer_class = FastRecipeSerializer
     pagination_class = FavoriteFeedPagination
 
     def get(self, request):
@@ -222,10 +495,10 @@ class FavoriteFeedView(generics.GenericAPIView):
         # Filter recipes that the user has favorited
         recipes = Recipe.objects.filter(id__in=favorite_recipes).order_by('-updated_date')
 
-        # Paginate the queryset
-        page = self.paginate_queryset(recipes)
+        # Paginate the queryset, reading only the requested columns
+        page = self.paginate_queryset(self.get_fast_rows(recipes))
         if page is not None:
-            serializer = RecipeSerializer(page, many=True)
+            serializer = FastRecipeSerializer(page, fields=self.get_projected_fields(), extra=self.get_includes())
             return self.get_paginated_response(serializer.data)
 
 